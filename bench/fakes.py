@@ -0,0 +1,238 @@
+"""
+Local stand-ins for the backends of the FinOps Hub MCP server: an
+OpenAI-compatible embeddings and chat endpoint, the Kusto query endpoint,
+Azure Monitor metrics and Azure Resource Graph. All of them are served by one
+aiohttp application, so the benchmark runs without network access.
+
+Run standalone with `python bench/fakes.py --port 8700`; the selected port is
+printed on the first line of the output once the server is listening.
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import re
+import numpy as np
+from aiohttp import web
+
+COSTS_COLUMNS = [
+    ("ChargePeriodStart", "datetime"),
+    ("SubAccountName", "string"),
+    ("ResourceId", "string"),
+    ("ServiceName", "string"),
+    ("BilledCost", "real"),
+    ("EffectiveCost", "real"),
+]
+SERVICES = ["Virtual Machines", "Storage", "Azure Data Explorer", "Azure Cosmos DB", "Bandwidth", "Azure Monitor"]
+
+
+def fake_vector(text: str, dim: int) -> list[float]:
+    """
+    Deterministic unit vector for a text, standing in for a real embedding.
+    """
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def costs_rows(count: int) -> list[list]:
+    rng = np.random.default_rng(count)
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    costs = rng.gamma(2.0, 20.0, count).round(4)
+    return [
+        [
+            (start + datetime.timedelta(hours=i % 720)).isoformat().replace("+00:00", "Z"),
+            f"subscription-{i % 7}",
+            f"/subscriptions/sub-{i % 7}/resourceGroups/rg-{i % 13}/providers/Microsoft.Compute/virtualMachines/vm-{i % 97}",
+            SERVICES[i % len(SERVICES)],
+            float(costs[i]),
+            float(costs[i] * 0.8),
+        ]
+        for i in range(count)
+    ]
+
+
+class FakeBackends:
+    """
+    aiohttp application serving all fake endpoints.
+    """
+
+    def __init__(self, rows: int = 1000, embedding_dim: int = 256, openai_latency: float = 0.05,
+                 kusto_latency: float = 0.02, arm_latency: float = 0.05, recommendations: int = 50,
+                 metric_points: int = 720):
+        self.rows = rows
+        self.embedding_dim = embedding_dim
+        self.openai_latency = openai_latency
+        self.kusto_latency = kusto_latency
+        self.arm_latency = arm_latency
+        self.recommendations = recommendations
+        self.metric_points = metric_points
+        self._results: dict[int, bytes] = {}
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/openai/deployments/{deployment}/embeddings", self.embeddings)
+        app.router.add_post("/openai/deployments/{deployment}/chat/completions", self.chat)
+        app.router.add_post("/v2/rest/query", self.kusto_query)
+        app.router.add_post("/v1/rest/mgmt", self.kusto_query)
+        app.router.add_get("/{resource:.+}/providers/Microsoft.Insights/metrics", self.metrics)
+        app.router.add_post("/providers/Microsoft.ResourceGraph/resources", self.resources)
+        return app
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(self.openai_latency)
+        return web.json_response({
+            "object": "list",
+            "model": request.match_info["deployment"],
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_vector(t, self.embedding_dim)}
+                for i, t in enumerate(texts)
+            ],
+            "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)},
+        })
+
+    async def chat(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        await asyncio.sleep(self.openai_latency)
+        content = body["messages"][-1]["content"]
+        text = content if isinstance(content, str) else " ".join(c.get("text", "") for c in content)
+        return web.json_response({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": 0,
+            "model": request.match_info["deployment"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": f"Explains a query of {len(text)} characters."},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+    async def kusto_query(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        query = body.get("csl", "")
+        await asyncio.sleep(self.kusto_latency)
+
+        if "LastIngestion" in query:
+            return web.json_response(self._frames([("LastIngestion", "datetime")], [["2024-01-31T00:00:00Z"]]))
+
+        take = re.search(r"\b(?:take|limit|top)\s+(\d+)", query)
+        count = int(take.group(1)) if take else self.rows
+        # results are serialized once per size, so the stub is not the bottleneck
+        if count not in self._results:
+            self._results[count] = json.dumps(self._frames(COSTS_COLUMNS, costs_rows(count))).encode("utf-8")
+        return web.Response(body=self._results[count], content_type="application/json")
+
+    @staticmethod
+    def _frames(columns: list[tuple[str, str]], rows: list[list]) -> list[dict]:
+        return [
+            {"FrameType": "DataSetHeader", "IsProgressive": False, "Version": "v2.0"},
+            {
+                "FrameType": "DataTable", "TableId": 1, "TableKind": "PrimaryResult", "TableName": "PrimaryResult",
+                "Columns": [{"ColumnName": n, "ColumnType": t} for n, t in columns],
+                "Rows": rows,
+            },
+            {"FrameType": "DataSetCompletion", "HasErrors": False, "Cancelled": False},
+        ]
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.arm_latency)
+        resource = "/" + request.match_info["resource"]
+        aggregation = request.query.get("aggregation", "Maximum")
+        field = aggregation[0].lower() + aggregation[1:]
+        rng = np.random.default_rng(len(resource))
+        values = np.clip(rng.gamma(2.0, 8.0, self.metric_points), 0, 100).round(2)
+        start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        return web.json_response({
+            "cost": 0,
+            "timespan": request.query.get("timespan"),
+            "interval": request.query.get("interval"),
+            "value": [{
+                "id": f"{resource}/providers/Microsoft.Insights/metrics/Percentage CPU",
+                "type": "Microsoft.Insights/metrics",
+                "name": {"value": request.query.get("metricnames"), "localizedValue": request.query.get("metricnames")},
+                "unit": "Percent",
+                "timeseries": [{
+                    "metadatavalues": [],
+                    "data": [
+                        {"timeStamp": (start + datetime.timedelta(hours=i)).isoformat().replace("+00:00", "Z"), field: float(v)}
+                        for i, v in enumerate(values)
+                    ],
+                }],
+            }],
+        })
+
+    async def resources(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        await asyncio.sleep(self.arm_latency)
+        subscriptions = body.get("subscriptions") or ["sub-mg-0", "sub-mg-1"]
+        options = body.get("options") or {}
+        skip = int(options.get("$skipToken") or 0)
+        top = int(options.get("$top") or 1000)
+
+        total = len(subscriptions) * self.recommendations
+        rows = []
+        for n in range(skip, min(skip + top, total)):
+            subscription = subscriptions[n // self.recommendations]
+            i = n % self.recommendations
+            rows.append({
+                "id": f"/subscriptions/{subscription}/resourceGroups/rg-{i % 5}/providers/Microsoft.Compute/virtualMachines/vm-{i}"
+                      f"/providers/Microsoft.Advisor/recommendations/{i}",
+                "subscriptionId": subscription,
+                "resourceGroup": f"rg-{i % 5}",
+                "resourceName": f"vm-{i}",
+                "type": "microsoft.advisor/recommendations",
+                "properties": {
+                    "category": "Cost",
+                    "impact": "High" if i % 3 == 0 else "Medium",
+                    "shortDescription": {"problem": "Right-size or shutdown underutilized virtual machines",
+                                         "solution": "Right-size or shutdown underutilized virtual machines"},
+                    "extendedProperties": {"currentSku": "Standard_D8s_v5", "targetSku": "Standard_D4s_v5",
+                                           "savingsAmount": str(50 + i), "savingsCurrency": "USD"},
+                    "lastUpdated": "2024-01-31T00:00:00Z",
+                },
+            })
+
+        response = {"totalRecords": total, "count": len(rows), "data": rows, "resultTruncated": "false"}
+        if skip + top < total:
+            response["$skipToken"] = str(skip + top)
+        return web.json_response(response)
+
+
+async def serve(backends: FakeBackends, host: str, port: int):
+    runner = web.AppRunner(backends.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    print(runner.addresses[0][1], flush=True)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake backends for the FinOps Hub MCP server benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="Port to listen on, any free port if 0")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows of the synthetic Costs table")
+    parser.add_argument("--embedding-dim", type=int, default=256, help="Dimensions of fake embeddings")
+    parser.add_argument("--openai-latency-ms", type=float, default=50, help="Latency of embeddings and chat requests")
+    parser.add_argument("--kusto-latency-ms", type=float, default=20, help="Latency of Kusto queries")
+    parser.add_argument("--arm-latency-ms", type=float, default=50, help="Latency of metrics and Resource Graph requests")
+    parser.add_argument("--recommendations", type=int, default=50, help="Advisor recommendations per subscription")
+    args = parser.parse_args()
+
+    backends = FakeBackends(
+        rows=args.rows,
+        embedding_dim=args.embedding_dim,
+        openai_latency=args.openai_latency_ms / 1000,
+        kusto_latency=args.kusto_latency_ms / 1000,
+        arm_latency=args.arm_latency_ms / 1000,
+        recommendations=args.recommendations,
+    )
+    try:
+        asyncio.run(serve(backends, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,317 @@
+"""
+Benchmark of the FinOps Hub MCP server tools against local fakes.
+
+The FastMCP app of server/server.py is driven in-process by many concurrent
+MCP clients, while the OpenAI, Kusto, Azure Monitor and Resource Graph
+backends are served by bench/fakes.py in a separate process. The query
+library is an in-process index built from the dashboard definition with
+fake embeddings, and a static credential replaces Azure authentication, so
+no network access is needed.
+
+    python bench/run.py --clients 16 --iterations 20
+    python bench/run.py --save-baseline bench/baseline.json
+    python bench/run.py --baseline bench/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+import numpy as np
+from azure.core.credentials import AccessToken, AccessTokenInfo
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "server"))
+
+from fakes import fake_vector
+
+TOOLS = ["get_query_suggestions", "execute_finops_query", "vm_cpu_utilization", "retrieve_advisor_recommendations"]
+
+PURPOSES = [
+    ("Show the effective cost per month", ["EffectiveCost", "month"]),
+    ("Which services cost the most", ["ServiceName", "cost"]),
+    ("Commitment discount utilization", ["CommitmentDiscountId", "utilization"]),
+    ("Cost by resource group over the last 30 days", ["ResourceGroup", "30 days"]),
+    ("Savings from reservations and savings plans", ["savings", "reservation"]),
+    ("Daily cost trend by subscription", ["SubAccountName", "daily"]),
+]
+
+
+class StaticCredential:
+    """
+    Async token credential returning a static token.
+    """
+
+    async def get_token(self, *scopes, **kwargs) -> AccessToken:
+        return AccessToken("bench", int(time.time()) + 3600)
+
+    async def get_token_info(self, *scopes, options=None) -> AccessTokenInfo:
+        return AccessTokenInfo("bench", int(time.time()) + 3600)
+
+    async def close(self):
+        pass
+
+
+def start_fakes(args) -> tuple[subprocess.Popen, int]:
+    process = subprocess.Popen(
+        [
+            sys.executable, os.path.join(BENCH_DIR, "fakes.py"),
+            "--rows", str(args.rows),
+            "--embedding-dim", str(args.embedding_dim),
+            "--openai-latency-ms", str(args.openai_latency_ms),
+            "--kusto-latency-ms", str(args.kusto_latency_ms),
+            "--arm-latency-ms", str(args.arm_latency_ms),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    line = process.stdout.readline()
+    if not line:
+        raise RuntimeError("Fake backends did not start")
+    return process, int(line)
+
+
+def build_index(path: str, embedding_dim: int):
+    """
+    Writes a binary query library from the dashboard definition, with fake embeddings.
+    """
+    from plugins.querylibrary import QueryLibrary
+    from plugins.resolver import QueryResolver
+
+    with open(os.path.join(ROOT_DIR, "content", "finops-hub-dashboard.json"), "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    resolver = QueryResolver.from_dashboard(data)
+    items = []
+    for tile in data.get("tiles", []):
+        query = resolver.resolve(tile.get("queryRef", {}).get("queryId", ""))
+        title = tile.get("title", "")
+        if title and query:
+            description = f"Dashboard query for {title.lower()}."
+            items.append({
+                "title": title,
+                "description": description,
+                "query": query,
+                "vector": fake_vector(f"{title}\n{description}", embedding_dim),
+            })
+
+    QueryLibrary.from_entries(items).save(path)
+
+
+def configure_environment(port: int, workdir: str, args):
+    endpoint = f"http://127.0.0.1:{port}"
+    # set explicitly, so that values from a local .env file do not apply
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": endpoint,
+        "AZURE_OPENAI_API_KEY": "bench",
+        "AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME": "embedding",
+        "AZURE_OPENAI_CHAT_DEPLOYMENT_NAME": "chat",
+        "EMBEDDING_CACHE_PATH": "",
+        "FINOPS_HUB_CLUSTER": endpoint,
+        "ARM_ENDPOINT": endpoint,
+        "QUERY_LIBRARY_BACKEND": "local",
+        "QUERY_LIBRARY_SEARCH_MODE": args.search_mode,
+        "KUSTO_CACHE_TTL": str(args.kusto_cache_ttl),
+        "KUSTO_CACHE_SPILL_DIR": "",
+        "RESULT_STORE_DIR": os.path.join(workdir, "results"),
+        "FINOPS_MCP_TOOLS": "all",
+    })
+
+
+def tool_arguments(tool: str, n: int, args) -> dict:
+    # n cycles through a limited number of distinct requests per tool, so caches see repeats
+    k = n % args.distinct
+    if tool == "get_query_suggestions":
+        purpose, keywords = PURPOSES[k % len(PURPOSES)]
+        return {"purpose": f"{purpose} ({k // len(PURPOSES)})" if k >= len(PURPOSES) else purpose, "keywords": keywords}
+    if tool == "execute_finops_query":
+        return {"query": f"Costs() | where SubAccountName != 'excluded-{k}' | take {args.rows}"}
+    if tool == "vm_cpu_utilization":
+        return {"subscription_id": f"sub-{k % 7}", "resource_group": f"rg-{k % 13}", "vm_name": f"vm-{k}",
+                "summary": args.metrics_summary}
+    if tool == "retrieve_advisor_recommendations":
+        return {"subscription_id": f"sub-{k}", "resource_group": f"rg-{k % 5}"}
+    raise ValueError(f"Unknown tool '{tool}'")
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def summarize(latencies: list[float], errors: int, duration: float) -> dict:
+    values = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if values.size else (0.0, 0.0, 0.0)
+    return {
+        "calls": len(latencies),
+        "errors": errors,
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "mean_ms": round(float(values.mean()), 2) if values.size else 0.0,
+        "throughput_rps": round(len(latencies) / duration, 2) if duration else 0.0,
+    }
+
+
+async def benchmark(args, port: int, workdir: str) -> dict:
+    index_file = os.path.join(workdir, "library.json")
+    build_index(index_file, args.embedding_dim)
+    configure_environment(port, workdir, args)
+
+    import server
+    from fastmcp import Client
+    from plugins.credentials import CredentialService
+    from plugins.vectorindex import QueryLibraryPlugin
+
+    async def create_query_library():
+        plugin = QueryLibraryPlugin(
+            embeddings_client=await server.embeddings_client.get(),
+            index_file=index_file,
+            search_mode=args.search_mode
+        )
+        await plugin.connect()
+        return plugin
+
+    # per-call logging and serializer warnings would dominate the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+    warnings.filterwarnings("ignore", category=UserWarning, module="pydantic")
+
+    server.credential_service.factory = lambda: CredentialService(StaticCredential())
+    server.query_library_plugin.factory = create_query_library
+
+    latencies = {tool: [] for tool in args.tools}
+    errors = {tool: 0 for tool in args.tools}
+
+    async def run_client(client_id: int):
+        async with Client(server.mcp) as client:
+            for i in range(args.iterations):
+                for tool in args.tools:
+                    arguments = tool_arguments(tool, client_id * args.iterations + i, args)
+                    start = time.perf_counter()
+                    try:
+                        await client.call_tool(tool, arguments)
+                    except Exception as e:
+                        errors[tool] += 1
+                        if errors[tool] == 1:
+                            print(f"{tool} failed: {e}", file=sys.stderr)
+                    latencies[tool].append(time.perf_counter() - start)
+
+    # the first client keeps the server's lifespan open and initializes all plugins
+    async with Client(server.mcp) as client:
+        for tool in args.tools:
+            await client.call_tool(tool, tool_arguments(tool, 0, args))
+
+        server.telemetry.reset()
+        start = time.perf_counter()
+        await asyncio.gather(*[run_client(n) for n in range(args.clients)])
+        duration = time.perf_counter() - start
+
+        # where the time went, as recorded by the server's own spans
+        spans = json.loads((await client.read_resource("finops://telemetry/latency"))[0].text)
+
+    all_latencies = [latency for values in latencies.values() for latency in values]
+    return {
+        "config": {
+            key: getattr(args, key) for key in (
+                "clients", "iterations", "tools", "rows", "distinct", "embedding_dim", "openai_latency_ms",
+                "kusto_latency_ms", "arm_latency_ms", "kusto_cache_ttl", "search_mode", "metrics_summary",
+            )
+        },
+        "duration_s": round(duration, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "total": summarize(all_latencies, sum(errors.values()), duration),
+        "tools": {tool: summarize(latencies[tool], errors[tool], duration) for tool in args.tools},
+        "spans": spans,
+    }
+
+
+def print_results(results: dict):
+    header = f"{'tool':34} {'calls':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, stats in [*results["tools"].items(), ("total", results["total"])]:
+        print(f"{name:34} {stats['calls']:>6} {stats['errors']:>6} {stats['p50_ms']:>9.2f} "
+              f"{stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['throughput_rps']:>8.1f}")
+    print(f"\nDuration {results['duration_s']}s, peak RSS {results['peak_rss_mb']} MB")
+
+    header = f"{'span':38} {'count':>6} {'errors':>6} {'mean ms':>9} {'p95 ms':>9} {'max ms':>9}"
+    print(f"\n{header}")
+    print("-" * len(header))
+    for name, stats in results.get("spans", {}).items():
+        print(f"{name:38} {stats['count']:>6} {stats['errors']:>6} {stats['mean_seconds'] * 1000:>9.2f} "
+              f"{stats['p95_seconds'] * 1000:>9.2f} {stats['max_seconds'] * 1000:>9.2f}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compares p95 latency and throughput with a baseline and returns the regressions.
+    """
+    regressions = []
+    print(f"\n{'tool':34} {'p95 ms':>19} {'req/s':>19}")
+    for name, stats in [*results["tools"].items(), ("total", results["total"])]:
+        base = baseline["tools"].get(name) if name != "total" else baseline.get("total")
+        if not base:
+            continue
+        print(f"{name:34} {base['p95_ms']:>8.2f} -> {stats['p95_ms']:<8.2f} {base['throughput_rps']:>8.1f} -> {stats['throughput_rps']:<8.1f}")
+        if stats["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']} ms -> {stats['p95_ms']} ms")
+        if stats["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']} -> {stats['throughput_rps']} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the FinOps Hub MCP server tools against local fakes")
+    parser.add_argument("--clients", type=int, default=16, help="Number of concurrent MCP clients")
+    parser.add_argument("--iterations", type=int, default=10, help="Rounds over all tools per client")
+    parser.add_argument("--tools", nargs="+", default=TOOLS, choices=TOOLS, help="Tools to call")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows returned by the fake Kusto queries")
+    parser.add_argument("--distinct", type=int, default=20, help="Distinct requests per tool, repeats hit caches")
+    parser.add_argument("--embedding-dim", type=int, default=256, help="Dimensions of fake embeddings")
+    parser.add_argument("--openai-latency-ms", type=float, default=50, help="Latency of the fake OpenAI endpoint")
+    parser.add_argument("--kusto-latency-ms", type=float, default=20, help="Latency of the fake Kusto endpoint")
+    parser.add_argument("--arm-latency-ms", type=float, default=50, help="Latency of the fake ARM endpoints")
+    parser.add_argument("--kusto-cache-ttl", type=float, default=300, help="KUSTO_CACHE_TTL of the server, 0 disables the cache")
+    parser.add_argument("--search-mode", default="hybrid", choices=["hybrid", "vector", "keyword"], help="Query library search mode")
+    parser.add_argument("--metrics-summary", action="store_true", help="Request VM metrics in summary mode")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--save-baseline", help="Write the results as the baseline to this file")
+    parser.add_argument("--baseline", help="Compare the results with this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression against the baseline")
+    args = parser.parse_args()
+
+    fakes, port = start_fakes(args)
+    try:
+        with tempfile.TemporaryDirectory(prefix="finopshub-bench-") as workdir:
+            results = asyncio.run(benchmark(args, port, workdir))
+    finally:
+        fakes.terminate()
+        fakes.wait()
+
+    print_results(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
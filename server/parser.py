@@ -2,27 +2,44 @@ import json
 import csv
 import os
 import sys
+import time
 import weaviate
 from weaviate.classes.config import Property, DataType, Configure
-from weaviate.classes.data import DataObject
+from weaviate.classes.query import Filter
+from weaviate.util import generate_uuid5
 import dotenv
 from plugins.embeddings import EmbeddingsClient
+from plugins.embeddingcache import EmbeddingCache
 from plugins.completions import CompletionsClient
+from plugins.credentials import CredentialService
+from plugins.config import COLLECTION_NAME, INDEX_FILE, LIBRARY_FILE, EXPLANATION_CACHE_FILE
+from plugins.explanationcache import ExplanationCache
+from plugins.resolver import QueryResolver
+from plugins.querylibrary import QueryLibrary, VECTOR_DTYPES, convert_library, default_library_path, iter_library_entries
 import asyncio
 
 dotenv.load_dotenv()
 
+credential_service = CredentialService()
 
 embeddings_client = EmbeddingsClient(
     endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
     engine=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY", None)
+    api_key=os.getenv("AZURE_OPENAI_API_KEY", None),
+    cache=EmbeddingCache(
+        max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+        path=os.getenv("EMBEDDING_CACHE_PATH", None)
+    ),
+    batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "16")),
+    batch_linger_ms=float(os.getenv("EMBEDDING_BATCH_LINGER_MS", "5")),
+    credential=credential_service
 )
 
 completions_client = CompletionsClient(
     endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
     engine=os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY", None)
+    api_key=os.getenv("AZURE_OPENAI_API_KEY", None),
+    credential=credential_service
 )
 
 async def get_embedding(text: str | list[str]):
@@ -37,40 +54,215 @@ async def get_completion(prompt: str, text: str, max_tokens: int = 300):
     """
     return await completions_client.generate(prompt, text, max_tokens=max_tokens)
 
+async def close_clients():
+    """
+    Closes the OpenAI clients, the embedding cache and the credential service with its refresh tasks.
+    """
+    await embeddings_client.aclose()
+    await completions_client.aclose()
+    await credential_service.close()
+
+async def run(command):
+    """
+    Runs a command and closes the clients afterwards, also when it fails.
+    """
+    try:
+        return await command
+    finally:
+        await close_clients()
+
 
-def create_index_entries(items):
-    return [DataObject(
-        properties={
-            "title": i["title"],
-            "description":   i["description"],
-            "query": i["query"],
-        },
-        vector=i["vector"], 
+def entry_uuid(item: dict) -> str:
+    """
+    Derives a deterministic object id from the entry content, so repeated
+    injections update existing objects instead of duplicating them.
+    """
+    return generate_uuid5(f"{item['title']}\n{item['query']}")
+
+def create_collection(client, name: str):
+    return client.collections.create(
+        name=name,
+        vectorizer_config=Configure.Vectorizer.none(),
+        properties=[
+            Property(name="title", data_type=DataType.TEXT),
+            Property(name="description", data_type=DataType.TEXT),
+            Property(name="query", data_type=DataType.TEXT)
+        ], 
     )
-    for i in items
-    ]
 
-def index_queries(items):
+def upsert_entries(collection, items) -> set[str]:
+    """
+    Upserts the entries through dynamic batching and returns the ids written.
+    """
+    written = set()
+    with collection.batch.dynamic() as batch:
+        for item in items:
+            uuid = entry_uuid(item)
+            batch.add_object(
+                properties={
+                    "title": item["title"],
+                    "description": item["description"],
+                    "query": item["query"],
+                },
+                vector=item["vector"],
+                uuid=uuid
+            )
+            written.add(uuid)
+
+    for failed in collection.batch.failed_objects:
+        print(f"Failed to index '{failed.object_.properties.get('title')}': {failed.message}")
+    print(f"Upserted {len(written)} queries into {collection.name}")
+    return written
+
+def delete_stale_entries(collection, keep: set[str], chunk_size: int = 100):
+    """
+    Deletes objects whose ids were not written by the last upsert.
+    """
+    stale = [str(obj.uuid) for obj in collection.iterator(return_properties=[]) if str(obj.uuid) not in keep]
+    for i in range(0, len(stale), chunk_size):
+        collection.data.delete_many(where=Filter.by_id().contains_any(stale[i:i + chunk_size]))
+    print(f"Deleted {len(stale)} stale queries from {collection.name}")
+
+def index_queries(items, shadow: bool = False):
+    """
+    Indexes the entries into the query collection.
+
+    By default the collection is updated in place: entries are upserted and
+    objects no longer in the library are deleted afterwards. With shadow set,
+    a new collection is built and the collection alias is switched to it once
+    it is complete, then the previous collection is dropped.
+    """
     with weaviate.connect_to_local() as client:
 
-        client.collections.delete("FinOpsHubQueries")
+        alias = client.alias.get(alias_name=COLLECTION_NAME)
+
+        if shadow:
+            if alias is None and client.collections.exists(COLLECTION_NAME):
+                raise ValueError(
+                    f"'{COLLECTION_NAME}' is a collection, not an alias. "
+                    f"Delete it once before switching to shadow indexing."
+                )
+
+            target = f"{COLLECTION_NAME}_{int(time.time())}"
+            collection = create_collection(client, target)
+            upsert_entries(collection, items)
+
+            if alias is None:
+                client.alias.create(alias_name=COLLECTION_NAME, target_collection=target)
+            else:
+                client.alias.update(alias_name=COLLECTION_NAME, new_target_collection=target)
+                client.collections.delete(alias.collection)
+            print(f"Alias {COLLECTION_NAME} now points to {target}")
+            return
+
+        target = alias.collection if alias else COLLECTION_NAME
+        if client.collections.exists(target):
+            collection = client.collections.get(target)
+        else:
+            collection = create_collection(client, target)
+
+        written = upsert_entries(collection, items)
+        delete_stale_entries(collection, written)
+
+def resolve_tile_queries(data: dict) -> list[tuple[str, str]]:
+    """
+    Resolves the full query text of every dashboard tile, prepending the base
+    queries it depends on. Returns (title, query) pairs in tile order.
+    """
+    resolver = QueryResolver.from_dashboard(data)
+
+    tiles = []
+    for tile in data.get('tiles', []):
+        title = tile.get('title', '')
+        query_ref = tile.get('queryRef', {})
+        query_id = query_ref.get('queryId') if isinstance(query_ref, dict) else None
 
-        collection = client.collections.create(
-            name="FinOpsHubQueries",
-            vectorizer_config=Configure.Vectorizer.none(),
-            properties=[
-                Property(name="title", data_type=DataType.TEXT),
-                Property(name="description", data_type=DataType.TEXT),
-                Property(name="query", data_type=DataType.TEXT)
-            ], 
-        )
+        full_query_text = resolver.resolve(query_id)
+        if title and full_query_text:
+            tiles.append((title, full_query_text))
 
-        collection.data.insert_many(items)
+    return tiles
 
-        for item in collection.iterator():
-            print(item.uuid, item.properties)
 
-async def parse_dashboard():
+class Progress:
+    """
+    Prints progress and throughput of a pipeline stage.
+    """
+    def __init__(self, stage: str, total: int):
+        self.stage = stage
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    def update(self, count: int = 1, failed: bool = False):
+        self.done += count
+        if failed:
+            self.failed += count
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        print(f"[{self.stage}] {self.done}/{self.total} ({self.failed} failed, {rate:.1f}/s)")
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        print(f"[{self.stage}] finished {self.done - self.failed}/{self.total} in {elapsed:.1f}s, {self.failed} failed")
+
+
+async def explain_queries(tiles: list[tuple[str, str]], explainer_prompt: str, concurrency: int) -> list[str | None]:
+    """
+    Explains the tile queries with a bounded pool of workers.
+    Explanations are returned in tile order, None where the completion failed.
+    """
+    explanations = [None] * len(tiles)
+    progress = Progress("explain", len(tiles))
+    queue = asyncio.Queue()
+    for position in range(len(tiles)):
+        queue.put_nowait(position)
+
+    async def worker():
+        while not queue.empty():
+            position = queue.get_nowait()
+            title, query = tiles[position]
+            try:
+                explanations[position] = await get_completion(explainer_prompt, query)
+                progress.update()
+            except Exception as e:
+                print(f"Failed to explain '{title}': {e}")
+                progress.update(failed=True)
+
+    await asyncio.gather(*[worker() for _ in range(max(1, concurrency))])
+    progress.report()
+    return explanations
+
+
+async def embed_entries(texts: list[str | None], batch_size: int, concurrency: int) -> list[list[float] | None]:
+    """
+    Embeds the given texts in batches, skipping None entries.
+    Vectors are returned in input order, None where embedding failed.
+    """
+    vectors = [None] * len(texts)
+    positions = [i for i, text in enumerate(texts) if text is not None]
+    batches = [positions[i:i + batch_size] for i in range(0, len(positions), batch_size)]
+    progress = Progress("embed", len(positions))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def embed_batch(batch: list[int]):
+        async with semaphore:
+            try:
+                embeddings = await get_embedding([texts[i] for i in batch])
+                for i, vector in zip(batch, embeddings):
+                    vectors[i] = vector
+                progress.update(len(batch))
+            except Exception as e:
+                print(f"Failed to embed batch of {len(batch)} entries: {e}")
+                progress.update(len(batch), failed=True)
+
+    await asyncio.gather(*[embed_batch(batch) for batch in batches])
+    progress.report()
+    return vectors
+
+
+async def parse_dashboard(concurrency: int = 8, batch_size: int = 16, use_cache: bool = True):
     
     with open('content/finops_model.md', 'r', encoding='utf-8') as f:
         finops_costs_model = f.read()
@@ -84,102 +276,116 @@ async def parse_dashboard():
     with open('content/finops-hub-dashboard.json', 'r', encoding='utf-8') as f:
         data = json.load(f)
 
-    # Build a mapping from queryId to query text
-    query_map = {}
-    for query in data.get('queries', []):
-        query_id = query.get('id')
-        query_text = query.get('text')
-        # print(f"Processing query: {query_id} - {query_text}")
-        if query_id and query_text:
-            query_map[query_id] = {"text" : query_text, "usedVariables": query.get('usedVariables', [])}
-
-    base_queries = {}
-    for query in data.get('baseQueries', []):
-        id = query.get('id')
-        query_id = query.get('queryId')
-        variable_name = query.get('variableName')
-        base_query = query_map.get(query_id)
-        base_queries[variable_name] = { 
-            "text": base_query.get('text', '') if base_query else '', 
-            "usedVariables": base_query.get('usedVariables', []) if base_query else []    
-        } 
-
-
-    # with open('base_queries.json', 'w', encoding='utf-8') as f:
-    #     json.dump(base_queries, f, indent=4)
+    cache = ExplanationCache(
+        EXPLANATION_CACHE_FILE,
+        ExplanationCache.version(explainer_prompt, completions_client.engine, embeddings_client.engine)
+    )
+    if not use_cache:
+        cache.entries.clear()
+
+    started = time.perf_counter()
+
+    # Stage 1: resolve the full query of every tile
+    tiles = resolve_tile_queries(data)
+    keys = [cache.key(query) for _, query in tiles]
+
+    # Stage 2: explain each distinct query that is not cached yet
+    pending = {}
+    for key, tile in zip(keys, tiles):
+        if cache.get_explanation(key) is None:
+            pending.setdefault(key, tile)
+    print(f"Resolved {len(tiles)} tile queries, {len(set(keys))} distinct, {len(pending)} to explain")
+
+    explanations = await explain_queries(list(pending.values()), explainer_prompt, concurrency)
+    for key, explanation in zip(pending, explanations):
+        if explanation is not None:
+            cache.put_explanation(key, explanation)
+
+    # Stage 3: embed title and explanation where no vector is cached
+    texts = {}
+    for key, (title, _) in zip(keys, tiles):
+        explanation = cache.get_explanation(key)
+        if explanation is not None and cache.get_vector(key, title) is None:
+            texts[(key, title)] = f"{title}: {explanation}"
+    print(f"{len(texts)} entries to embed")
+
+    vectors = await embed_entries(list(texts.values()), batch_size, concurrency)
+    for (key, title), vector in zip(texts, vectors):
+        if vector is not None:
+            cache.put_vector(key, title, vector)
 
     results = []
-
-    for tile in data.get('tiles', []):
-        title = tile.get('title', '')
-        query_id = None
-        query_ref = tile.get('queryRef', {})
-        if isinstance(query_ref, dict):
-            query_id = query_ref.get('queryId')
-        query_from_map = query_map.get(query_id, '')
-        query_text = query_from_map['text'] if query_id else ''
-        used_variables = query_from_map['usedVariables'] if query_id else []
-
-        full_query_text = query_text
-
-        # put user variable to stack
-        user_variable_stack = []
-        for var in used_variables:
-            user_variable_stack.append(var)
-
-        # while the stack is not empty, pop the last variable and prepend the query text with the base query
-        while user_variable_stack:
-            var = user_variable_stack.pop()
-            base_query = base_queries.get(var, {}).get('text', '')
-            if base_query:
-                full_query_text = f"let {var} = {base_query};\n" + full_query_text
-                for used_var in base_queries.get(var, {}).get('usedVariables', []):
-                    if used_var not in user_variable_stack:
-                        user_variable_stack.append(used_var)
-
-
-        if title and full_query_text:
-            query_explanation = await get_completion(
-                explainer_prompt,
-                full_query_text
-            )
-            print (f"Query {title}: {query_explanation}")
-
-            embeddings = await get_embedding(f"{title}: {query_explanation}")
-            entry = {
-                "title": title,
-                "description": query_explanation,
-                "query": full_query_text,
-                "vector": embeddings[0]
-            }
-            results.append(entry)
+    for key, (title, query) in zip(keys, tiles):
+        explanation = cache.get_explanation(key)
+        vector = cache.get_vector(key, title)
+        if explanation is None or vector is None:
+            continue
+        results.append({
+            "title": title,
+            "description": explanation,
+            "query": query,
+            "vector": vector
+        })
+
+    cache.save()
+
+    elapsed = time.perf_counter() - started
+    print(f"Parsed {len(results)}/{len(tiles)} tiles in {elapsed:.1f}s ({len(results) / elapsed if elapsed else 0.0:.2f} tiles/s)")
     return results
 
 
-async def inject_to_weaviate(entries):
-    with open('content/dashboard_queries_index.json', 'r', encoding='utf-8') as f:
-        results = json.load(f)
-    entries = create_index_entries(results)
-    index_queries(entries)
+async def inject_to_weaviate(shadow: bool = False, path: str = None):
+    path = path or default_library_path()
+    print(f"Reading queries from {path}")
+    index_queries(iter_library_entries(path), shadow)
+
+async def dump_dashboard(concurrency: int = 8, batch_size: int = 16, use_cache: bool = True,
+                         binary: bool = True, dtype: str = "float32"):
+    results = await parse_dashboard(concurrency, batch_size, use_cache)
 
-async def dump_dashboard():
-    results = await parse_dashboard()
+    if binary:
+        QueryLibrary.from_entries(results, dtype).save(LIBRARY_FILE)
+        print(f"Wrote {len(results)} queries to {LIBRARY_FILE} with {dtype} vectors")
+    else:
+        with open(INDEX_FILE, 'w', encoding='utf-8') as f:
+            json.dump(results, f)
+        print(f"Wrote {len(results)} queries to {INDEX_FILE}")
 
-    with open('content/dashboard_queries_index.json', 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=4)
+def convert(binary: bool, dtype: str = "float32", source: str = None, target: str = None):
+    """
+    Converts the query library from JSON to the binary format, or back.
+    """
+    source = source or (INDEX_FILE if binary else LIBRARY_FILE)
+    target = target or (LIBRARY_FILE if binary else INDEX_FILE)
+    started = time.perf_counter()
+    count = convert_library(source, target, binary, dtype)
+    print(f"Converted {count} queries from {source} to {target} in {time.perf_counter() - started:.2f}s")
 
 if __name__ == "__main__":
 
     import argparse
 
     parser = argparse.ArgumentParser(description="Process dashboard queries")
-    parser.add_argument("action", choices=["parse","inject"], help="Action to perform")
+    parser.add_argument("action", choices=["parse","inject","convert"], help="Action to perform")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of concurrent completion requests while parsing")
+    parser.add_argument("--batch-size", type=int, default=16, help="Number of entries per embedding request while parsing")
+    parser.add_argument("--full", action="store_true", help="Explain and embed every query again, ignoring the explanation cache")
+    parser.add_argument("--shadow", action="store_true", help="Inject into a new collection and switch the collection alias to it")
+    parser.add_argument("--format", choices=["binary","json"], default="binary", help="Library format written by parse and convert")
+    parser.add_argument("--dtype", choices=VECTOR_DTYPES, default="float32", help="Vector type of the binary library")
+    parser.add_argument("--source", help="Library read by inject and convert, in either format")
+    parser.add_argument("--target", help="Library written by convert")
     args = parser.parse_args()
 
     if args.action == "inject":
         print("Injecting to index...")
-        asyncio.run(inject_to_weaviate(None))
+        asyncio.run(run(inject_to_weaviate(args.shadow, args.source)))
     elif args.action == "parse":
         print("Parsing dashboard...")
-        asyncio.run(dump_dashboard())
+        asyncio.run(run(dump_dashboard(args.concurrency, args.batch_size, not args.full, args.format == "binary", args.dtype)))
+    elif args.action == "convert":
+        try:
+            convert(args.format == "binary", args.dtype, args.source, args.target)
+        finally:
+            asyncio.run(close_clients())
 
@@ -1,15 +1,73 @@
+import asyncio
 import logging
+import time
+from contextlib import AsyncExitStack
+from typing import Iterable, List
 from azure.identity import DefaultAzureCredential
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
 from azure.mgmt.resourcegraph import ResourceGraphClient
-from azure.mgmt.resourcegraph.models import QueryRequest
+from azure.mgmt.resourcegraph.aio import ResourceGraphClient as AsyncResourceGraphClient
+from azure.mgmt.resourcegraph.models import QueryRequest, QueryRequestOptions
+from plugins.credentials import CredentialService
+from plugins.telemetry import telemetry
 
 class AzureAdvisorClient:
+    """
+    Retrieves Azure Advisor rightsizing recommendations through Azure Resource Graph.
 
-    def __init__(self):
-        self.credential = DefaultAzureCredential()
+    The asynchronous path follows skip tokens until all pages are read and caches
+    the recommendations of a subscription or management group for a limited
+    time. Filtering by resource group or resource name is applied to the cached
+    recommendations.
+    """
+
+    RECOMMENDATIONS_QUERY = """advisorresources
+            | where type == 'microsoft.advisor/recommendations'
+            | where properties contains_cs "Right-size"
+            | extend resourceName = tostring(split(id, '/')[8])"""
+
+    # Resource Graph accepts up to 1000 subscriptions per request
+    MAX_SUBSCRIPTIONS_PER_QUERY = 1000
+
+    COLUMNS = ["subscriptionId", "resourceGroup", "resourceName", "impact", "problem", "solution",
+               "currentSku", "targetSku", "savingsAmount", "savingsCurrency", "lastUpdated"]
+
+    def __init__(self, endpoint: str = None, page_size: int = 1000, cache_ttl: float = 3600.0,
+                 max_concurrency: int = 4, credential: CredentialService = None):
+        """
+        Initialize the Advisor client.
+
+        Args:
+            endpoint (str, optional): Azure Resource Manager endpoint, public cloud if not set
+            page_size (int, optional): Rows requested per Resource Graph page (at most 1000)
+            cache_ttl (float, optional): Seconds the recommendations of a subscription are cached
+            max_concurrency (int, optional): Maximum number of concurrent Resource Graph queries
+            credential (CredentialService, optional): Shared credential service, DefaultAzureCredential if not set
+        """
+        self.credential = credential.sync() if credential is not None else DefaultAzureCredential()
         self.client = ResourceGraphClient(self.credential)
         self.logger = logging.getLogger(__name__)
 
+        self.endpoint = endpoint
+        self.page_size = page_size
+        self.cache_ttl = cache_ttl
+        self._shared_credential = credential
+        self._async_credential = None
+        self._async_client = None
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._cache: dict[str, tuple[float, List[dict]]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def _get_async_client(self) -> AsyncResourceGraphClient:
+        if self._async_client is None:
+            if self._shared_credential is None:
+                self._async_credential = AsyncDefaultAzureCredential()
+            kwargs = {"base_url": self.endpoint} if self.endpoint else {}
+            credential = self._shared_credential.shared() if self._shared_credential is not None else self._async_credential
+            self._async_client = AsyncResourceGraphClient(credential, **kwargs)
+        return self._async_client
+
     def get_recommendations(self, 
         subscription_id: str,
         resource_group: str = None, 
@@ -32,8 +90,6 @@ class AzureAdvisorClient:
             | extend resourceName = split(id, '/')[8]
             | where resourceName == '{resource_name}' """
 
-        print(query)
-
         self.logger.info(f"Executing query: {query}")
 
         # Define the query
@@ -43,6 +99,199 @@ class AzureAdvisorClient:
         )
 
         # Execute the query
-        response = self.client.resources(query)
+        with telemetry.span("resourcegraph.query") as span:
+            response = self.client.resources(query)
+            span.set(rows=response.count)
         self.logger.info(f"Query response: {response}")
-        return response
\ No newline at end of file
+        return response
+
+    async def get_recommendations_async(self,
+        subscription_id: str,
+        resource_group: str = None,
+        resource_name: str = None) -> List[dict]:
+        """
+        Retrieves the rightsizing recommendations of a subscription, optionally
+        narrowed down to a resource group and/or resource.
+
+        Args:
+            subscription_id: Azure subscription ID
+            resource_group: Resource group name or None for all resource groups
+            resource_name: Name of the resource or None for all resources
+
+        Returns:
+            List of recommendations as dictionaries
+        """
+        recommendations = await self._get_subscription_recommendations([subscription_id])
+        return self._filter(recommendations, resource_group, resource_name)
+
+    async def get_scope_recommendations_async(self,
+        subscription_ids: List[str] = None,
+        management_group: str = None,
+        resource_group: str = None,
+        resource_name: str = None) -> dict:
+        """
+        Retrieves the rightsizing recommendations of many subscriptions or of a
+        management group. Subscriptions are queried in chunks of up to
+        MAX_SUBSCRIPTIONS_PER_QUERY, concurrently, and recommendations are
+        deduplicated by ID.
+
+        Args:
+            subscription_ids: Azure subscription IDs, or with a management group, the subscriptions to keep
+            management_group: Management group ID
+            resource_group: Resource group name or None for all resource groups
+            resource_name: Name of the resource or None for all resources
+
+        Returns:
+            Recommendations as a table ("columns" and "rows")
+
+        Raises:
+            ValueError: If neither subscriptions nor a management group are given
+        """
+        if management_group:
+            recommendations = await self._get_management_group_recommendations(management_group)
+            if subscription_ids:
+                keep = {s.casefold() for s in subscription_ids}
+                recommendations = [r for r in recommendations if (r.get("subscriptionId") or "").casefold() in keep]
+        elif subscription_ids:
+            recommendations = await self._get_subscription_recommendations(subscription_ids)
+        else:
+            raise ValueError("Either subscription IDs or a management group must be specified")
+
+        recommendations = self._filter(recommendations, resource_group, resource_name)
+
+        unique = {}
+        for recommendation in recommendations:
+            unique.setdefault((recommendation.get("id") or "").casefold(), recommendation)
+        return self._tabulate(unique.values())
+
+    @staticmethod
+    def _filter(recommendations: List[dict], resource_group: str = None, resource_name: str = None) -> List[dict]:
+        if resource_group:
+            resource_group = resource_group.casefold()
+            recommendations = [r for r in recommendations if (r.get("resourceGroup") or "").casefold() == resource_group]
+
+        if resource_name:
+            resource_name = resource_name.casefold()
+            recommendations = [r for r in recommendations if (r.get("resourceName") or "").casefold() == resource_name]
+
+        return recommendations
+
+    @classmethod
+    def _tabulate(cls, recommendations: Iterable[dict]) -> dict:
+        rows = []
+        for r in recommendations:
+            properties = r.get("properties") or {}
+            description = properties.get("shortDescription") or {}
+            extended = properties.get("extendedProperties") or {}
+            rows.append([
+                r.get("subscriptionId"),
+                r.get("resourceGroup"),
+                r.get("resourceName"),
+                properties.get("impact"),
+                description.get("problem"),
+                description.get("solution"),
+                extended.get("currentSku"),
+                extended.get("targetSku"),
+                extended.get("savingsAmount"),
+                extended.get("savingsCurrency"),
+                properties.get("lastUpdated"),
+            ])
+        return {"columns": cls.COLUMNS, "rows": rows}
+
+    async def _get_subscription_recommendations(self, subscription_ids: List[str]) -> List[dict]:
+        subscription_ids = list(dict.fromkeys(s.casefold() for s in subscription_ids))
+
+        # locks are taken in a fixed order, so overlapping requests cannot deadlock
+        async with AsyncExitStack() as stack:
+            for subscription_id in sorted(subscription_ids):
+                await stack.enter_async_context(self._locks.setdefault(subscription_id, asyncio.Lock()))
+
+            now = time.monotonic()
+            missing = [s for s in subscription_ids if s not in self._cache or self._cache[s][0] <= now]
+            chunks = [
+                missing[i:i + self.MAX_SUBSCRIPTIONS_PER_QUERY]
+                for i in range(0, len(missing), self.MAX_SUBSCRIPTIONS_PER_QUERY)
+            ]
+            results = await asyncio.gather(*[
+                self._query_all(self.RECOMMENDATIONS_QUERY, subscriptions=chunk) for chunk in chunks
+            ])
+
+            expires = time.monotonic() + self.cache_ttl
+            loaded = {s: [] for s in missing}
+            for rows in results:
+                for row in rows:
+                    loaded.setdefault((row.get("subscriptionId") or "").casefold(), []).append(row)
+            for subscription_id, rows in loaded.items():
+                self._cache[subscription_id] = (expires, rows)
+
+            return [r for s in subscription_ids for r in self._cache[s][1]]
+
+    async def _get_management_group_recommendations(self, management_group: str) -> List[dict]:
+        key = f"managementGroups/{management_group.casefold()}"
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                return cached[1]
+
+            recommendations = await self._query_all(self.RECOMMENDATIONS_QUERY, management_groups=[management_group])
+            self._cache[key] = (time.monotonic() + self.cache_ttl, recommendations)
+            return recommendations
+
+    async def _query_all(self, query: str, subscriptions: List[str] = None, management_groups: List[str] = None) -> List[dict]:
+        # Resource Graph returns at most one page per request, follow skip tokens for the rest
+        client = self._get_async_client()
+        # plain HTTP is only used for local test endpoints
+        kwargs = {"enforce_https": False} if self.endpoint and self.endpoint.startswith("http://") else {}
+        rows = []
+        skip_token = None
+        pages = 0
+        async with self._semaphore:
+            while True:
+                request = QueryRequest(
+                    subscriptions=subscriptions,
+                    management_groups=management_groups,
+                    query=query,
+                    options=QueryRequestOptions(top=self.page_size, skip_token=skip_token, result_format="objectArray")
+                )
+                with telemetry.span("resourcegraph.query") as span:
+                    response = await client.resources(request, **kwargs)
+                    span.set(rows=len(response.data))
+                rows.extend(response.data)
+                pages += 1
+                skip_token = response.skip_token
+                if not skip_token:
+                    break
+
+        self.logger.info(f"Resource Graph query returned {len(rows)} rows in {pages} pages")
+        return rows
+
+    def invalidate(self, subscription_id: str = None):
+        """
+        Drops the cached recommendations of a subscription, or of all subscriptions
+        and management groups.
+
+        For a subscription, the cached management groups with recommendations of
+        that subscription are dropped as well. A management group in which the
+        subscription had no recommendations cannot be told apart from one that
+        does not contain it, and is kept until its TTL expires.
+        """
+        if subscription_id is None:
+            self._cache.clear()
+            return
+
+        subscription_id = subscription_id.casefold()
+        self._cache.pop(subscription_id, None)
+        for key in [k for k in self._cache if k.startswith("managementGroups/")]:
+            if any((r.get("subscriptionId") or "").casefold() == subscription_id for r in self._cache[key][1]):
+                del self._cache[key]
+
+    async def aclose(self):
+        """
+        Close the asynchronous Resource Graph client.
+        """
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+        if self._async_credential is not None:
+            await self._async_credential.close()
+            self._async_credential = None
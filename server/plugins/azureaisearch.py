@@ -1,45 +1,146 @@
+import asyncio
 import logging
 import os
+import time
 from typing import List
+import aiohttp
+from azure.core.exceptions import ServiceRequestError
+from azure.core.pipeline.transport import AioHttpTransport
 from azure.search.documents.aio import SearchClient
-from azure.search.documents.models import VectorizedQuery 
+from azure.search.documents.models import VectorizedQuery
 from azure.core.credentials import AzureKeyCredential
-from azure.identity import DefaultAzureCredential
+from azure.identity.aio import DefaultAzureCredential
 from plugins.embeddings import EmbeddingsClient
 from plugins.model import DashboardQuery
-    
+from plugins.credentials import CredentialService
+from plugins.telemetry import telemetry
+
 class QueryLibraryPlugin:
-    
-    def __init__(self,  embeddings_client: EmbeddingsClient):
-          
+
+    def __init__(self,  embeddings_client: EmbeddingsClient, pool_size: int = 10, health_check_interval: float = 30.0,
+                 credential: CredentialService = None):
+        """
+        Initialize the Azure AI Search query library.
+
+        The SearchClient is created once by connect() and shared by all
+        requests until aclose() is called.
+
+        Args:
+            embeddings_client (EmbeddingsClient): Client used to embed the query purpose
+            pool_size (int, optional): Maximum number of pooled HTTP connections to the search service
+            health_check_interval (float, optional): Seconds between health checks of the shared client
+            credential (CredentialService, optional): Shared credential service, DefaultAzureCredential if not set
+        """
+
         # get credentials from environment variables, if not present, use DefaultAzureCredential
         if os.getenv("AZURE_SEARCH_API_KEY"):
             self.credential = AzureKeyCredential(os.getenv("AZURE_SEARCH_API_KEY"))
         else:
-            self.credential = DefaultAzureCredential()
-        
+            self.credential = credential or DefaultAzureCredential()
+
         self.embeddings_client = embeddings_client
+        self.pool_size = pool_size
+        self.health_check_interval = health_check_interval
 
         self.logger = logging.getLogger(__name__)
 
+        self.search_client: SearchClient | None = None
+        self._lock = asyncio.Lock()
+        self._last_health_check = 0.0
+
+    async def connect(self):
+        """
+        Create the shared SearchClient.
+        """
+        async with self._lock:
+            await self._reconnect()
+
+    async def aclose(self):
+        """
+        Close the shared SearchClient and its connection pool.
+        """
+        async with self._lock:
+            if self.search_client is not None:
+                await self.search_client.close()
+                self.search_client = None
+            if isinstance(self.credential, DefaultAzureCredential):
+                await self.credential.close()
+            self.logger.info("Search client closed")
+
+    async def _reconnect(self):
+        if self.search_client is not None:
+            try:
+                await self.search_client.close()
+            except Exception as e:
+                self.logger.warning(f"Error while closing stale search client: {e}")
+
+        # the transport owns the session and closes it together with the client
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        self.search_client = SearchClient(
+            endpoint=os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT"),
+            index_name=os.getenv("AZURE_SEARCH_INDEX_NAME"),
+            credential=self.credential,
+            transport=AioHttpTransport(session=session, session_owner=True)
+        )
+        self._last_health_check = time.monotonic()
+        self.logger.info("Search client created")
+
+    async def _get_client(self) -> SearchClient:
+        async with self._lock:
+            if self.search_client is None:
+                await self._reconnect()
+            elif time.monotonic() - self._last_health_check > self.health_check_interval:
+                try:
+                    await self.search_client.get_document_count()
+                except ServiceRequestError as e:
+                    self.logger.warning(f"Search health check failed, reconnecting: {e}")
+                    await self._reconnect()
+                self._last_health_check = time.monotonic()
+            return self.search_client
+
+    async def _search(self, keyword_query: str | None, vector_query: VectorizedQuery) -> List[DashboardQuery]:
+        search_client = await self._get_client()
+
+        with telemetry.span("azureaisearch.search") as span:
+            response = await search_client.search(
+                search_text=keyword_query,
+                vector_queries=[vector_query],
+                top=3,
+                select=["id", "title", "description", "query"])
+
+            queries = []
+            async for result in response:
+                dashboard_query = DashboardQuery(
+                    id=result.get("id", ""),
+                    title=result.get("title", ""),
+                    description=result.get("description", ""),
+                    query=result.get("query", "")
+                )
+                queries.append(dashboard_query)
+
+                self.logger.info(f"Found query candidate: {dashboard_query.title} - {dashboard_query.description}")
+            span.set(results=len(queries))
+
+        return queries
+
     async def get_query_suggestions(
         self,
         query_purpose: str,
         keywords: List[str]
     ) -> List[DashboardQuery]:
-        
+
         """
         Provides samples of queries for a specific task.
-        
+
         Args:
             query_purpose: Purpose of the query
             keywords: Keywords extracted from the query
-            
+
         Returns:
             List of DashboardQuery objects
         """
         self.logger.info(f"Searching for queries matching: '{query_purpose}', keywords: {', '.join(keywords)}")
-        
+
         try:
             # Generate embedding for the query purpose
             embedded_question = await self.embeddings_client.get_embedding(query_purpose)
@@ -48,31 +149,15 @@ class QueryLibraryPlugin:
 
             vector_query = VectorizedQuery(vector=embedded_question[0], k_nearest_neighbors=5, fields="vector")
 
-            async with SearchClient(
-                endpoint=os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT"),
-                index_name=os.getenv("AZURE_SEARCH_INDEX_NAME"),
-                credential=self.credential
-            ) as search_client:
-                response = await search_client.search(
-                    search_text=keyword_query,
-                    vector_queries=[vector_query],
-                    top=3,
-                    select=["id", "title", "description", "query"])
-                
-                queries = []
-                async for result in response:
-                    dashboard_query = DashboardQuery(
-                        id=result.get("id", ""),
-                        title=result.get("title", ""),
-                        description=result.get("description", ""),
-                        query=result.get("query", "")
-                    )
-                    queries.append(dashboard_query)
-                    
-                    self.logger.info(f"Found query candidate: {dashboard_query.title} - {dashboard_query.description}")
-                
-                return queries
-            
+            try:
+                return await self._search(keyword_query, vector_query)
+            except ServiceRequestError as e:
+                # The pooled connections went away, rebuild the client once and retry
+                self.logger.warning(f"Search request failed, reconnecting: {e}")
+                async with self._lock:
+                    await self._reconnect()
+                return await self._search(keyword_query, vector_query)
+
         except Exception as e:
             self.logger.error(f"Error while searching for queries: {e}")
             return []
@@ -1,8 +1,10 @@
 from openai import AsyncAzureOpenAI
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+from plugins.credentials import CredentialService, COGNITIVE_SERVICES_SCOPE
+from plugins.telemetry import telemetry
 
 class CompletionsClient:
-    def __init__(self, endpoint, engine, api_key = None):
+    def __init__(self, endpoint, engine, api_key = None, credential: CredentialService = None):
 
         api_version = "2024-12-01-preview"
 
@@ -14,9 +16,10 @@ class CompletionsClient:
                 azure_deployment=engine,
             )
         else:
-            token_provider = get_bearer_token_provider(
-                DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default"
-            )
+            if credential is not None:
+                token_provider = credential.bearer_token_provider(COGNITIVE_SERVICES_SCOPE)
+            else:
+                token_provider = get_bearer_token_provider(DefaultAzureCredential(), COGNITIVE_SERVICES_SCOPE)
 
             self.client = AsyncAzureOpenAI(
                 api_version=api_version,
@@ -27,23 +30,25 @@ class CompletionsClient:
         self.engine = engine
 
     async def aclose(self):
-        await self.client.aclose()
+        await self.client.close()
 
 
     async def generate(self, prompt: str, content: str, max_tokens: int = 300):
 
-        response = await self.client.chat.completions.create(
-            model=self.engine,
-            messages=[
-                {
-                "role": "system",
-                "content": [ {"type": "text", "text": prompt} ],
-                },
-                {
-                "role": "user",
-                "content": [ {"type": "text", "text": content} ],
-                },                
-            ],
-            max_completion_tokens=max_tokens,
-            )
+        with telemetry.span("openai.chat", deployment=self.engine) as span:
+            response = await self.client.chat.completions.create(
+                model=self.engine,
+                messages=[
+                    {
+                    "role": "system",
+                    "content": [ {"type": "text", "text": prompt} ],
+                    },
+                    {
+                    "role": "user",
+                    "content": [ {"type": "text", "text": content} ],
+                    },                
+                ],
+                max_completion_tokens=max_tokens,
+                )
+            span.set(tokens=response.usage.total_tokens if response.usage else None)
         return response.choices[0].message.content
\ No newline at end of file
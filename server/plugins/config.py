@@ -1 +1,4 @@
-COLLECTION_NAME = "FinOpsHubQueries"
\ No newline at end of file
+COLLECTION_NAME = "FinOpsHubQueries"
+INDEX_FILE = "content/dashboard_queries_index.json"
+LIBRARY_FILE = "content/dashboard_queries_library.json"
+EXPLANATION_CACHE_FILE = "content/dashboard_queries_cache.json"
\ No newline at end of file
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+from azure.core.credentials import AccessToken, AccessTokenInfo
+from azure.identity.aio import DefaultAzureCredential
+from plugins.telemetry import telemetry
+
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+MANAGEMENT_SCOPE = "https://management.azure.com/.default"
+
+
+class CredentialService:
+    """
+    One Azure credential and token cache shared by all plugins.
+
+    Tokens are cached per scope and refreshed in the background shortly
+    before they expire, so tool calls are served from the cache instead of
+    walking the credential chain (which may start an `az` subprocess).
+    The service implements the async token credential protocol and can be
+    passed wherever an azure.identity.aio credential is expected.
+    """
+
+    def __init__(self, credential=None, refresh_margin: float = 300.0, retry_interval: float = 30.0):
+        """
+        Initialize the credential service.
+
+        Args:
+            credential (optional): Async token credential, DefaultAzureCredential if not set
+            refresh_margin (float, optional): Seconds before expiry at which a token is refreshed
+            retry_interval (float, optional): Seconds between attempts when a background refresh fails
+        """
+        self.credential = credential or DefaultAzureCredential()
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.logger = logging.getLogger(__name__)
+
+        self._tokens: dict[tuple[str, ...], AccessTokenInfo] = {}
+        self._locks: dict[tuple[str, ...], asyncio.Lock] = {}
+        self._refresh_tasks: dict[tuple[str, ...], asyncio.Task] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._metrics: dict[tuple[str, ...], dict] = {}
+
+    async def get_token(self, *scopes: str, **kwargs) -> AccessToken:
+        token = await self.get_token_info(*scopes)
+        return AccessToken(token.token, token.expires_on)
+
+    async def get_token_info(self, *scopes: str, options=None) -> AccessTokenInfo:
+        """
+        Returns a token for the given scopes, from the cache if it is still valid.
+        """
+        key = tuple(sorted(scopes))
+        self._loop = asyncio.get_running_loop()
+
+        token = self._tokens.get(key)
+        if token is not None and token.expires_on - time.time() > self.refresh_margin:
+            self._stats(key)["hits"] += 1
+            return token
+
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            token = self._tokens.get(key)
+            if token is None or token.expires_on - time.time() <= self.refresh_margin:
+                token = await self._acquire(key)
+            else:
+                self._stats(key)["hits"] += 1
+
+        if key not in self._refresh_tasks:
+            self._refresh_tasks[key] = asyncio.create_task(self._refresh(key))
+        return token
+
+    def bearer_token_provider(self, *scopes: str) -> Callable[[], Awaitable[str]]:
+        """
+        Returns an async callable producing bearer tokens, e.g. for the
+        azure_ad_token_provider of the OpenAI client.
+        """
+        async def provider() -> str:
+            return (await self.get_token_info(*scopes)).token
+        return provider
+
+    def shared(self) -> "SharedCredential":
+        """
+        Returns an async credential backed by this service whose close() does
+        nothing, for SDK clients that close the credential they were given.
+        """
+        return SharedCredential(self)
+
+    def sync(self) -> "SyncCredentialAdapter":
+        """
+        Returns a synchronous credential backed by this service, for SDK
+        clients without async support.
+        """
+        return SyncCredentialAdapter(self)
+
+    def cached_token(self, *scopes: str) -> AccessTokenInfo | None:
+        token = self._tokens.get(tuple(sorted(scopes)))
+        if token is not None and token.expires_on - time.time() > 0:
+            return token
+        return None
+
+    def stats(self) -> dict:
+        """
+        Token acquisition statistics per scope.
+        """
+        result = {}
+        for key, stats in self._metrics.items():
+            token = self._tokens.get(key)
+            acquisitions = stats["acquisitions"]
+            result[" ".join(key)] = {
+                **{k: round(v, 4) if isinstance(v, float) else v for k, v in stats.items()},
+                "mean_acquisition_seconds": round(stats["acquisition_seconds"] / acquisitions, 4) if acquisitions else None,
+                "expires_in_seconds": round(token.expires_on - time.time()) if token else None,
+            }
+        return result
+
+    async def _acquire(self, key: tuple[str, ...]) -> AccessTokenInfo:
+        stats = self._stats(key)
+        start = time.perf_counter()
+        try:
+            with telemetry.span("credential.token", scopes=" ".join(key)):
+                if hasattr(self.credential, "get_token_info"):
+                    token = await self.credential.get_token_info(*key)
+                else:
+                    legacy = await self.credential.get_token(*key)
+                    token = AccessTokenInfo(legacy.token, legacy.expires_on)
+        except Exception:
+            stats["failures"] += 1
+            raise
+
+        elapsed = time.perf_counter() - start
+        stats["acquisitions"] += 1
+        stats["acquisition_seconds"] += elapsed
+        stats["max_acquisition_seconds"] = max(stats["max_acquisition_seconds"], elapsed)
+        stats["last_acquisition_seconds"] = elapsed
+        self._tokens[key] = token
+        self.logger.info(f"Acquired token for {' '.join(key)} in {elapsed:.3f}s")
+        return token
+
+    async def _refresh(self, key: tuple[str, ...]):
+        # keeps the token of a scope fresh once it has been requested
+        while True:
+            token = self._tokens.get(key)
+            delay = token.expires_on - time.time() - self.refresh_margin if token else 0
+            await asyncio.sleep(max(delay, 1.0))
+            try:
+                async with self._locks[key]:
+                    await self._acquire(key)
+                self._stats(key)["background_refreshes"] += 1
+            except Exception as e:
+                self.logger.warning(f"Background refresh of token for {' '.join(key)} failed: {e}")
+                await asyncio.sleep(self.retry_interval)
+
+    def _stats(self, key: tuple[str, ...]) -> dict:
+        stats = self._metrics.get(key)
+        if stats is None:
+            stats = self._metrics[key] = {
+                "hits": 0,
+                "acquisitions": 0,
+                "background_refreshes": 0,
+                "failures": 0,
+                "acquisition_seconds": 0.0,
+                "max_acquisition_seconds": 0.0,
+                "last_acquisition_seconds": None,
+            }
+        return stats
+
+    async def close(self):
+        for task in self._refresh_tasks.values():
+            task.cancel()
+        self._refresh_tasks.clear()
+        await self.credential.close()
+
+    async def aclose(self):
+        await self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+class SharedCredential:
+    """
+    Async token credential served by a CredentialService without owning it:
+    closing it, e.g. when an SDK client is closed, leaves the service open
+    for the other plugins. The service is closed only by its owner.
+    """
+
+    def __init__(self, service: CredentialService):
+        self.service = service
+
+    async def get_token(self, *scopes: str, **kwargs) -> AccessToken:
+        return await self.service.get_token(*scopes, **kwargs)
+
+    async def get_token_info(self, *scopes: str, options=None) -> AccessTokenInfo:
+        return await self.service.get_token_info(*scopes, options=options)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class SyncCredentialAdapter:
+    """
+    Synchronous token credential served by a CredentialService. Cached tokens
+    are returned directly; otherwise the token is acquired on the service's
+    event loop, so the adapter must not be called from the loop's own thread.
+    """
+
+    def __init__(self, service: CredentialService):
+        self.service = service
+
+    def get_token(self, *scopes: str, **kwargs) -> AccessToken:
+        token = self.get_token_info(*scopes)
+        return AccessToken(token.token, token.expires_on)
+
+    def get_token_info(self, *scopes: str, options=None) -> AccessTokenInfo:
+        token = self.service.cached_token(*scopes)
+        if token is not None:
+            return token
+
+        loop = self.service._loop
+        if loop is None or not loop.is_running():
+            raise RuntimeError("The credential service has no running event loop to acquire tokens on")
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("Synchronous token requests on the event loop thread would block it, use the async client")
+        return asyncio.run_coroutine_threadsafe(self.service.get_token_info(*scopes), loop).result()
+
+    def close(self):
+        pass
@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+# keys per SELECT, below SQLite's limit on bound parameters
+SQLITE_BATCH = 500
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: a bounded in-memory LRU in front of an optional
+    SQLite store on disk, keyed by deployment name and normalized text.
+
+    The SQLite store is only accessed from a single worker thread, so disk
+    reads and commits do not block the event loop. Lookups and writes are
+    made for all texts of a request at once, with one commit per write;
+    access times of disk hits are recorded with the next write.
+    """
+
+    def __init__(self, max_entries: int = 1024, path: str = None, max_disk_entries: int = 100000):
+        """
+        Initialize the embedding cache.
+
+        Args:
+            max_entries (int, optional): Maximum number of embeddings kept in memory
+            path (str, optional): SQLite file for the on-disk tier, disabled if not set
+            max_disk_entries (int, optional): Maximum number of embeddings kept on disk
+        """
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.logger = logging.getLogger(__name__)
+
+        self.memory: OrderedDict[str, List[float]] = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.db = None
+        self.disk_entries = 0
+        self._disk_thread = None
+        self._touched: Dict[str, float] = {}
+        if path:
+            self._disk_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-cache")
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, accessed REAL NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)")
+            self.db.commit()
+            self.disk_entries = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self.logger.info(f"Opened embedding cache {path} with {self.disk_entries} entries")
+
+    @staticmethod
+    def key(engine: str, text: str) -> str:
+        """
+        Build the cache key for a text embedded by the given deployment.
+        Case and whitespace differences do not produce distinct keys.
+        """
+        normalized = " ".join(text.split()).casefold()
+        return hashlib.sha256(f"{engine}\n{normalized}".encode("utf-8")).hexdigest()
+
+    async def get_many(self, keys: List[str]) -> List[List[float] | None]:
+        """
+        Returns the cached embedding of each key, None for keys not in either tier.
+        """
+        vectors = [self.memory.get(k) for k in keys]
+        for k, v in zip(keys, vectors):
+            if v is not None:
+                self.memory.move_to_end(k)
+                self.hits += 1
+
+        missing = list(dict.fromkeys(k for k, v in zip(keys, vectors) if v is None))
+        if missing and self.db is not None:
+            found = await self._on_disk_thread(self._read, missing)
+            now = time.time()
+            for k, v in found.items():
+                self._remember(k, v)
+                self._touched[k] = now
+                self.disk_hits += 1
+            vectors = [v if v is not None else found.get(k) for k, v in zip(keys, vectors)]
+
+        self.misses += sum(1 for v in vectors if v is None)
+        return vectors
+
+    async def put_many(self, vectors: Dict[str, List[float]]):
+        """
+        Stores embeddings in both tiers, writing them to disk in one transaction.
+        """
+        for k, v in vectors.items():
+            self._remember(k, v)
+
+        if self.db is not None and vectors:
+            touched, self._touched = self._touched, {}
+            await self._on_disk_thread(self._write, list(vectors.items()), touched)
+
+    async def _on_disk_thread(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._disk_thread, function, *args)
+
+    def _read(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        for i in range(0, len(keys), SQLITE_BATCH):
+            batch = keys[i:i + SQLITE_BATCH]
+            rows = self.db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            found.update((key, array('d', vector).tolist()) for key, vector in rows)
+        return found
+
+    def _write(self, items: List[tuple[str, List[float]]], touched: Dict[str, float]):
+        keys = [k for k, _ in items]
+        existing = 0
+        for i in range(0, len(keys), SQLITE_BATCH):
+            batch = keys[i:i + SQLITE_BATCH]
+            existing += self.db.execute(
+                f"SELECT COUNT(*) FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+            ).fetchone()[0]
+
+        now = time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, accessed) VALUES (?, ?, ?)",
+            [(k, array('d', v).tobytes(), now) for k, v in items]
+        )
+        self.disk_entries += len(keys) - existing
+        self._update_accessed(touched)
+
+        # evict the least recently used entries once the store is over its size
+        if self.disk_entries > self.max_disk_entries:
+            overflow = self.disk_entries - self.max_disk_entries
+            self.db.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY accessed LIMIT ?)",
+                (overflow,)
+            )
+            self.disk_entries -= overflow
+        self.db.commit()
+
+    def _update_accessed(self, touched: Dict[str, float]):
+        if touched:
+            self.db.executemany("UPDATE embeddings SET accessed = ? WHERE key = ?",
+                                [(accessed, key) for key, accessed in touched.items()])
+
+    def _remember(self, key: str, vector: List[float]):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss counters and the size of both tiers.
+        """
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_entries": self.disk_entries,
+        }
+
+    def close(self):
+        if self.db is not None:
+            touched, self._touched = self._touched, {}
+            self._disk_thread.submit(self._close, touched).result()
+            self._disk_thread.shutdown()
+            self.db = None
+
+    def _close(self, touched: Dict[str, float]):
+        self._update_accessed(touched)
+        self.db.commit()
+        self.db.close()
\ No newline at end of file
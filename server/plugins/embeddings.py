@@ -1,11 +1,21 @@
+import asyncio
 from openai import AsyncAzureOpenAI
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+from plugins.embeddingcache import EmbeddingCache
+from plugins.credentials import CredentialService, COGNITIVE_SERVICES_SCOPE
+from plugins.telemetry import telemetry
 
 class EmbeddingsClient:
     """
     Calculates embeddings for a given text using the Azure OpenAI embeddings endpoint.
+    Results are served from the optional EmbeddingCache when available.
+
+    When batch_size is greater than 1, concurrent requests are coalesced: texts
+    are held for up to batch_linger_ms or until batch_size texts are queued,
+    sent as one request and the vectors are handed back to each caller.
     """
-    def __init__(self, endpoint, engine, api_key = None):
+    def __init__(self, endpoint, engine, api_key = None, cache: EmbeddingCache = None,
+                 batch_size: int = 1, batch_linger_ms: float = 5.0, credential: CredentialService = None):
 
         api_version = "2024-07-01-preview"
 
@@ -17,9 +27,10 @@ class EmbeddingsClient:
                 azure_deployment=engine,
             )
         else:
-            token_provider = get_bearer_token_provider(
-                DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default"
-            )
+            if credential is not None:
+                token_provider = credential.bearer_token_provider(COGNITIVE_SERVICES_SCOPE)
+            else:
+                token_provider = get_bearer_token_provider(DefaultAzureCredential(), COGNITIVE_SERVICES_SCOPE)
 
             self.client = AsyncAzureOpenAI(
                 api_version=api_version,
@@ -28,7 +39,88 @@ class EmbeddingsClient:
                 azure_deployment=engine,
             )
         self.engine = engine
+        self.cache = cache
+        self.batch_size = batch_size
+        self.batch_linger = batch_linger_ms / 1000
+
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._batches: set[asyncio.Task] = set()
+        self.requests = 0
+
+    async def aclose(self):
+        await self.client.close()
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.close)
 
     async def get_embedding(self, text: str | list[str]):
-        response = await self.client.embeddings.create(input=text, model=self.engine)
+        texts = [text] if isinstance(text, str) else list(text)
+        if self.cache is None:
+            return await self._create(texts)
+
+        keys = [EmbeddingCache.key(self.engine, t) for t in texts]
+        vectors = await self.cache.get_many(keys)
+
+        # request each distinct uncached text once
+        missing = {}
+        for k, t, v in zip(keys, texts, vectors):
+            if v is None:
+                missing.setdefault(k, t)
+
+        if missing:
+            fetched = dict(zip(missing, await self._create(list(missing.values()))))
+            await self.cache.put_many(fetched)
+            vectors = [v if v is not None else fetched[k] for k, v in zip(keys, vectors)]
+
+        return vectors
+
+    async def _create(self, texts: list[str]):
+        if self.batch_size <= 1:
+            return await self._request(texts)
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_linger, self._flush)
+
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        pending, self._pending = self._pending, []
+        for i in range(0, len(pending), self.batch_size):
+            task = asyncio.create_task(self._send_batch(pending[i:i + self.batch_size]))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _send_batch(self, batch: list[tuple[str, asyncio.Future]]):
+        # identical texts queued by different callers are embedded once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = dict(zip(texts, await self._request(texts)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[text])
+
+    async def _request(self, texts: list[str]):
+        self.requests += 1
+        with telemetry.span("openai.embeddings", deployment=self.engine) as span:
+            response = await self.client.embeddings.create(input=texts, model=self.engine)
+            span.set(texts=len(texts), tokens=response.usage.total_tokens if response.usage else None)
         return list(map(lambda x: x.embedding, response.data))
\ No newline at end of file
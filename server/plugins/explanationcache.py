@@ -0,0 +1,68 @@
+import hashlib
+import json
+import logging
+import os
+from typing import List
+
+
+class ExplanationCache:
+    """
+    Content-addressed store of query explanations and embeddings used when
+    re-parsing the dashboard. Entries are keyed by a hash of the fully
+    expanded query and the prompt version, so unchanged and duplicate
+    queries are explained and embedded only once.
+    """
+
+    def __init__(self, path: str, prompt_version: str):
+        """
+        Initialize the cache.
+
+        Args:
+            path (str): JSON file backing the cache
+            prompt_version (str): Identifier of the prompt and models producing the entries
+        """
+        self.path = path
+        self.prompt_version = prompt_version
+        self.logger = logging.getLogger(__name__)
+        self.entries: dict[str, dict] = {}
+        self.used: set[str] = set()
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get("entries", {})
+            self.logger.info(f"Loaded {len(self.entries)} cached explanations from {path}")
+
+    @staticmethod
+    def version(*parts: str) -> str:
+        """
+        Builds a prompt version identifier from the prompt text and model names.
+        """
+        return hashlib.sha256("\n".join(p or "" for p in parts).encode("utf-8")).hexdigest()[:16]
+
+    def key(self, query: str) -> str:
+        return hashlib.sha256(f"{self.prompt_version}\n{query}".encode("utf-8")).hexdigest()
+
+    def get_explanation(self, key: str) -> str | None:
+        self.used.add(key)
+        entry = self.entries.get(key)
+        return entry["description"] if entry else None
+
+    def put_explanation(self, key: str, description: str):
+        self.used.add(key)
+        self.entries[key] = {"description": description, "vectors": {}}
+
+    def get_vector(self, key: str, title: str) -> List[float] | None:
+        entry = self.entries.get(key)
+        return entry["vectors"].get(title) if entry else None
+
+    def put_vector(self, key: str, title: str, vector: List[float]):
+        self.entries[key]["vectors"][title] = vector
+
+    def save(self):
+        """
+        Writes the entries used in this run, dropping stale ones.
+        """
+        entries = {k: v for k, v in self.entries.items() if k in self.used}
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"entries": entries}, f)
+        self.logger.info(f"Saved {len(entries)} cached explanations to {self.path}")
\ No newline at end of file
@@ -0,0 +1,109 @@
+import math
+import re
+from collections import Counter
+from typing import Iterable, List
+import numpy as np
+from plugins.telemetry import telemetry
+
+_WORD = re.compile(r"[A-Za-z0-9_]+")
+_WORD_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lowercase terms. Identifiers are kept whole and also
+    split into their camelCase and snake_case parts, so that `EffectiveCost`
+    matches both `EffectiveCost` and `effective cost`.
+    """
+    terms = []
+    for word in _WORD.findall(text):
+        terms.append(word.lower())
+        parts = _WORD_PART.findall(word)
+        if len(parts) > 1:
+            terms.extend(p.lower() for p in parts)
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[int]], k: int = 60) -> List[tuple[int, float]]:
+    """
+    Combines rankings of document positions into one, scoring each document
+    with the sum of 1 / (k + rank) over the rankings it appears in.
+
+    Returns:
+        List[tuple[int, float]]: Document positions and fused scores, best first
+    """
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking, start=1):
+            scores[position] = scores.get(position, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 index. Postings are kept as NumPy arrays, so a search
+    touches only the documents containing the query terms.
+    """
+
+    def __init__(self, documents: List[str], k1: float = 1.2, b: float = 0.75):
+        """
+        Build the index.
+
+        Args:
+            documents (List[str]): Document texts, addressed by their position
+            k1 (float, optional): Term frequency saturation
+            b (float, optional): Document length normalization
+        """
+        self.size = len(documents)
+        postings: dict[str, tuple[List[int], List[int]]] = {}
+        lengths = np.zeros(self.size, dtype=np.float32)
+
+        for position, document in enumerate(documents):
+            terms = tokenize(document)
+            lengths[position] = len(terms)
+            for term, count in Counter(terms).items():
+                docs, counts = postings.setdefault(term, ([], []))
+                docs.append(position)
+                counts.append(count)
+
+        average = float(lengths.mean()) if self.size and lengths.mean() > 0 else 1.0
+        self.k1 = k1
+        self.norms = k1 * (1 - b + b * lengths / average)
+        self.postings = {
+            term: (
+                np.asarray(docs, dtype=np.int32),
+                np.asarray(counts, dtype=np.float32),
+                math.log(1 + (self.size - len(docs) + 0.5) / (len(docs) + 0.5)),
+            )
+            for term, (docs, counts) in postings.items()
+        }
+
+    def search(self, text: str, limit: int) -> List[tuple[int, float]]:
+        """
+        Find the documents best matching the terms of the given text.
+
+        Args:
+            text (str): Search text
+            limit (int): Maximum number of results
+
+        Returns:
+            List[tuple[int, float]]: Document positions and BM25 scores, best first
+        """
+        if limit <= 0:
+            return []
+
+        with telemetry.span("keywordindex.search") as span:
+            scores = np.zeros(self.size, dtype=np.float32)
+            for term in set(tokenize(text)):
+                posting = self.postings.get(term)
+                if posting is None:
+                    continue
+                docs, counts, idf = posting
+                scores[docs] += idf * counts * (self.k1 + 1) / (counts + self.norms[docs])
+
+            matches = np.flatnonzero(scores)
+            if matches.size > limit:
+                matches = matches[np.argpartition(-scores[matches], limit - 1)[:limit]]
+            matches = matches[np.argsort(-scores[matches])]
+            span.set(documents=matches.size)
+        return [(int(i), float(scores[i])) for i in matches]
@@ -1,7 +1,16 @@
-from azure.kusto.data import KustoClient, KustoConnectionStringBuilder
-from azure.kusto.data.exceptions import KustoServiceError
-from azure.kusto.data.helpers import dataframe_from_result_table
+from azure.kusto.data import KustoClient, KustoConnectionStringBuilder, ClientRequestProperties
+from azure.kusto.data.aio import KustoClient as AsyncKustoClient
+from azure.kusto.data.exceptions import KustoServiceError, KustoStreamingQueryError
+from azure.kusto.data.helpers import dataframe_from_result_table, default_dict
 from azure.identity import DefaultAzureCredential
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+from datetime import timedelta
+from typing import AsyncIterator, List
+from plugins.resultcache import QueryResultCache
+from plugins.credentials import CredentialService
+from plugins.telemetry import telemetry
+import asyncio
+import time
 import pandas as pd
 import logging
 
@@ -10,23 +19,53 @@ class KustoQueryExecutor:
     """
     A class for executing Kusto queries against an Azure Data Explorer (ADX) cluster.
     Uses DefaultAzureCredential for authentication.
+
+    The *_async methods run on the asynchronous Kusto client, so a slow query does
+    not block the event loop. They share a limit on concurrent queries and cancel
+    queries that exceed the timeout, both on the client and on the cluster.
+    Query results may be served from a QueryResultCache, which is invalidated
+    when the latest ingestion time reported by the watermark query advances.
+    The watermark is checked in the background at most every watermark_interval
+    seconds, so cache hits do not wait for a Kusto round trip.
     """
+
+    DEFAULT_WATERMARK_QUERY = "Costs() | summarize LastIngestion = max(ingestion_time())"
     
-    def __init__(self, cluster_url: str, database: str = None):
+    def __init__(self, cluster_url: str, database: str = None, max_concurrency: int = 4, query_timeout: float = 120.0,
+                 result_cache: QueryResultCache = None, watermark_query: str = DEFAULT_WATERMARK_QUERY,
+                 watermark_interval: float = 60.0, credential: CredentialService = None):
         """
         Initialize the Kusto Query Executor.
         
         Args:
             cluster_url (str): The ADX cluster URL (e.g., 'https://help.kusto.windows.net')
             database (str, optional): Default database name to use for queries
+            max_concurrency (int, optional): Maximum number of concurrent asynchronous queries
+            query_timeout (float, optional): Default timeout of asynchronous queries in seconds
+            result_cache (QueryResultCache, optional): Cache for results of asynchronous queries
+            watermark_query (str, optional): Query returning the latest ingestion time of the hub
+            watermark_interval (float, optional): Minimum seconds between two watermark checks
+            credential (CredentialService, optional): Shared credential service, DefaultAzureCredential if not set
         """
         self.cluster_url = cluster_url
         self.database = database
+        self.query_timeout = query_timeout
         self.logger = logging.getLogger(__name__)
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.credential = credential
+        self._async_credential = None
+        self._async_client = None
+
+        self.result_cache = result_cache
+        self.watermark_query = watermark_query
+        self.watermark_interval = watermark_interval
+        self._watermark_checked = 0.0
+        self._watermark_task: asyncio.Task | None = None
         
         # Initialize the connection string with DefaultAzureCredential
         self.kcsb = KustoConnectionStringBuilder.with_azure_token_credential(
-            cluster_url, DefaultAzureCredential()
+            cluster_url, credential.sync() if credential is not None else DefaultAzureCredential()
         )
         
         # Create the Kusto client
@@ -53,10 +92,11 @@ class KustoQueryExecutor:
             
         try:
             self.logger.info(f"Executing query against database: {db_name}")
-            response = self.client.execute(db_name, query)
+            with telemetry.span("kusto.query", database=db_name):
+                response = self.client.execute(db_name, query)
             
             # Convert to pandas DataFrame
-            df = dataframe_from_result_table(response.primary_results[0])
+            df = self._dataframe(response.primary_results[0])
             self.logger.info(f"Query executed successfully, returned {len(df)} rows")
             return df
             
@@ -84,10 +124,11 @@ class KustoQueryExecutor:
             
         try:
             self.logger.info(f"Executing management command against database: {db_name}")
-            response = self.client.execute_mgmt(db_name, command)
+            with telemetry.span("kusto.mgmt", database=db_name):
+                response = self.client.execute_mgmt(db_name, command)
             
             # Convert to pandas DataFrame
-            df = dataframe_from_result_table(response.primary_results[0])
+            df = self._dataframe(response.primary_results[0])
             self.logger.info(f"Management command executed successfully")
             return df
             
@@ -154,4 +195,318 @@ class KustoQueryExecutor:
         """
         if hasattr(self.client, 'close'):
             self.client.close()
-            self.logger.info("Kusto client connection closed")
\ No newline at end of file
+            self.logger.info("Kusto client connection closed")
+
+    def _get_async_client(self) -> AsyncKustoClient:
+        # created on first use, as the client binds to the running event loop
+        if self._async_client is None:
+            if self.credential is None:
+                self._async_credential = AsyncDefaultAzureCredential()
+            # the client closes its credential, the shared service must stay open for the other plugins
+            kcsb = KustoConnectionStringBuilder.with_azure_token_credential(
+                self.cluster_url, self.credential.shared() if self.credential is not None else self._async_credential
+            )
+            self._async_client = AsyncKustoClient(kcsb)
+        return self._async_client
+
+    async def _execute_async(self, management: bool, command: str, database: str = None, timeout: float = None):
+        db_name = database or self.database
+        if not db_name:
+            raise ValueError("Database name must be specified either in constructor or method call")
+
+        timeout = timeout or self.query_timeout
+        properties = ClientRequestProperties()
+        properties.set_option(ClientRequestProperties.request_timeout_option_name, timedelta(seconds=timeout))
+
+        client = self._get_async_client()
+        execute = client.execute_mgmt if management else client.execute_query
+
+        async with self._semaphore:
+            try:
+                with telemetry.span("kusto.mgmt" if management else "kusto.query", database=db_name):
+                    return await asyncio.wait_for(execute(db_name, command, properties), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Kusto request exceeded the timeout of {timeout} seconds")
+
+    async def execute_query_async(self, query: str, database: str = None, timeout: float = None) -> pd.DataFrame:
+        """
+        Execute a Kusto query without blocking the event loop and return results as a pandas DataFrame.
+        
+        Args:
+            query (str): The Kusto query to execute
+            database (str, optional): Database name (uses default if not specified)
+            timeout (float, optional): Timeout in seconds (uses default if not specified)
+            
+        Returns:
+            pd.DataFrame: Query results as a pandas DataFrame
+            
+        Raises:
+            KustoServiceError: If the query execution fails
+            TimeoutError: If the query does not complete within the timeout
+            ValueError: If no database is specified and no default is set
+        """
+        try:
+            db_name = database or self.database
+
+            if self.result_cache is not None:
+                self._check_watermark()
+                cache_key = QueryResultCache.key(db_name, query)
+                generation = self.result_cache.generation
+                df = await self.result_cache.get(cache_key)
+                if df is not None:
+                    self.logger.info(f"Query served from cache, returned {len(df)} rows")
+                    return df
+
+            self.logger.info(f"Executing async query against database: {db_name}")
+            response = await self._execute_async(False, query, db_name, timeout)
+
+            # Convert to pandas DataFrame
+            df = self._dataframe(response.primary_results[0])
+            self.logger.info(f"Query executed successfully, returned {len(df)} rows")
+
+            if self.result_cache is not None:
+                await self.result_cache.put(cache_key, df, generation)
+            return df
+
+        except KustoServiceError as e:
+            self.logger.error(f"Kusto query failed: {e}")
+            raise
+        except Exception as e:
+            self.logger.error(f"Unexpected error during query execution: {e}")
+            raise
+
+    async def stream_query_async(self, query: str, database: str = None, batch_size: int = 10000,
+                                 timeout: float = None) -> AsyncIterator[pd.DataFrame]:
+        """
+        Execute a Kusto query and yield its results incrementally as pandas DataFrame chunks,
+        without holding the whole response in memory. Callers may stop iterating early.
+        
+        Args:
+            query (str): The Kusto query to execute
+            database (str, optional): Database name (uses default if not specified)
+            batch_size (int, optional): Maximum number of rows per chunk
+            timeout (float, optional): Timeout in seconds (uses default if not specified)
+            
+        Yields:
+            pd.DataFrame: Consecutive chunks of the primary result, at least one (possibly empty)
+            
+        Raises:
+            KustoServiceError: If the query execution fails
+            ValueError: If no database is specified and no default is set
+        """
+        db_name = database or self.database
+        if not db_name:
+            raise ValueError("Database name must be specified either in constructor or method call")
+
+        cache_key = None
+        if self.result_cache is not None:
+            self._check_watermark()
+            cache_key = QueryResultCache.key(db_name, query)
+            generation = self.result_cache.generation
+            df = await self.result_cache.get(cache_key)
+            if df is not None:
+                self.logger.info(f"Query served from cache, returned {len(df)} rows")
+                yield df
+                return
+
+        timeout = timeout or self.query_timeout
+        properties = ClientRequestProperties()
+        properties.set_option(ClientRequestProperties.request_timeout_option_name, timedelta(seconds=timeout))
+
+        # chunks are kept for the result cache only while they fit its memory budget
+        retained = [] if cache_key is not None else None
+        retained_bytes = 0
+        rows = 0
+
+        def retain(chunk: pd.DataFrame):
+            nonlocal retained, retained_bytes
+            if retained is not None:
+                retained_bytes += int(chunk.memory_usage(deep=True).sum())
+                if retained_bytes <= self.result_cache.max_bytes:
+                    retained.append(chunk)
+                else:
+                    retained = None
+
+        async with self._semaphore:
+            self.logger.info(f"Streaming query against database: {db_name}")
+            # the whole stream, including the time the caller spends between chunks,
+            # has to complete within the timeout, so a stalled stream releases its slot
+            deadline = asyncio.get_running_loop().time() + timeout
+            with telemetry.span("kusto.stream", activate=False, database=db_name) as span:
+                try:
+                    response = await self._before(deadline, timeout, self._get_async_client().execute_streaming_query(
+                        db_name, query, timedelta(seconds=timeout), properties
+                    ))
+                    table = await self._before(deadline, timeout, self._primary_result(response))
+                    rows_iterator = table.raw_rows.__aiter__()
+
+                    finished = False
+                    while not finished:
+                        batch, finished = await self._before(deadline, timeout, self._read_rows(rows_iterator, batch_size))
+                        # at least one chunk is yielded, possibly empty
+                        if not batch and rows:
+                            break
+                        chunk = self._frame_from_rows(table.columns, batch)
+                        rows += len(chunk)
+                        span.set(rows=rows)
+                        retain(chunk)
+                        yield chunk
+
+                except KustoServiceError as e:
+                    self.logger.error(f"Kusto streaming query failed: {e}")
+                    raise
+
+        self.logger.info(f"Query streamed successfully, returned {rows} rows")
+        if retained is not None:
+            await self.result_cache.put(cache_key, pd.concat(retained, ignore_index=True), generation)
+
+    @staticmethod
+    async def _before(deadline: float, timeout: float, awaitable):
+        remaining = deadline - asyncio.get_running_loop().time()
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            return await asyncio.wait_for(awaitable, remaining)
+        except asyncio.TimeoutError:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise TimeoutError(f"Kusto request exceeded the timeout of {timeout} seconds")
+
+    @staticmethod
+    async def _primary_result(response):
+        async for table in response.iter_primary_results():
+            if table is not None:
+                return table
+            break
+        raise KustoStreamingQueryError("The streamed response has no primary result table")
+
+    @staticmethod
+    async def _read_rows(rows: AsyncIterator, count: int) -> tuple[List[list], bool]:
+        # reads up to count rows, and whether the table has ended
+        batch = []
+        while len(batch) < count:
+            try:
+                batch.append(await rows.__anext__())
+            except StopAsyncIteration:
+                return batch, True
+        return batch, False
+
+    @staticmethod
+    def _dataframe(table) -> pd.DataFrame:
+        with telemetry.span("kusto.dataframe") as span:
+            df = dataframe_from_result_table(table)
+            df.attrs["kusto_types"] = {c.column_name: c.column_type for c in table.columns}
+            span.set(rows=len(df))
+        return df
+
+    @staticmethod
+    def _frame_from_rows(columns, rows: List[list]) -> pd.DataFrame:
+        # same column conversions as dataframe_from_result_table, applied per chunk
+        with telemetry.span("kusto.dataframe") as span:
+            frame = pd.DataFrame(rows, columns=[c.column_name for c in columns])
+            converters = default_dict()
+            for column in columns:
+                converter = converters.get(column.column_type)
+                if isinstance(converter, str):
+                    frame[column.column_name] = frame[column.column_name].astype(converter)
+                elif converter is not None:
+                    frame[column.column_name] = converter(column.column_name, frame)
+            # the result store derives its Parquet schema from the Kusto column types
+            frame.attrs["kusto_types"] = {c.column_name: c.column_type for c in columns}
+            span.set(rows=len(frame))
+        return frame
+
+    def _check_watermark(self):
+        # refreshed in the background, lookups meanwhile use the last known watermark
+        now = time.monotonic()
+        if now - self._watermark_checked < self.watermark_interval or self._watermark_task is not None:
+            return
+        self._watermark_checked = now
+        self._watermark_task = asyncio.create_task(self._refresh_watermark())
+        self._watermark_task.add_done_callback(self._watermark_refreshed)
+
+    def _watermark_refreshed(self, task: asyncio.Task):
+        self._watermark_task = None
+
+    async def _refresh_watermark(self):
+        try:
+            response = await self._execute_async(False, self.watermark_query)
+            table = response.primary_results[0]
+            self.result_cache.update_watermark(table.rows[0][0] if table.rows else None)
+        except Exception as e:
+            self.logger.warning(f"Unable to read the ingestion watermark, relying on cache TTL only: {e}")
+
+    async def execute_management_command_async(self, command: str, database: str = None, timeout: float = None) -> pd.DataFrame:
+        """
+        Execute a Kusto management command without blocking the event loop.
+        
+        Args:
+            command (str): The management command to execute
+            database (str, optional): Database name (uses default if not specified)
+            timeout (float, optional): Timeout in seconds (uses default if not specified)
+            
+        Returns:
+            pd.DataFrame: Command results as a pandas DataFrame
+        """
+        try:
+            self.logger.info(f"Executing async management command against database: {database or self.database}")
+            response = await self._execute_async(True, command, database, timeout)
+
+            # Convert to pandas DataFrame
+            df = self._dataframe(response.primary_results[0])
+            self.logger.info(f"Management command executed successfully")
+            return df
+
+        except KustoServiceError as e:
+            self.logger.error(f"Kusto management command failed: {e}")
+            raise
+        except Exception as e:
+            self.logger.error(f"Unexpected error during management command execution: {e}")
+            raise
+
+    async def test_connection_async(self) -> bool:
+        """
+        Test the connection to the ADX cluster without blocking the event loop.
+        
+        Returns:
+            bool: True if connection is successful, False otherwise
+        """
+        try:
+            # Simple query to test connection
+            test_query = "print 'Connection test successful'"
+            db_name = self.database or "Hub"  # Use a default system database for testing
+
+            await self._execute_async(False, test_query, db_name)
+            self.logger.info("Connection test successful")
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Connection test failed: {e}")
+            return False
+
+    async def get_tables_async(self, database: str = None) -> pd.DataFrame:
+        """
+        Get list of tables in the specified database without blocking the event loop.
+        
+        Args:
+            database (str, optional): Database name (uses default if not specified)
+            
+        Returns:
+            pd.DataFrame: List of tables
+        """
+        command = ".show tables"
+        return await self.execute_management_command_async(command, database)
+
+    async def aclose(self):
+        """
+        Close the asynchronous Kusto client connection.
+        """
+        if self._watermark_task is not None:
+            self._watermark_task.cancel()
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+            self.logger.info("Async Kusto client connection closed")
+        if self._async_credential is not None:
+            await self._async_credential.close()
+            self._async_credential = None
\ No newline at end of file
@@ -0,0 +1,62 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+
+class LazyPlugin:
+    """
+    Holds a plugin that is created on first use. The factory imports the
+    plugin module itself, so neither the plugin nor its SDK dependencies are
+    loaded before a tool needs them.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any | Awaitable[Any]]):
+        """
+        Initialize the lazy plugin.
+
+        Args:
+            name (str): Name used in logs and the startup report
+            factory (Callable): Creates the plugin, may be a coroutine function
+        """
+        self.name = name
+        self.factory = factory
+        self.logger = logging.getLogger(__name__)
+
+        self.init_seconds: float | None = None
+        self._instance = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def created(self) -> bool:
+        return self._instance is not None
+
+    async def get(self):
+        """
+        Returns the plugin, creating it on the first call.
+        """
+        if self._instance is None:
+            async with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    instance = self.factory()
+                    if inspect.isawaitable(instance):
+                        instance = await instance
+                    self.init_seconds = time.perf_counter() - start
+                    self._instance = instance
+                    self.logger.info(f"Initialized {self.name} in {self.init_seconds:.3f}s")
+        return self._instance
+
+    async def aclose(self):
+        """
+        Closes the plugin if it has been created.
+        """
+        instance, self._instance = self._instance, None
+        if instance is None:
+            return
+        close = getattr(instance, "aclose", None) or getattr(instance, "close", None)
+        if close is not None:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
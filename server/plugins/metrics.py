@@ -1,36 +1,187 @@
-import requests
+import asyncio
+import json
 import logging
-from azure.identity import DefaultAzureCredential
+from typing import List
+import aiohttp
+from plugins.credentials import CredentialService, MANAGEMENT_SCOPE
+from plugins.telemetry import telemetry
 
 class VmMetricsClient:
-    def __init__(self):
-        self.credentials = DefaultAzureCredential()
-        self.token = self.credentials.get_token("https://management.azure.com/.default").token
+    """
+    Retrieves virtual machine metrics from Azure Monitor.
+
+    A single instance is meant to be shared: it keeps a pooled HTTP session,
+    takes its ARM token from the credential service's cache and retries
+    throttled or failed requests, honoring Retry-After.
+    """
+
+    COLUMNS = ["resource_id", "metric", "timestamp", "value"]
+
+    def __init__(self, endpoint: str = "https://management.azure.com", pool_size: int = 10,
+                 max_retries: int = 3, token_refresh_margin: float = 300.0, credential: CredentialService = None):
+        """
+        Initialize the metrics client.
+
+        Args:
+            endpoint (str, optional): Azure Resource Manager endpoint
+            pool_size (int, optional): Maximum number of pooled HTTPS connections
+            max_retries (int, optional): Retries of throttled (429) or failed (5xx) requests
+            token_refresh_margin (float, optional): Refresh margin of the credential service created if none is shared
+            credential (CredentialService, optional): Shared credential service, a service of its own
+                over DefaultAzureCredential if not set
+        """
+        self.endpoint = endpoint.rstrip('/')
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.credentials = credential or CredentialService(refresh_margin=token_refresh_margin)
+        self._owns_credential = credential is None
         self.logger = logging.getLogger(__name__)
 
-    def get_vm_metrics(self, subscription_id: str, resource_group: str, vm_name: str):
-        # Implementation for fetching VM metrics
+        self.session: aiohttp.ClientSession | None = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        return self.session
+
+    async def _get_token(self) -> str:
+        # cached and refreshed in the background by the credential service
+        return (await self.credentials.get_token(MANAGEMENT_SCOPE)).token
+
+    async def _get(self, url: str, params: dict) -> dict:
+        session = await self._get_session()
+
+        for attempt in range(self.max_retries + 1):
+            headers = {
+                'Authorization': f'Bearer {await self._get_token()}',
+                'Content-Type': 'application/json'
+            }
+            try:
+                with telemetry.span("monitor.metrics", attempt=attempt) as span:
+                    async with session.get(url, headers=headers, params=params) as response:
+                        if (response.status == 429 or response.status >= 500) and attempt < self.max_retries:
+                            retry_after = response.headers.get('Retry-After', '')
+                            delay = float(retry_after) if retry_after.isdigit() else 2 ** attempt
+                            self.logger.warning(f"Request to {url} returned {response.status}, retrying in {delay}s")
+                        else:
+                            body = await response.read()
+                            span.set(bytes=len(body))
+                            return json.loads(body)
+            except aiohttp.ClientConnectionError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = 2 ** attempt
+                self.logger.warning(f"Request to {url} failed: {e}, retrying in {delay}s")
+            await asyncio.sleep(delay)
+
+    async def get_vm_metrics(self, subscription_id: str, resource_group: str, vm_name: str,
+                             timespan: str = 'P30D', interval: str = 'PT1H', aggregation: str = 'Maximum',
+                             metric_name: str = 'Percentage CPU'):
+        """
+        Fetches a metric of a virtual machine.
+
+        Args:
+            subscription_id: Azure subscription ID
+            resource_group: Azure resource group name
+            vm_name: Name of the virtual machine
+            timespan: ISO 8601 duration or interval of the query (default 30 days)
+            interval: ISO 8601 time grain of the data points (default 1 hour)
+            aggregation: Aggregation of the data points, e.g. Maximum, Average, Minimum
+            metric_name: Name of the metric
+
+        Returns:
+            Azure Monitor metrics response
+        """
         metric_namespace = 'Microsoft.Compute/virtualMachines' # resource provider name
-        metric_name = 'Percentage CPU'
-        time_grain = 'PT1H'  # 1 hour time grain
-        time_span = 'P30D'  # 30 days timespan
+        resource_id = f'/subscriptions/{subscription_id}/resourceGroups/{resource_group}/providers/{metric_namespace}/{vm_name}'
+        return await self._get_metrics(resource_id, timespan, interval, aggregation, metric_name)
 
+    async def get_vm_metrics_batch(self, resource_ids: List[str],
+                                   timespan: str = 'P30D', interval: str = 'PT1H', aggregation: str = 'Maximum',
+                                   metric_name: str = 'Percentage CPU', max_concurrency: int = 8) -> dict:
+        """
+        Fetches a metric for many virtual machines, possibly across resource groups
+        and subscriptions, with a bounded number of concurrent requests.
+
+        Args:
+            resource_ids: ARM resource IDs of the virtual machines
+            timespan: ISO 8601 duration or interval of the query (default 30 days)
+            interval: ISO 8601 time grain of the data points (default 1 hour)
+            aggregation: Aggregation of the data points, e.g. Maximum, Average, Minimum
+            metric_name: Name of the metric
+            max_concurrency: Maximum number of concurrent requests
+
+        Returns:
+            Tidy table with one row per VM and data point ("columns" and "rows"),
+            the error message of every VM that could not be retrieved ("errors"),
+            and the VMs that were retrieved without any values, e.g. because they
+            were deallocated for the whole timespan ("no_data")
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch(resource_id: str):
+            async with semaphore:
+                return await self._get_metrics(resource_id, timespan, interval, aggregation, metric_name)
+
+        unique_ids = list(dict.fromkeys(r.rstrip('/') for r in resource_ids))
+        responses = await asyncio.gather(*[fetch(r) for r in unique_ids], return_exceptions=True)
+
+        rows = []
+        errors = {}
+        no_data = []
+        for resource_id, response in zip(unique_ids, responses):
+            if isinstance(response, Exception):
+                errors[resource_id] = str(response)
+            elif 'error' in response:
+                errors[resource_id] = response['error'].get('message', str(response['error']))
+            else:
+                vm_rows = self.tidy(resource_id, response, aggregation)
+                if all(row[3] is None for row in vm_rows):
+                    no_data.append(resource_id)
+                rows.extend(vm_rows)
+
+        self.logger.info(f"Retrieved metrics for {len(unique_ids) - len(errors)}/{len(unique_ids)} VMs, "
+                         f"{len(no_data)} without data")
+        return {
+            "columns": self.COLUMNS,
+            "rows": rows,
+            "errors": errors,
+            "no_data": no_data,
+        }
+
+    @staticmethod
+    def tidy(resource_id: str, response: dict, aggregation: str) -> List[list]:
+        """
+        Flattens an Azure Monitor metrics response into rows of
+        [resource_id, metric, timestamp, value].
+        """
+        field = aggregation[0].lower() + aggregation[1:]
+        rows = []
+        for metric in response.get('value', []):
+            name = metric.get('name', {}).get('value')
+            for series in metric.get('timeseries', []):
+                for point in series.get('data', []):
+                    rows.append([resource_id, name, point.get('timeStamp'), point.get(field)])
+        return rows
+
+    async def _get_metrics(self, resource_id: str, timespan: str, interval: str, aggregation: str, metric_name: str):
         # build request URL
-        url = f'https://management.azure.com/subscriptions/{subscription_id}/resourceGroups/{resource_group}/providers/{metric_namespace}/{vm_name}/providers/Microsoft.Insights/metrics?api-version=2023-10-01'
-        
-        # prepare headers
-        headers = {
-            'Authorization': f'Bearer {self.token}',
-            'Content-Type': 'application/json'
-        }    
+        url = f'{self.endpoint}{resource_id}/providers/Microsoft.Insights/metrics'
 
         payload = {
-            'timespan': time_span,
-            'interval': time_grain,
+            'api-version': '2023-10-01',
+            'timespan': timespan,
+            'interval': interval,
             'metricnames': metric_name,
-            'aggregation': 'Maximum'
+            'aggregation': aggregation
         }
 
         self.logger.info(f"Performing API request for {url} with payload {payload}")
-        response = requests.get(url, headers=headers, params=payload).json()
-        return response
+        return await self._get(url, payload)
+
+    async def aclose(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self._owns_credential:
+            await self.credentials.close()
@@ -0,0 +1,293 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Iterable, Iterator, List
+import ijson
+import numpy as np
+from plugins.config import INDEX_FILE, LIBRARY_FILE
+
+LIBRARY_FORMAT = "finops-query-library"
+LIBRARY_VERSION = 1
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+# rows scored per block when the vectors have to be converted to float32
+SCORE_BLOCK_ROWS = 4096
+
+
+def default_library_path() -> str:
+    """
+    Returns the most recently written of the binary and the JSON library,
+    the binary library if neither exists.
+    """
+    existing = [p for p in (LIBRARY_FILE, INDEX_FILE) if os.path.exists(p)]
+    return max(existing, key=os.path.getmtime) if existing else LIBRARY_FILE
+
+
+def vectors_path(path: str, digest: str = None) -> str:
+    """
+    Returns the path of the vector file belonging to a binary library's
+    metadata file: <library>.<digest>.npy for the vectors with the given
+    content digest, <library>.npy for libraries written without one.
+    """
+    stem = os.path.splitext(path)[0]
+    return f"{stem}.{digest}.npy" if digest else f"{stem}.npy"
+
+
+def vectors_digest(vectors: np.ndarray) -> str:
+    """
+    Returns a short content digest of a vector matrix, naming its vector file.
+    """
+    vectors = np.ascontiguousarray(vectors)
+    digest = hashlib.sha256(f"{vectors.dtype.str}{vectors.shape}".encode("ascii"))
+    digest.update(memoryview(vectors).cast("B"))
+    return digest.hexdigest()[:16]
+
+
+def is_binary_library(path: str) -> bool:
+    """
+    Tells a binary library's metadata file (a JSON object) from a JSON library (a JSON array).
+    """
+    with open(path, 'rb') as f:
+        while True:
+            c = f.read(1)
+            if not c or not c.isspace():
+                return c == b'{'
+
+
+class QueryLibrary:
+    """
+    The entries of a query library and their embeddings.
+
+    In the binary format, the embeddings are stored as a unit-length row per
+    entry in a .npy file named after a digest of its content, as float32, float16 or int8, and the title,
+    description and query of the entries in a compact JSON metadata file next
+    to it. The vector file is memory-mapped, so loading reads only the
+    metadata and memory is shared with the page cache. int8 rows are scaled
+    to the full int8 range, with the scale of each row kept in the metadata.
+    """
+
+    def __init__(self, entries: List[dict], vectors: np.ndarray, scales: np.ndarray = None):
+        """
+        Initialize the library.
+
+        Args:
+            entries (List[dict]): Title, description and query of each entry
+            vectors (np.ndarray): Unit-length embeddings, one row per entry, possibly int8-quantized
+            scales (np.ndarray, optional): Quantization scale of each row of int8 vectors
+        """
+        self.entries = entries
+        self.vectors = vectors
+        self.scales = scales
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def dimensions(self) -> int:
+        return self.vectors.shape[1] if self.vectors.ndim == 2 else 0
+
+    @classmethod
+    def from_entries(cls, items: Iterable[dict], dtype: str = "float32") -> "QueryLibrary":
+        """
+        Builds a library in memory from entries with a "vector", e.g. those of a JSON library.
+
+        Raises:
+            ValueError: If the vector type is not supported or the vectors differ in length
+        """
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector type '{dtype}', expected one of {', '.join(VECTOR_DTYPES)}")
+
+        entries = []
+        rows = []
+        for item in items:
+            entries.append({
+                "title": item.get("title", ""),
+                "description": item.get("description", ""),
+                "query": item.get("query", ""),
+            })
+            rows.append(np.asarray(item["vector"], dtype=np.float32))
+
+        if rows and len({row.shape for row in rows}) != 1:
+            raise ValueError("Library vectors differ in length")
+        vectors = np.stack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+
+        scales = None
+        if dtype == "int8":
+            peaks = np.abs(vectors).max(axis=1) if vectors.size else np.zeros(len(entries), dtype=np.float32)
+            peaks[peaks == 0] = 1.0
+            scales = (127.0 / peaks).astype(np.float32)
+            vectors = np.round(vectors * scales[:, None]).astype(np.int8)
+        else:
+            vectors = vectors.astype(dtype)
+
+        return cls(entries, np.ascontiguousarray(vectors), scales)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "QueryLibrary":
+        """
+        Loads a binary library.
+
+        Args:
+            path (str): Metadata file of the library, the vectors are read from the .npy file it names
+            mmap (bool, optional): Memory-map the vectors instead of reading them into memory
+
+        Raises:
+            ValueError: If the file is not a supported binary library
+        """
+        for attempt in range(2):
+            with open(path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            if not isinstance(metadata, dict) or metadata.get("format") != LIBRARY_FORMAT:
+                raise ValueError(f"'{path}' is not a binary query library")
+            if metadata.get("version", 0) > LIBRARY_VERSION:
+                raise ValueError(f"Query library version {metadata['version']} is not supported")
+
+            try:
+                vectors = np.load(vectors_path(path, metadata.get("vectors_digest")),
+                                  mmap_mode="r" if mmap else None, allow_pickle=False)
+                break
+            except FileNotFoundError:
+                # the library was rewritten after the metadata was read, read the new metadata
+                if attempt:
+                    raise
+        if vectors.shape[0] != len(metadata["entries"]):
+            raise ValueError(f"'{path}' has {len(metadata['entries'])} entries, but {vectors.shape[0]} vectors")
+
+        entries = [{"title": t, "description": d, "query": q} for t, d, q in metadata["entries"]]
+        scales = np.asarray(metadata["scales"], dtype=np.float32) if metadata.get("scales") is not None else None
+        return cls(entries, vectors, scales)
+
+    def save(self, path: str) -> int:
+        """
+        Writes the library in the binary format.
+
+        Args:
+            path (str): Metadata file, the vectors are written to a .npy file next to it
+
+        Returns:
+            int: Number of entries written
+        """
+        vectors = np.ascontiguousarray(self.vectors)
+        digest = vectors_digest(vectors)
+        metadata = {
+            "format": LIBRARY_FORMAT,
+            "version": LIBRARY_VERSION,
+            "dtype": str(self.vectors.dtype),
+            "dimensions": self.dimensions,
+            "count": len(self.entries),
+            "scales": self.scales.tolist() if self.scales is not None else None,
+            "vectors_digest": digest,
+            "entries": [[e["title"], e["description"], e["query"]] for e in self.entries],
+        }
+        # The vectors go to a new file named after their digest, which the
+        # metadata names; the metadata is then renamed over the old one. A
+        # reader pairs either the old metadata with the old vectors or the new
+        # metadata with the new vectors, and a server that has the old vectors
+        # memory-mapped keeps reading their inode after they are unlinked.
+        target = vectors_path(path, digest)
+        _replace_atomically(target, lambda f: np.save(f, vectors, allow_pickle=False))
+        content = json.dumps(metadata, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        _replace_atomically(path, lambda f: f.write(content))
+
+        stem = glob.escape(os.path.splitext(path)[0])
+        for stale in glob.glob(f"{stem}.npy") + glob.glob(f"{stem}.{'[0-9a-f]' * 16}.npy"):
+            if os.path.abspath(stale) != os.path.abspath(target):
+                try:
+                    os.remove(stale)
+                except OSError as e:
+                    logging.getLogger(__name__).warning(f"Unable to remove stale vector file {stale}: {e}")
+        return len(self.entries)
+
+    def vector(self, position: int) -> np.ndarray:
+        """
+        Returns the float32 embedding of an entry.
+        """
+        row = np.asarray(self.vectors[position], dtype=np.float32)
+        return row / self.scales[position] if self.scales is not None else row
+
+    def scores(self, vector: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of every entry with a unit-length float32 vector.
+        """
+        if self.vectors.dtype == np.float32:
+            return self.vectors @ vector
+
+        # converted block by block, so no float32 copy of the whole matrix is made
+        scores = np.empty(len(self.entries), dtype=np.float32)
+        for start in range(0, len(self.entries), SCORE_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ vector
+        if self.scales is not None:
+            scores /= self.scales
+        return scores
+
+    def iter_entries(self) -> Iterator[dict]:
+        """
+        Yields the entries with their float32 embedding as a list, in the shape of JSON library entries.
+        """
+        for position, entry in enumerate(self.entries):
+            yield {**entry, "vector": self.vector(position).tolist()}
+
+
+def _replace_atomically(path: str, write):
+    """
+    Writes a file through write(f) to a temporary file in the same directory and renames it over path.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def iter_library_entries(path: str) -> Iterator[dict]:
+    """
+    Streams the entries of a binary or JSON library with their vectors. A JSON
+    library is read incrementally, without loading the whole file into memory.
+    """
+    if is_binary_library(path):
+        yield from QueryLibrary.load(path).iter_entries()
+        return
+
+    with open(path, 'rb') as f:
+        yield from ijson.items(f, 'item', use_float=True)
+
+
+def convert_library(source: str, target: str, binary: bool, dtype: str = "float32") -> int:
+    """
+    Converts a library between the JSON and the binary format.
+
+    Args:
+        source (str): Library to read, in either format
+        target (str): File to write; for the binary format the metadata file
+        binary (bool): Write the binary format, otherwise JSON
+        dtype (str, optional): Vector type of the binary format: float32, float16 or int8
+
+    Returns:
+        int: Number of entries converted
+    """
+    if binary:
+        return QueryLibrary.from_entries(iter_library_entries(source), dtype).save(target)
+
+    count = 0
+    with open(target, 'w', encoding='utf-8') as f:
+        f.write("[")
+        for entry in iter_library_entries(source):
+            f.write(",\n" if count else "\n")
+            json.dump(entry, f, ensure_ascii=False)
+            count += 1
+        f.write("\n]\n")
+    return count
@@ -0,0 +1,123 @@
+import logging
+from collections import deque
+from typing import Iterable, List
+
+
+class QueryResolver:
+    """
+    Expands dashboard and workbook queries with the base queries they use.
+
+    The dependency graph between base query variables is built and
+    topologically sorted once. Each variable's dependency closure and `let`
+    statement are memoized, so resolving a query only concatenates the
+    statements it needs, dependencies first.
+    """
+
+    def __init__(self, queries: dict[str, dict], base_queries: dict[str, str]):
+        """
+        Initialize the resolver.
+
+        Args:
+            queries (dict[str, dict]): Query id to {"text", "usedVariables"}
+            base_queries (dict[str, str]): Variable name to the id of the query defining it
+
+        Raises:
+            ValueError: If base queries depend on each other in a cycle
+        """
+        self.queries = queries
+        self.logger = logging.getLogger(__name__)
+
+        self.statements: dict[str, str] = {}
+        dependencies: dict[str, List[str]] = {}
+        for variable, query_id in base_queries.items():
+            query = queries.get(query_id, {})
+            if query.get("text"):
+                self.statements[variable] = f"let {variable} = {query['text']};\n"
+            dependencies[variable] = query.get("usedVariables", [])
+
+        self.order = self._sort(dependencies)
+        self.rank = {variable: n for n, variable in enumerate(self.order)}
+
+        # closures are built in dependency order, so every dependency is already known
+        self.closures: dict[str, frozenset[str]] = {}
+        for variable in self.order:
+            closure = {variable}
+            for dependency in dependencies[variable]:
+                closure |= self.closures.get(dependency, frozenset())
+            self.closures[variable] = frozenset(closure)
+
+        self._preludes: dict[frozenset[str], str] = {}
+
+    @classmethod
+    def from_dashboard(cls, data: dict) -> "QueryResolver":
+        """
+        Builds a resolver from an ADX dashboard definition.
+        """
+        queries = {}
+        for query in data.get('queries', []):
+            query_id = query.get('id')
+            query_text = query.get('text')
+            if query_id and query_text:
+                queries[query_id] = {"text": query_text, "usedVariables": query.get('usedVariables', [])}
+
+        base_queries = {
+            query.get('variableName'): query.get('queryId')
+            for query in data.get('baseQueries', [])
+            if query.get('variableName')
+        }
+        return cls(queries, base_queries)
+
+    @staticmethod
+    def _sort(dependencies: dict[str, List[str]]) -> List[str]:
+        # Kahn's algorithm; references to unknown variables (e.g. dashboard parameters) are ignored
+        dependents: dict[str, List[str]] = {variable: [] for variable in dependencies}
+        pending = {}
+        for variable, used in dependencies.items():
+            known = {u for u in used if u in dependencies}
+            pending[variable] = len(known)
+            for dependency in known:
+                dependents[dependency].append(variable)
+
+        ready = deque(variable for variable, count in pending.items() if count == 0)
+        order = []
+        while ready:
+            variable = ready.popleft()
+            order.append(variable)
+            for dependent in dependents[variable]:
+                pending[dependent] -= 1
+                if pending[dependent] == 0:
+                    ready.append(dependent)
+
+        if len(order) != len(dependencies):
+            cycle = sorted(variable for variable, count in pending.items() if count > 0)
+            raise ValueError(f"Base queries have cyclic dependencies: {', '.join(cycle)}")
+        return order
+
+    def prelude(self, variables: Iterable[str]) -> str:
+        """
+        Returns the `let` statements defining the given variables and everything
+        they depend on, in dependency order.
+        """
+        used = frozenset(v for v in variables if v in self.closures)
+        prelude = self._preludes.get(used)
+        if prelude is None:
+            closure = set()
+            for variable in used:
+                closure |= self.closures[variable]
+            prelude = "".join(
+                self.statements[variable]
+                for variable in sorted(closure, key=self.rank.__getitem__)
+                if variable in self.statements
+            )
+            self._preludes[used] = prelude
+        return prelude
+
+    def resolve(self, query_id: str) -> str:
+        """
+        Returns the full text of a query with its base queries prepended,
+        or an empty string if the query is unknown.
+        """
+        query = self.queries.get(query_id)
+        if not query:
+            return ''
+        return self.prelude(query["usedVariables"]) + query["text"]
\ No newline at end of file
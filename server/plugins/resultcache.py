@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+import pandas as pd
+
+
+def normalize_kql(query: str) -> str:
+    """
+    Normalizes a KQL query for use as a cache key: comments are removed and
+    whitespace outside of string literals is collapsed.
+    """
+    result = []
+    i = 0
+    n = len(query)
+    pending_space = False
+    while i < n:
+        c = query[i]
+        if c in ("'", '"'):
+            # copy string literals verbatim, honoring backslash escapes
+            verbatim = i > 0 and query[i - 1] == '@'
+            j = i + 1
+            while j < n and query[j] != c:
+                j += 2 if query[j] == '\\' and not verbatim else 1
+            if pending_space and result:
+                result.append(' ')
+            pending_space = False
+            result.append(query[i:j + 1])
+            i = j + 1
+        elif c == '/' and query.startswith('//', i):
+            end = query.find('\n', i)
+            i = n if end == -1 else end
+            pending_space = True
+        elif c.isspace():
+            pending_space = True
+            i += 1
+        else:
+            if pending_space and result:
+                result.append(' ')
+            pending_space = False
+            result.append(c)
+            i += 1
+    return ''.join(result)
+
+
+class QueryResultCache:
+    """
+    Caches query results for a limited time, keyed by database and normalized
+    KQL. Entries are kept in memory up to a size limit and evicted in LRU
+    order, optionally spilling to Parquet files on disk. Spill files are
+    written and read on worker threads, so the event loop is not blocked.
+    """
+
+    def __init__(self, ttl: float = 300.0, max_bytes: int = 256 * 1024 * 1024, spill_dir: str = None):
+        """
+        Initialize the result cache.
+
+        Args:
+            ttl (float, optional): Seconds a result is served from the cache
+            max_bytes (int, optional): Memory budget for cached DataFrames
+            spill_dir (str, optional): Directory for results evicted from memory, disabled if not set
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.logger = logging.getLogger(__name__)
+
+        self.entries: OrderedDict[str, tuple[float, int, pd.DataFrame]] = OrderedDict()
+        self.spilled: dict[str, tuple[float, str]] = {}
+        self.bytes = 0
+        self.watermark = None
+        # advanced by every invalidation, results of queries started before are not stored
+        self.generation = 0
+
+        self.hits = 0
+        self.spill_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    @staticmethod
+    def key(database: str, query: str) -> str:
+        return hashlib.sha256(f"{database}\n{normalize_kql(query)}".encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> pd.DataFrame | None:
+        now = time.monotonic()
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires, size, df = entry
+            if expires > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return df
+            self._drop(key)
+
+        spilled = self.spilled.pop(key, None)
+        if spilled is not None:
+            expires, path = spilled
+            if expires > now:
+                generation = self.generation
+                df = await asyncio.to_thread(self._read_spilled, path)
+                if df is not None:
+                    await self._store(key, df, expires, generation)
+                    self.spill_hits += 1
+                    return df
+            else:
+                self._remove_file(path)
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, df: pd.DataFrame, generation: int = None):
+        """
+        Caches a result, unless the cache has been invalidated since the given
+        generation, i.e. while the query was running.
+        """
+        if generation is not None and generation != self.generation:
+            return
+        self.discard(key)
+        await self._store(key, df, time.monotonic() + self.ttl, self.generation)
+
+    def discard(self, key: str):
+        if key in self.entries:
+            self._drop(key)
+        spilled = self.spilled.pop(key, None)
+        if spilled is not None:
+            self._remove_file(spilled[1])
+
+    def update_watermark(self, watermark):
+        """
+        Records the latest ingestion watermark of the hub and drops all cached
+        results when it has advanced since the last check.
+        """
+        if watermark is None:
+            return
+        if self.watermark is not None and watermark != self.watermark:
+            self.logger.info(f"Ingestion watermark advanced to {watermark}, invalidating cached results")
+            self.invalidate()
+        self.watermark = watermark
+
+    def invalidate(self):
+        self.entries.clear()
+        self.bytes = 0
+        for _, path in self.spilled.values():
+            self._remove_file(path)
+        self.spilled.clear()
+        self.generation += 1
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.spill_hits + self.misses
+        return {
+            "hits": self.hits,
+            "spill_hits": self.spill_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.spill_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "spilled_entries": len(self.spilled),
+            "watermark": str(self.watermark) if self.watermark is not None else None,
+        }
+
+    async def _store(self, key: str, df: pd.DataFrame, expires: float, generation: int):
+        if generation != self.generation:
+            return
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            await self._spill(key, df, expires)
+            return
+
+        self.entries[key] = (expires, size, df)
+        self.bytes += size
+        evicted = []
+        while self.bytes > self.max_bytes:
+            evicted_key, (evicted_expires, _, evicted_df) = next(iter(self.entries.items()))
+            self._drop(evicted_key)
+            self.evictions += 1
+            if evicted_expires > time.monotonic():
+                evicted.append((evicted_key, evicted_df, evicted_expires))
+        for evicted_key, evicted_df, evicted_expires in evicted:
+            await self._spill(evicted_key, evicted_df, evicted_expires)
+
+    def _drop(self, key: str):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    async def _spill(self, key: str, df: pd.DataFrame, expires: float):
+        if not self.spill_dir:
+            return
+        generation = self.generation
+        path = os.path.join(self.spill_dir, f"{key}.parquet")
+        try:
+            await asyncio.to_thread(df.to_parquet, path, index=False)
+        except Exception as e:
+            self.logger.warning(f"Unable to spill cached result to {path}: {e}")
+            return
+
+        # the entry may have been invalidated or stored again while the file was written
+        if generation != self.generation or key in self.entries:
+            self._remove_file(path)
+            return
+        self.spilled[key] = (expires, path)
+
+    def _read_spilled(self, path: str) -> pd.DataFrame | None:
+        try:
+            return pd.read_parquet(path)
+        except Exception as e:
+            self.logger.warning(f"Unable to read spilled result {path}: {e}")
+            return None
+        finally:
+            self._remove_file(path)
+
+    def _remove_file(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
\ No newline at end of file
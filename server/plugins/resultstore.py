@@ -0,0 +1,297 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import aclosing
+from typing import AsyncIterator
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from plugins.telemetry import telemetry
+
+# Arrow types of the Kusto scalar types; dynamic values are stored as JSON text,
+# as their structure may differ from row to row
+KUSTO_ARROW_TYPES = {
+    "bool": pa.bool_(),
+    "boolean": pa.bool_(),
+    "int": pa.int32(),
+    "int32": pa.int32(),
+    "long": pa.int64(),
+    "int64": pa.int64(),
+    "real": pa.float64(),
+    "double": pa.float64(),
+    "decimal": pa.float64(),
+    "datetime": pa.timestamp("ns", tz="UTC"),
+    "date": pa.timestamp("ns", tz="UTC"),
+    "timespan": pa.duration("ns"),
+    "time": pa.duration("ns"),
+    "string": pa.string(),
+    "guid": pa.string(),
+    "uuid": pa.string(),
+    "uniqueid": pa.string(),
+    "dynamic": pa.string(),
+}
+
+
+def arrow_schema(df: pd.DataFrame) -> pa.Schema:
+    """
+    Returns the Arrow schema of a query result. Column types come from the
+    Kusto column types in df.attrs["kusto_types"], so they do not depend on
+    the values of the first rows; columns of unknown type are inferred, with
+    dicts and lists treated as dynamic and all-null columns as strings.
+    """
+    kusto_types = df.attrs.get("kusto_types", {})
+    fields = []
+    for name in df.columns:
+        kusto_type = kusto_types.get(name)
+        if kusto_type not in KUSTO_ARROW_TYPES:
+            kusto_type = _infer_kusto_type(df[name])
+        arrow_type = KUSTO_ARROW_TYPES.get(kusto_type) or pa.array(df[name], from_pandas=True).type
+        fields.append(pa.field(name, arrow_type, metadata={"kusto_type": kusto_type or ""}))
+    return pa.schema(fields)
+
+
+def arrow_table(df: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    """
+    Converts a chunk of a query result to the given schema, serializing dynamic columns to JSON.
+    """
+    df = df.copy(deep=False)
+    for field in schema:
+        if field.metadata and field.metadata.get(b"kusto_type") == b"dynamic":
+            df[field.name] = df[field.name].map(_to_json).astype(object)
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def _infer_kusto_type(column: pd.Series) -> str | None:
+    values = column.dropna()
+    if values.empty:
+        return "string" if column.dtype == object else None
+    if column.dtype == object and values.map(lambda v: isinstance(v, (dict, list))).any():
+        return "dynamic"
+    return None
+
+
+def _to_json(value) -> str | None:
+    if not isinstance(value, (dict, list)) and (value is None or pd.isna(value)):
+        return None
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class ResultStore:
+    """
+    Keeps large query results in local Parquet files and serves them page by
+    page through result handles, so they are neither held in memory nor sent
+    to the client in one response.
+
+    Pages are read on worker threads while handles are evicted on the event
+    loop; a handle being read is pinned, and the file of a handle discarded
+    meanwhile is removed by its last reader.
+    """
+
+    def __init__(self, directory: str, threshold: int = 5000, page_size: int = 1000,
+                 max_page_size: int = 10000, max_handles: int = 20, ttl: float = 3600.0):
+        """
+        Initialize the result store.
+
+        Args:
+            directory (str): Parent directory of the result files, each store keeps its files
+                in a subdirectory of its own, so processes sharing the directory do not interfere
+            threshold (int, optional): Results with more rows than this are stored as handles
+            page_size (int, optional): Default number of rows per page
+            max_page_size (int, optional): Maximum number of rows per page a caller may request
+            max_handles (int, optional): Maximum number of handles kept, the least recently used are evicted
+            ttl (float, optional): Seconds an unused handle is kept
+        """
+        self.threshold = threshold
+        self.page_size = page_size
+        self.max_page_size = max(max_page_size, page_size)
+        self.max_handles = max_handles
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+
+        self.handles: dict[str, dict] = {}
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix=f"results-{os.getpid()}-", dir=directory)
+
+    def store(self, df: pd.DataFrame) -> dict:
+        """
+        Writes the DataFrame to a result file and returns its handle with the first page.
+        """
+        self._evict()
+
+        handle = uuid.uuid4().hex
+        path = os.path.join(self.directory, f"{handle}.parquet")
+        table = arrow_table(df, arrow_schema(df))
+        pq.write_table(table, path, row_group_size=self.page_size)
+
+        self._register(handle, path, table.num_rows, table.schema)
+        self.logger.info(f"Stored {table.num_rows} rows as result handle {handle}")
+        return self.fetch(handle)
+
+    async def store_stream(self, chunks: AsyncIterator[pd.DataFrame]) -> pd.DataFrame | dict:
+        """
+        Consumes a stream of DataFrame chunks. Small results are returned as a
+        single DataFrame; once the threshold is exceeded, the buffered and all
+        following chunks are written to a result file as they arrive and the
+        handle with the first page is returned.
+        """
+        buffered = []
+        rows = 0
+        handle = path = writer = None
+
+        try:
+            # closed on errors too, so the query's connection slot is released right away
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    rows += len(chunk)
+                    if writer is None:
+                        buffered.append(chunk)
+                        if rows <= self.threshold:
+                            continue
+                        self._evict()
+                        handle = uuid.uuid4().hex
+                        path = os.path.join(self.directory, f"{handle}.parquet")
+                        head = pd.concat(buffered, ignore_index=True)
+                        buffered = []
+                        writer = pq.ParquetWriter(path, arrow_schema(head))
+                        table = arrow_table(head, writer.schema)
+                    else:
+                        table = arrow_table(chunk, writer.schema)
+                    with telemetry.span("resultstore.write") as span:
+                        await asyncio.to_thread(writer.write_table, table, row_group_size=self.page_size)
+                        span.set(rows=table.num_rows, bytes=table.nbytes)
+        except BaseException:
+            if writer is not None:
+                writer.close()
+                os.remove(path)
+            raise
+
+        if writer is None:
+            return pd.concat(buffered, ignore_index=True) if buffered else pd.DataFrame()
+
+        writer.close()
+        self._register(handle, path, rows, writer.schema)
+        self.logger.info(f"Stored {rows} streamed rows as result handle {handle}")
+        return await asyncio.to_thread(self.fetch, handle)
+
+    def fetch(self, handle: str, cursor: str = None, page_size: int = None) -> dict:
+        """
+        Returns a page of a stored result.
+
+        Args:
+            handle (str): Result handle
+            cursor (str, optional): Cursor returned with the previous page, first page if not set
+            page_size (int, optional): Number of rows (uses default if not specified, at most max_page_size)
+
+        Raises:
+            KeyError: If the handle is unknown or has been evicted
+            ValueError: If the cursor is invalid
+        """
+        offset = int(cursor) if cursor else 0
+        page_size = min(max(page_size or self.page_size, 1), self.max_page_size)
+
+        with self._lock:
+            entry = self.handles.get(handle)
+            if entry is None:
+                raise KeyError(f"Result handle '{handle}' does not exist or has expired")
+            if offset < 0 or offset > entry["row_count"]:
+                raise ValueError(f"Invalid cursor '{cursor}'")
+            entry["accessed"] = time.monotonic()
+            entry["readers"] += 1
+
+        try:
+            with telemetry.span("resultstore.fetch") as span:
+                df = self._read_rows(entry["path"], offset, page_size)
+                end = offset + len(df)
+                serialized = df.to_json(orient="records", date_format="iso")
+                span.set(rows=len(df), bytes=len(serialized))
+        finally:
+            with self._lock:
+                entry["readers"] -= 1
+                if entry["discarded"] and not entry["readers"]:
+                    self._remove_file(entry["path"])
+
+        return {
+            "handle": handle,
+            "row_count": entry["row_count"],
+            "columns": entry["columns"],
+            "offset": offset,
+            "rows": json.loads(serialized),
+            "next_cursor": str(end) if end < entry["row_count"] else None,
+        }
+
+    def _read_rows(self, path: str, offset: int, count: int) -> pd.DataFrame:
+        # only the row groups overlapping the requested range are read
+        parquet = pq.ParquetFile(path)
+        groups = []
+        first_row = 0
+        start = 0
+        for i in range(parquet.num_row_groups):
+            rows = parquet.metadata.row_group(i).num_rows
+            if start + rows > offset and start < offset + count:
+                if not groups:
+                    first_row = start
+                groups.append(i)
+            elif groups:
+                break
+            start += rows
+
+        if not groups:
+            return parquet.schema_arrow.empty_table().to_pandas()
+
+        table = parquet.read_row_groups(groups)
+        return table.slice(offset - first_row, count).to_pandas()
+
+    def _register(self, handle: str, path: str, rows: int, schema: pa.Schema):
+        with self._lock:
+            self.handles[handle] = {
+                "path": path,
+                "row_count": rows,
+                "columns": [{"name": f.name, "type": str(f.type)} for f in schema],
+                "accessed": time.monotonic(),
+                "readers": 0,
+                "discarded": False,
+            }
+
+    def _evict(self):
+        with self._lock:
+            now = time.monotonic()
+            expired = [h for h, e in self.handles.items() if now - e["accessed"] > self.ttl]
+            for handle in expired:
+                self.discard(handle)
+
+            while len(self.handles) >= self.max_handles:
+                handle = min(self.handles, key=lambda h: self.handles[h]["accessed"])
+                self.discard(handle)
+
+    def discard(self, handle: str):
+        with self._lock:
+            entry = self.handles.pop(handle, None)
+            if entry is None:
+                return
+            # a page being read keeps the file until its reader is done
+            entry["discarded"] = True
+            if not entry["readers"]:
+                self._remove_file(entry["path"])
+        self.logger.info(f"Discarded result handle {handle}")
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def close(self):
+        """
+        Removes all stored results and the store's own directory, not the parent directory.
+        """
+        with self._lock:
+            self.handles.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
\ No newline at end of file
@@ -0,0 +1,317 @@
+import asyncio
+import itertools
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import List
+from plugins.telemetry import telemetry
+
+INTERACTIVE = "interactive"
+EXPORT = "export"
+PRIORITIES = (INTERACTIVE, EXPORT)
+
+POLICIES = ("cap", "reject", "allow")
+
+# comments and string literals are blanked before the query is inspected
+_COMMENT_OR_LITERAL = re.compile(r"""//[^\n]*|@'[^']*'|@"[^"]*"|'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*\"""")
+_ROW_LIMIT = re.compile(r"\|\s*(?:take|limit|top|sample)\s+(\d+)")
+_AGGREGATION = re.compile(r"\|\s*(?:summarize|count)\b")
+_RENDER = re.compile(r"\|\s*render\b")
+_TIME_FILTER = re.compile(
+    r"\bwhere\b[^|]*?(?:\b(?:ago|now|datetime|startof\w+|endof\w+|ingestion_time)\s*\("
+    r"|\w*(?:PeriodStart|PeriodEnd|Date|Timestamp)\b|\bTime\w*)"
+)
+
+
+def _blank(match: re.Match) -> str:
+    # same length, so offsets in the inspected text are offsets in the query
+    return " " * len(match.group(0))
+
+
+def _top_level(text: str) -> str:
+    """
+    Blanks everything inside parentheses and braces, e.g. the subqueries of
+    join and union, function arguments and bodies, keeping the offsets of the
+    remaining text.
+    """
+    depth = 0
+    chars = []
+    for c in text:
+        if c in ")}":
+            depth = max(depth - 1, 0)
+        chars.append(c if depth == 0 or c == "\n" else " ")
+        if c in "({":
+            depth += 1
+    return "".join(chars)
+
+
+def _final_pipeline(query: str) -> tuple[str, str, int]:
+    """
+    Returns the query without comments and string literals, the top-level
+    pipeline of its final statement and the offset of that statement.
+    """
+    text = _COMMENT_OR_LITERAL.sub(_blank, query)
+    top = _top_level(text)
+    # let statements come first, only the last statement produces the result
+    start = 0
+    for match in re.finditer(";", top):
+        if top[match.end():].strip():
+            start = match.end()
+    final = top[start:].rstrip()
+    return text, final.rstrip(";"), start
+
+
+@dataclass
+class QueryPlan:
+    """
+    Outcome of the pre-analysis of a query: the query to run, possibly with a
+    row cap appended, its priority class and the issues that were found.
+    """
+    query: str
+    priority: str
+    has_time_filter: bool
+    row_limit: int | None
+    aggregated: bool
+    capped: bool = False
+    issues: List[str] = field(default_factory=list)
+
+
+def analyze_kql(query: str) -> dict:
+    """
+    Inspects a KQL query without parsing it: whether a where clause filters on
+    a time column or function, the smallest take/limit/top/sample of the final
+    statement and whether the final statement aggregates. Comments and string
+    literals are ignored, and only the top-level pipeline of the final
+    statement counts for the row limit and aggregation, not subqueries.
+    """
+    text, final, _ = _final_pipeline(query)
+    limits = [int(n) for n in _ROW_LIMIT.findall(final)]
+    return {
+        "has_time_filter": _TIME_FILTER.search(text) is not None,
+        "row_limit": min(limits) if limits else None,
+        "aggregated": _AGGREGATION.search(final) is not None,
+    }
+
+
+def cap_rows(query: str, rows: int) -> str:
+    """
+    Appends `| take rows` to the final statement of a query, before a
+    trailing render operator, which has to stay the last one.
+    """
+    _, final, start = _final_pipeline(query)
+    renders = list(_RENDER.finditer(final))
+    # on a new line, so a trailing comment does not swallow the cap
+    if renders:
+        position = start + renders[-1].start()
+        return f"{query[:position].rstrip()}\n| take {rows}\n{query[position:]}"
+    return f"{query.rstrip().rstrip(';')}\n| take {rows}"
+
+
+class _Waiter:
+    def __init__(self, client_id: str, priority: str, sequence: int):
+        self.client_id = client_id
+        self.priority = priority
+        self.sequence = sequence
+        self.enqueued = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class QueryScheduler:
+    """
+    Admission control in front of the Kusto query executor.
+
+    Queries are pre-analyzed: unless they aggregate or have a take/limit/top,
+    they get a default row cap, and depending on the policy, queries without a time filter are
+    rejected. Admitted queries wait for a slot under a global and a per-client
+    concurrency limit. Waiting interactive queries (time-filtered and either
+    aggregated or limited to few rows) are started before exports; exports
+    that have waited longer than aging_seconds are treated as interactive, so
+    they are not starved.
+    """
+
+    def __init__(self, max_concurrency: int = 4, per_client_concurrency: int = 2, max_queue: int = 100,
+                 policy: str = "cap", row_cap: int = 100000, interactive_rows: int = 1000,
+                 aging_seconds: float = 30.0):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_concurrency (int, optional): Maximum number of queries running at the same time
+            per_client_concurrency (int, optional): Maximum number of queries of one client running at the same time
+            max_queue (int, optional): Maximum number of waiting queries, further queries are rejected
+            policy (str, optional): "cap" appends a row cap to queries without a row limit, "reject" also
+                rejects queries without a time filter, "allow" runs queries unchanged
+            row_cap (int, optional): Row cap appended to queries without a row limit
+            interactive_rows (int, optional): Row limit up to which a time-filtered query is interactive
+            aging_seconds (float, optional): Seconds after which a waiting export is treated as interactive
+
+        Raises:
+            ValueError: If the policy is unknown
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown query policy '{policy}', expected one of {', '.join(POLICIES)}")
+
+        self.max_concurrency = max_concurrency
+        self.per_client_concurrency = per_client_concurrency
+        self.max_queue = max_queue
+        self.policy = policy
+        self.row_cap = row_cap
+        self.interactive_rows = interactive_rows
+        self.aging_seconds = aging_seconds
+        self.logger = logging.getLogger(__name__)
+
+        self._waiting: list[_Waiter] = []
+        self._running: dict[str, int] = {}
+        self._sequence = itertools.count()
+
+        self.admitted = 0
+        self.capped = 0
+        self.rejected = 0
+        self.queue_full = 0
+        self._times = {p: {"queries": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "run_seconds": 0.0}
+                       for p in PRIORITIES}
+
+    def plan(self, query: str) -> QueryPlan:
+        """
+        Analyzes a query and applies the policy.
+
+        Args:
+            query (str): KQL query
+
+        Returns:
+            QueryPlan: The query to run and its priority class
+
+        Raises:
+            ValueError: If the policy rejects the query
+        """
+        analysis = analyze_kql(query)
+        plan = QueryPlan(query=query, priority=EXPORT, **analysis)
+
+        if not plan.has_time_filter:
+            plan.issues.append("no time filter")
+        if plan.row_limit is None and not plan.aggregated:
+            plan.issues.append("no take/limit/top")
+
+        if self.policy == "reject" and not plan.has_time_filter:
+            self.rejected += 1
+            raise ValueError(
+                "Query rejected: it does not filter on time. Add a where clause on a date column, "
+                "e.g. | where ChargePeriodStart >= ago(30d)"
+            )
+
+        # aggregated results are small already, and capping could cut off groups
+        if self.policy != "allow" and plan.row_limit is None and not plan.aggregated:
+            plan.query = cap_rows(query, self.row_cap)
+            plan.row_limit = self.row_cap
+            plan.capped = True
+            self.capped += 1
+
+        if plan.has_time_filter and (plan.aggregated or (plan.row_limit or self.row_cap) <= self.interactive_rows):
+            plan.priority = INTERACTIVE
+
+        if plan.issues:
+            self.logger.info(f"Query admitted as {plan.priority} with issues: {', '.join(plan.issues)}"
+                             f"{f', capped at {self.row_cap} rows' if plan.capped else ''}")
+        return plan
+
+    @asynccontextmanager
+    async def slot(self, client_id: str, priority: str = INTERACTIVE):
+        """
+        Waits until the query may run and holds its slot while the block runs.
+
+        Args:
+            client_id (str): Identity of the calling client
+            priority (str, optional): Priority class, interactive or export
+
+        Raises:
+            RuntimeError: If too many queries are waiting
+        """
+        client_id = client_id or "anonymous"
+        if len(self._waiting) >= self.max_queue:
+            self.queue_full += 1
+            raise RuntimeError(f"Too many queries are waiting ({len(self._waiting)}), please retry later")
+
+        waiter = _Waiter(client_id, priority, next(self._sequence))
+        self._waiting.append(waiter)
+        self._dispatch()
+
+        try:
+            with telemetry.span(f"scheduler.wait.{priority}"):
+                await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiting:
+                self._waiting.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # the slot was granted as the caller was cancelled
+                self._release(client_id)
+            raise
+
+        waited = time.monotonic() - waiter.enqueued
+        self.admitted += 1
+        times = self._times[priority]
+        times["queries"] += 1
+        times["wait_seconds"] += waited
+        times["max_wait_seconds"] = max(times["max_wait_seconds"], waited)
+
+        started = time.monotonic()
+        try:
+            with telemetry.span(f"scheduler.run.{priority}"):
+                yield
+        finally:
+            times["run_seconds"] += time.monotonic() - started
+            self._release(client_id)
+
+    def stats(self) -> dict:
+        """
+        Running and waiting queries, admission counters and queue wait and run times per priority class.
+        """
+        return {
+            "policy": self.policy,
+            "running": sum(self._running.values()),
+            "running_per_client": dict(self._running),
+            "waiting": {p: sum(1 for w in self._waiting if w.priority == p) for p in PRIORITIES},
+            "admitted": self.admitted,
+            "capped": self.capped,
+            "rejected": self.rejected,
+            "queue_full": self.queue_full,
+            "priorities": {
+                p: {
+                    "queries": t["queries"],
+                    "mean_wait_seconds": round(t["wait_seconds"] / t["queries"], 4) if t["queries"] else None,
+                    "max_wait_seconds": round(t["max_wait_seconds"], 4),
+                    "mean_run_seconds": round(t["run_seconds"] / t["queries"], 4) if t["queries"] else None,
+                }
+                for p, t in self._times.items()
+            },
+        }
+
+    def _release(self, client_id: str):
+        self._running[client_id] -= 1
+        if not self._running[client_id]:
+            del self._running[client_id]
+        self._dispatch()
+
+    def _dispatch(self):
+        running = sum(self._running.values())
+        if running >= self.max_concurrency or not self._waiting:
+            return
+
+        now = time.monotonic()
+        order = sorted(self._waiting, key=lambda w: (
+            0 if w.priority == INTERACTIVE or now - w.enqueued > self.aging_seconds else 1, w.sequence
+        ))
+        for waiter in order:
+            if running >= self.max_concurrency:
+                break
+            if waiter.future.done():
+                # cancelled, its caller has not yet removed it
+                self._waiting.remove(waiter)
+                continue
+            if self._running.get(waiter.client_id, 0) >= self.per_client_concurrency:
+                continue
+            self._waiting.remove(waiter)
+            self._running[waiter.client_id] = self._running.get(waiter.client_id, 0) + 1
+            running += 1
+            waiter.future.set_result(None)
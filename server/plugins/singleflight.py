@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: while a call is in flight,
+    later callers with an identical key await its result instead of calling
+    the backend again. Nothing is cached, a call arriving after the first one
+    completed starts a new call.
+
+    The call runs in its own task, so a caller that is cancelled does not
+    cancel it for the others; it is cancelled only when every caller waiting
+    for it has been. Errors are raised to all callers of the flight.
+    """
+
+    def __init__(self, name: str):
+        """
+        Initialize the coalescer.
+
+        Args:
+            name (str): Name used in logs and statistics
+        """
+        self.name = name
+        self.logger = logging.getLogger(__name__)
+
+        self._flights: dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.cancelled = 0
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns the result of the call in flight for the key, or calls the function.
+
+        Args:
+            key (Hashable): Identity of the call, e.g. the normalized arguments
+            function (Callable): Coroutine function making the call
+
+        Returns:
+            The result of the function, shared by all callers of the flight
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(function()))
+            flight.task.add_done_callback(lambda task: self._landed(key, flight))
+            self._flights[key] = flight
+            self.calls += 1
+        else:
+            self.coalesced += 1
+            self.logger.info(f"Joined {self.name} call in flight with {flight.waiters} callers")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # the last caller is gone, new callers start a new call
+                self.cancelled += 1
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "in_flight": self.in_flight,
+        }
+
+    def _landed(self, key: Hashable, flight: _Flight):
+        self._forget(key, flight)
+        # retrieving the exception also keeps asyncio from reporting it as never retrieved
+        if not flight.task.cancelled() and flight.task.exception() is not None:
+            self.errors += 1
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
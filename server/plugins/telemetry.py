@@ -0,0 +1,255 @@
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from typing import Iterable
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Span:
+    """
+    Timing of one operation. Sizes (rows, bytes, tokens, ...) are attached with
+    set() while the span is open and summed up per span name.
+    """
+
+    def __init__(self, telemetry: "Telemetry", name: str, attributes: dict, activate: bool = True):
+        self.telemetry = telemetry
+        self.name = name
+        self.attributes = attributes
+        self.activate = activate
+        self.sizes: dict[str, float] = {}
+        self.duration: float | None = None
+        self._start = 0.0
+        self._otel_span = None
+        self._otel_token = None
+
+    def set(self, **sizes: float):
+        """
+        Records sizes of the operation, e.g. span.set(rows=100, bytes=2048).
+        """
+        for name, value in sizes.items():
+            if value is not None:
+                self.sizes[name] = value
+
+    def __enter__(self) -> "Span":
+        if self.telemetry.tracer is not None:
+            self._otel_span, self._otel_token = self.telemetry._start_otel_span(self.name, self.attributes, self.activate)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._start
+        if exc_type is None:
+            outcome = "ok"
+        elif issubclass(exc_type, (asyncio.CancelledError, GeneratorExit)):
+            outcome = "cancelled"
+        else:
+            outcome = "error"
+        self.telemetry._record(self, outcome)
+        if self._otel_span is not None:
+            self.telemetry._end_otel_span(self, outcome, exc, self._otel_token)
+        return False
+
+
+class Telemetry:
+    """
+    Latency histograms and counters of the server's tools and outbound calls.
+
+    Plugins wrap each backend call in a span; the statistics are aggregated per
+    span name in memory and can be read as a snapshot or in the Prometheus text
+    format. Spans and histograms are also exported through the OpenTelemetry
+    API once enable_opentelemetry() has been called.
+    """
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        """
+        Initialize the telemetry.
+
+        Args:
+            buckets (Iterable[float], optional): Upper bounds of the latency histogram buckets in seconds
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.logger = logging.getLogger(__name__)
+        self.tracer = None
+        self._histogram = None
+        self._stats: dict[str, dict] = {}
+        # spans may end on worker threads, e.g. in asyncio.to_thread
+        self._lock = threading.Lock()
+
+    def span(self, name: str, activate: bool = True, **attributes) -> Span:
+        """
+        Returns a span timing the enclosed block, to be used as `with telemetry.span("kusto.query") as span:`.
+
+        Args:
+            name (str): Span name, e.g. "tool.execute_finops_query" or "kusto.query"
+            activate (bool, optional): Make the span the parent of OpenTelemetry spans started inside the block;
+                must be False for spans enclosing a yield, as a generator may be closed in another context
+            **attributes: Descriptive attributes, only exported to OpenTelemetry
+        """
+        return Span(self, name, attributes, activate)
+
+    def enable_opentelemetry(self) -> bool:
+        """
+        Exports spans and latency histograms through the OpenTelemetry API, using
+        the globally configured tracer and meter providers (e.g. set up by
+        opentelemetry-instrument or the OpenTelemetry SDK).
+
+        Returns:
+            bool: False if the OpenTelemetry API is not installed
+        """
+        try:
+            from opentelemetry import metrics, trace
+        except ImportError:
+            self.logger.warning("OpenTelemetry export requested, but opentelemetry-api is not installed")
+            return False
+
+        self.tracer = trace.get_tracer("finopshub.mcp")
+        self._histogram = metrics.get_meter("finopshub.mcp").create_histogram(
+            "finops.span.duration", unit="s", description="Duration of FinOps MCP server operations"
+        )
+        self.logger.info("OpenTelemetry export enabled")
+        return True
+
+    def snapshot(self) -> dict:
+        """
+        Statistics per span name: count, errors, cancellations, latency mean,
+        estimated percentiles and maximum in seconds, and the summed sizes.
+        """
+        stats = self._copy()
+
+        result = {}
+        for name, s in sorted(stats.items()):
+            count = s["count"]
+            result[name] = {
+                "count": count,
+                "errors": s["errors"],
+                "cancelled": s["cancelled"],
+                "mean_seconds": round(s["sum"] / count, 4) if count else None,
+                "p50_seconds": self._percentile(s, 0.50),
+                "p95_seconds": self._percentile(s, 0.95),
+                "p99_seconds": self._percentile(s, 0.99),
+                "max_seconds": round(s["max"], 4),
+                "sizes": s["sizes"],
+            }
+        return result
+
+    def prometheus(self) -> str:
+        """
+        Returns the statistics in the Prometheus text exposition format.
+        """
+        stats = self._copy()
+
+        lines = [
+            "# HELP finops_span_duration_seconds Duration of FinOps MCP server operations",
+            "# TYPE finops_span_duration_seconds histogram",
+        ]
+        for name, s in sorted(stats.items()):
+            label = self._label(name)
+            cumulative = 0
+            for bound, count in zip(self.buckets, s["buckets"]):
+                cumulative += count
+                lines.append(f'finops_span_duration_seconds_bucket{{span="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'finops_span_duration_seconds_bucket{{span="{label}",le="+Inf"}} {s["count"]}')
+            lines.append(f'finops_span_duration_seconds_sum{{span="{label}"}} {s["sum"]}')
+            lines.append(f'finops_span_duration_seconds_count{{span="{label}"}} {s["count"]}')
+
+        lines += [
+            "# HELP finops_span_failures_total Failed or cancelled FinOps MCP server operations",
+            "# TYPE finops_span_failures_total counter",
+        ]
+        for name, s in sorted(stats.items()):
+            label = self._label(name)
+            lines.append(f'finops_span_failures_total{{span="{label}",outcome="error"}} {s["errors"]}')
+            lines.append(f'finops_span_failures_total{{span="{label}",outcome="cancelled"}} {s["cancelled"]}')
+
+        lines += [
+            "# HELP finops_span_size_total Sizes processed by FinOps MCP server operations (rows, bytes, tokens)",
+            "# TYPE finops_span_size_total counter",
+        ]
+        for name, s in sorted(stats.items()):
+            for unit, value in sorted(s["sizes"].items()):
+                lines.append(f'finops_span_size_total{{span="{self._label(name)}",unit="{self._label(unit)}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def _copy(self) -> dict:
+        with self._lock:
+            return {name: {**s, "buckets": list(s["buckets"]), "sizes": dict(s["sizes"])} for name, s in self._stats.items()}
+
+    def _record(self, span: Span, outcome: str):
+        with self._lock:
+            s = self._stats.get(span.name)
+            if s is None:
+                s = self._stats[span.name] = {
+                    "count": 0,
+                    "errors": 0,
+                    "cancelled": 0,
+                    "sum": 0.0,
+                    "max": 0.0,
+                    "buckets": [0] * len(self.buckets),
+                    "sizes": {},
+                }
+            s["count"] += 1
+            if outcome == "error":
+                s["errors"] += 1
+            elif outcome == "cancelled":
+                s["cancelled"] += 1
+            s["sum"] += span.duration
+            s["max"] = max(s["max"], span.duration)
+            bucket = bisect.bisect_left(self.buckets, span.duration)
+            if bucket < len(self.buckets):
+                s["buckets"][bucket] += 1
+            for unit, value in span.sizes.items():
+                s["sizes"][unit] = s["sizes"].get(unit, 0) + value
+
+    def _percentile(self, stats: dict, quantile: float) -> float | None:
+        # interpolated within the bucket holding the quantile, like Prometheus' histogram_quantile
+        count = stats["count"]
+        if not count:
+            return None
+        rank = quantile * count
+        cumulative = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, stats["buckets"]):
+            if bucket_count and cumulative + bucket_count >= rank:
+                estimate = lower + (bound - lower) * (rank - cumulative) / bucket_count
+                return round(min(estimate, stats["max"]), 4)
+            cumulative += bucket_count
+            lower = bound
+        return round(stats["max"], 4)
+
+    def _start_otel_span(self, name: str, attributes: dict, activate: bool):
+        from opentelemetry import context, trace
+
+        otel_span = self.tracer.start_span(name, attributes={k: v for k, v in attributes.items() if v is not None})
+        return otel_span, context.attach(trace.set_span_in_context(otel_span)) if activate else None
+
+    def _end_otel_span(self, span: Span, outcome: str, exc: BaseException | None, token):
+        from opentelemetry import context
+        from opentelemetry.trace import Status, StatusCode
+
+        otel_span = span._otel_span
+        for unit, value in span.sizes.items():
+            otel_span.set_attribute(f"finops.{unit}", value)
+        if outcome == "error":
+            otel_span.record_exception(exc)
+            otel_span.set_status(Status(StatusCode.ERROR, str(exc)))
+        otel_span.end()
+        if token is not None:
+            context.detach(token)
+        self._histogram.record(span.duration, {"span": span.name, "outcome": outcome})
+
+    @staticmethod
+    def _label(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Shared by the server and all plugins
+telemetry = Telemetry()
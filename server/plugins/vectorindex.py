@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+from typing import List
+import numpy as np
+from plugins.embeddings import EmbeddingsClient
+from plugins.keywordindex import BM25Index, reciprocal_rank_fusion
+from plugins.model import DashboardQuery, QuerySuggestionResponse
+from plugins.querylibrary import QueryLibrary, default_library_path, is_binary_library
+from plugins.telemetry import telemetry
+
+
+class QueryLibraryPlugin:
+    """
+    Serves query suggestions from an in-process vector index built from the
+    query library file produced by parser.py, without an external search service.
+    Binary libraries are memory-mapped, JSON libraries are read into memory.
+
+    Besides the vector index, a BM25 keyword index over title, description and
+    query text is built. In hybrid mode both rankings are combined with
+    reciprocal rank fusion, so exact table and column names rank well; in
+    keyword mode the purpose is not embedded at all.
+    """
+
+    SEARCH_MODES = ("hybrid", "vector", "keyword")
+
+    def __init__(self, embeddings_client: EmbeddingsClient, index_file: str = None, limit: int = 3,
+                 search_mode: str = "hybrid", candidates: int = 50):
+        """
+        Initialize the local query library.
+
+        Args:
+            embeddings_client (EmbeddingsClient): Client used to embed the query purpose
+            index_file (str, optional): Path to the query library, binary or JSON; the binary library
+                if it exists, otherwise the JSON library
+            limit (int, optional): Number of suggestions to return
+            search_mode (str, optional): hybrid, vector or keyword
+            candidates (int, optional): Results taken from each ranking before fusion
+
+        Raises:
+            ValueError: If the search mode is unknown
+        """
+        if search_mode not in self.SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{search_mode}', expected one of {', '.join(self.SEARCH_MODES)}")
+
+        self.embeddings_client = embeddings_client
+        self.index_file = index_file or default_library_path()
+        self.limit = limit
+        self.search_mode = search_mode
+        self.candidates = candidates
+        self.logger = logging.getLogger(__name__)
+
+        self.entries: List[DashboardQuery] = []
+        self.library: QueryLibrary | None = None
+        self.keyword_index: BM25Index | None = None
+
+    async def connect(self):
+        """
+        Load the library at server startup, if the index file is present.
+        """
+        if os.path.exists(self.index_file):
+            self.load()
+
+    async def aclose(self):
+        """
+        Release the in-memory index.
+        """
+        self.entries = []
+        self.library = None
+        self.keyword_index = None
+
+    def load(self):
+        """
+        Load the library as a matrix of unit-length rows, so that a single
+        matrix-vector product yields cosine similarities.
+        """
+        if is_binary_library(self.index_file):
+            self.library = QueryLibrary.load(self.index_file)
+        else:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                self.library = QueryLibrary.from_entries(json.load(f))
+
+        self.entries = [
+            DashboardQuery(
+                id=str(n),
+                title=i["title"],
+                description=i["description"],
+                query=i["query"]
+            )
+            for n, i in enumerate(self.library.entries)
+        ]
+        self.keyword_index = BM25Index([f"{e.title}\n{e.description}\n{e.query}" for e in self.entries])
+        self.logger.info(f"Loaded {len(self.entries)} queries from {self.index_file}")
+
+    def search(self, vector: List[float], limit: int) -> List[tuple[int, float]]:
+        """
+        Find the library entries closest to the given vector.
+
+        Args:
+            vector (List[float]): Query embedding
+            limit (int): Maximum number of results
+
+        Returns:
+            List[tuple[int, float]]: Entry positions and cosine similarities, best first
+        """
+        with telemetry.span("vectorindex.search") as span:
+            q = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(q)
+            if norm:
+                q = q / norm
+
+            scores = self.library.scores(q)
+            k = min(limit, scores.shape[0])
+            if k <= 0:
+                return []
+
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            span.set(documents=scores.shape[0])
+        return [(int(i), float(scores[i])) for i in top]
+
+    async def get_query_suggestions(
+        self,
+        query_purpose: str,
+        keywords: List[str]
+    ) -> QuerySuggestionResponse:
+
+        """
+        Provides samples of queries for a specific task.
+
+        Args:
+            query_purpose: Purpose of the query
+            keywords: Keywords extracted from the query
+
+        Returns:
+            List of DashboardQuery objects
+        """
+        self.logger.info(f"Searching for queries matching: '{query_purpose}', keywords: {', '.join(keywords)}")
+
+        try:
+            if self.library is None:
+                if not os.path.exists(self.index_file):
+                    return {
+                        "error": f"Index file '{self.index_file}' does not exist, please make sure to populate it with query examples.",
+                        "queries": []
+                    }
+                self.load()
+
+            keyword_text = " ".join([query_purpose, *keywords])
+
+            if self.search_mode == "keyword":
+                results = self.keyword_index.search(keyword_text, self.limit)
+            else:
+                # Generate embedding for the query purpose
+                embedded_question = await self.embeddings_client.get_embedding(query_purpose)
+
+                if self.search_mode == "vector":
+                    results = self.search(embedded_question[0], self.limit)
+                else:
+                    vector_results = self.search(embedded_question[0], self.candidates)
+                    keyword_results = self.keyword_index.search(keyword_text, self.candidates)
+                    results = reciprocal_rank_fusion([
+                        [position for position, _ in vector_results],
+                        [position for position, _ in keyword_results],
+                    ])[:self.limit]
+
+            queries = []
+            for position, score in results:
+                dashboard_query = self.entries[position]
+                queries.append(dashboard_query)
+
+                self.logger.info(f"Found query candidate: {dashboard_query.title} - {dashboard_query.description} ({self.search_mode} score: {score:.4f})")
+
+            return {"queries": queries}
+
+        except Exception as e:
+            self.logger.error(f"Error while searching for queries: {e}")
+            return {
+                "error": str(e),
+                "queries": []
+            }
@@ -1,76 +1,187 @@
+import asyncio
 import logging
-from dataclasses import dataclass
+import time
 from typing import List
-from weaviate import connect_to_local
+from weaviate import use_async_with_local, WeaviateAsyncClient
+from weaviate.collections import CollectionAsync
+from weaviate.classes.init import AdditionalConfig
 from weaviate.classes.query import MetadataQuery
+from weaviate.config import ConnectionConfig
+from weaviate.exceptions import (
+    WeaviateClosedClientError, WeaviateConnectionError, WeaviateGRPCUnavailableError, WeaviateQueryError
+)
 from plugins.embeddings import EmbeddingsClient
 from plugins.model import DashboardQuery, QuerySuggestionResponse
 from plugins.config import COLLECTION_NAME
+from plugins.telemetry import telemetry
 
 class QueryLibraryPlugin:
-    
-    def __init__(self,  embeddings_client: EmbeddingsClient):
+
+    def __init__(self,  embeddings_client: EmbeddingsClient, pool_size: int = 10, health_check_interval: float = 30.0):
+        """
+        Initialize the Weaviate query library.
+
+        The Weaviate connection is opened once by connect() and shared by all
+        requests until aclose() is called. The collection (or alias) is looked
+        up once per connection and only looked up again when a query fails.
+
+        Args:
+            embeddings_client (EmbeddingsClient): Client used to embed the query purpose
+            pool_size (int, optional): Maximum number of pooled HTTP connections to Weaviate
+            health_check_interval (float, optional): Seconds between readiness checks of the shared connection
+        """
         self.embeddings_client = embeddings_client
+        self.pool_size = pool_size
+        self.health_check_interval = health_check_interval
         self.logger = logging.getLogger(__name__)
 
+        self.client: WeaviateAsyncClient | None = None
+        self._collection: CollectionAsync | None = None
+        self._lock = asyncio.Lock()
+        self._last_health_check = 0.0
+
+    async def connect(self):
+        """
+        Open the shared Weaviate connection. If Weaviate is not reachable yet,
+        the connection is retried on the first request.
+        """
+        async with self._lock:
+            try:
+                await self._reconnect()
+            except Exception as e:
+                self.client = None
+                self.logger.warning(f"Unable to connect to Weaviate, will retry on first request: {e}")
+
+    async def aclose(self):
+        """
+        Close the shared Weaviate connection.
+        """
+        async with self._lock:
+            if self.client is not None:
+                await self.client.close()
+                self.client = None
+                self._collection = None
+                self.logger.info("Weaviate connection closed")
+
+    async def _reconnect(self):
+        if self.client is not None:
+            try:
+                await self.client.close()
+            except Exception as e:
+                self.logger.warning(f"Error while closing stale Weaviate connection: {e}")
+        self._collection = None
+
+        self.client = use_async_with_local(
+            additional_config=AdditionalConfig(
+                connection=ConnectionConfig(
+                    session_pool_connections=self.pool_size,
+                    session_pool_maxsize=self.pool_size
+                )
+            )
+        )
+        await self.client.connect()
+        self._last_health_check = time.monotonic()
+        self.logger.info("Weaviate connection established")
+
+    async def _get_client(self) -> WeaviateAsyncClient:
+        async with self._lock:
+            if self.client is None or not self.client.is_connected():
+                await self._reconnect()
+            elif time.monotonic() - self._last_health_check > self.health_check_interval:
+                if not await self.client.is_ready():
+                    self.logger.warning("Weaviate health check failed, reconnecting")
+                    await self._reconnect()
+                self._last_health_check = time.monotonic()
+            return self.client
+
+    async def _resolve_collection(self, client: WeaviateAsyncClient) -> CollectionAsync | None:
+        # a missing collection is not remembered, so it is found once it has been populated
+        if self._collection is None:
+            if not await client.collections.exists(COLLECTION_NAME) \
+                    and await client.alias.get(alias_name=COLLECTION_NAME) is None:
+                return None
+            self._collection = client.collections.get(COLLECTION_NAME)
+        return self._collection
+
+    async def _search(self, vector: List[float]):
+        client = await self._get_client()
+
+        queries_collection = await self._resolve_collection(client)
+        if queries_collection is None:
+            return None
+
+        # Perform vector search
+        try:
+            with telemetry.span("weaviate.near_vector", collection=COLLECTION_NAME) as span:
+                result = await queries_collection.query.near_vector(
+                    near_vector=vector,
+                    limit=3,
+                    return_metadata=MetadataQuery(distance=True)
+                )
+                span.set(results=len(result.objects))
+        except WeaviateQueryError:
+            # the collection or alias may have been removed since it was resolved
+            self._collection = None
+            if await self._resolve_collection(client) is None:
+                return None
+            raise
+        return result
+
     async def get_query_suggestions(
         self,
         query_purpose: str,
         keywords: List[str]
     ) -> QuerySuggestionResponse:
-        
+
         """
         Provides samples of queries for a specific task.
-        
+
         Args:
             query_purpose: Purpose of the query
             keywords: Keywords extracted from the query
-            
+
         Returns:
             List of DashboardQuery objects
         """
         self.logger.info(f"Searching for queries matching: '{query_purpose}', keywords: {', '.join(keywords)}")
-        
+
         try:
             # Generate embedding for the query purpose
             embedded_question = await self.embeddings_client.get_embedding(query_purpose)
 
-            # Connect to Weaviate and perform vector search
-            with connect_to_local() as client:
+            try:
+                result = await self._search(embedded_question[0])
+            except (WeaviateConnectionError, WeaviateClosedClientError, WeaviateGRPCUnavailableError) as e:
+                # The shared connection went away, reconnect once and retry
+                self.logger.warning(f"Weaviate request failed, reconnecting: {e}")
+                async with self._lock:
+                    await self._reconnect()
+                result = await self._search(embedded_question[0])
 
-                if not client.collections.exists(COLLECTION_NAME):
-                    return {
-                        "error": f"Collection '{COLLECTION_NAME}' does not exist, please make sure to populate it with query examples.",
-                        "queries": []
-                    }
+            if result is None:
+                return {
+                    "error": f"Collection '{COLLECTION_NAME}' does not exist, please make sure to populate it with query examples.",
+                    "queries": []
+                }
 
-                queries_collection = client.collections.get(COLLECTION_NAME)
-                
-                # Perform vector search
-                result = queries_collection.query.near_vector(
-                    near_vector=embedded_question[0],
-                    limit=3,
-                    return_metadata=MetadataQuery(distance=True)
+            queries = []
+            for obj in result.objects:
+                properties = obj.properties
+                dashboard_query = DashboardQuery(
+                    id=properties.get("id", ""),
+                    title=properties.get("title", ""),
+                    description=properties.get("description", ""),
+                    query=properties.get("query", "")
                 )
-                
-                queries = []
-                for obj in result.objects:
-                    properties = obj.properties
-                    dashboard_query = DashboardQuery(
-                        id=properties.get("id", ""),
-                        title=properties.get("title", ""),
-                        description=properties.get("description", ""),
-                        query=properties.get("query", "")
-                    )
-                    queries.append(dashboard_query)
-
-                    self.logger.info(f"Found query candidate: {dashboard_query.title} - {dashboard_query.description} (distance: {obj.metadata.distance})")
-
-                return {"queries": queries}
-            
+                queries.append(dashboard_query)
+
+                self.logger.info(f"Found query candidate: {dashboard_query.title} - {dashboard_query.description} (distance: {obj.metadata.distance})")
+
+            return {"queries": queries}
+
         except Exception as e:
             self.logger.error(f"Error while searching for queries: {e}")
             return {
                 "error": str(e),
                 "queries": []
-            }
+            }
\ No newline at end of file
@@ -1,31 +1,206 @@
+import time
+
+started = time.perf_counter()
+
+# fastmcp and the MCP SDK account for most of the import time, timed separately
+from fastmcp import Context, FastMCP
+from fastmcp.server.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+framework_imported = time.perf_counter()
+
 import os
+import asyncio
+import tempfile
 import dotenv
 from typing import List
-import pandas as pd
 import logging
-from fastmcp import FastMCP
+from contextlib import asynccontextmanager
 from plugins.model import QuerySuggestionResponse
-from plugins.advisor import AzureAdvisorClient
-from plugins.weaviate import QueryLibraryPlugin
-from plugins.kusto import KustoQueryExecutor
-from plugins.metrics import VmMetricsClient
-from plugins.embeddings import EmbeddingsClient
+from plugins.lazy import LazyPlugin
+from plugins.singleflight import SingleFlight
+from plugins.telemetry import telemetry
 
 dotenv.load_dotenv()
 
-embeddings_client = EmbeddingsClient(
-    endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    engine=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY", None)
-)
+# Plugins and their SDKs are imported and created on first use, keeping startup fast
+
+# Select the query library backend: weaviate (default), azureaisearch or local
+query_library_backend = os.getenv("QUERY_LIBRARY_BACKEND", "weaviate").lower()
+
+def create_credential_service():
+    from plugins.credentials import CredentialService
+
+    return CredentialService(refresh_margin=float(os.getenv("TOKEN_REFRESH_MARGIN", "300")))
+
+async def create_embeddings_client():
+    from plugins.embeddings import EmbeddingsClient
+    from plugins.embeddingcache import EmbeddingCache
+
+    return EmbeddingsClient(
+        endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        engine=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY", None),
+        cache=EmbeddingCache(
+            max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+            path=os.getenv("EMBEDDING_CACHE_PATH", None)
+        ),
+        batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "16")),
+        batch_linger_ms=float(os.getenv("EMBEDDING_BATCH_LINGER_MS", "5")),
+        credential=await credential_service.get()
+    )
+
+async def create_query_library():
+    if query_library_backend == "local":
+        from plugins.vectorindex import QueryLibraryPlugin
+        plugin = QueryLibraryPlugin(
+            embeddings_client=await embeddings_client.get(),
+            search_mode=os.getenv("QUERY_LIBRARY_SEARCH_MODE", "hybrid").lower()
+        )
+    else:
+        if query_library_backend == "azureaisearch":
+            from plugins.azureaisearch import QueryLibraryPlugin
+            plugin = QueryLibraryPlugin(
+                embeddings_client=await embeddings_client.get(),
+                credential=await credential_service.get()
+            )
+        else:
+            from plugins.weaviate import QueryLibraryPlugin
+            plugin = QueryLibraryPlugin(embeddings_client=await embeddings_client.get())
+
+    await plugin.connect()
+    return plugin
+
+# Query results are cached unless KUSTO_CACHE_TTL is 0
+kusto_cache_ttl = float(os.getenv("KUSTO_CACHE_TTL", "300"))
+
+async def create_query_executor():
+    from plugins.kusto import KustoQueryExecutor
+    from plugins.resultcache import QueryResultCache
+
+    return KustoQueryExecutor(
+        os.getenv("FINOPS_HUB_CLUSTER", None),
+        "Hub",
+        max_concurrency=int(os.getenv("KUSTO_MAX_CONCURRENCY", "4")),
+        query_timeout=float(os.getenv("KUSTO_QUERY_TIMEOUT", "120")),
+        result_cache=QueryResultCache(
+            ttl=kusto_cache_ttl,
+            max_bytes=int(os.getenv("KUSTO_CACHE_MAX_MB", "256")) * 1024 * 1024,
+            spill_dir=os.getenv("KUSTO_CACHE_SPILL_DIR", None)
+        ) if kusto_cache_ttl > 0 else None,
+        watermark_query=os.getenv("KUSTO_CACHE_WATERMARK_QUERY", KustoQueryExecutor.DEFAULT_WATERMARK_QUERY),
+        credential=await credential_service.get()
+    )
+
+def create_query_scheduler():
+    from plugins.scheduler import QueryScheduler
+
+    return QueryScheduler(
+        max_concurrency=int(os.getenv("KUSTO_MAX_CONCURRENCY", "4")),
+        per_client_concurrency=int(os.getenv("KUSTO_CLIENT_CONCURRENCY", "2")),
+        max_queue=int(os.getenv("KUSTO_MAX_QUEUE", "100")),
+        policy=os.getenv("KUSTO_QUERY_POLICY", "cap").lower(),
+        row_cap=int(os.getenv("KUSTO_ROW_CAP", "100000"))
+    )
+
+def create_result_store():
+    from plugins.resultstore import ResultStore
+
+    return ResultStore(
+        os.getenv("RESULT_STORE_DIR") or os.path.join(tempfile.gettempdir(), "finopshub-results"),
+        threshold=int(os.getenv("RESULT_PAGE_THRESHOLD", "5000")),
+        page_size=int(os.getenv("RESULT_PAGE_SIZE", "1000")),
+        max_page_size=int(os.getenv("RESULT_MAX_PAGE_SIZE", "10000")),
+        max_handles=int(os.getenv("RESULT_STORE_MAX_HANDLES", "20")),
+        ttl=float(os.getenv("RESULT_STORE_TTL", "3600"))
+    )
+
+async def create_advisor_client():
+    from plugins.advisor import AzureAdvisorClient
+
+    return AzureAdvisorClient(
+        endpoint=os.getenv("ARM_ENDPOINT", None),
+        page_size=int(os.getenv("ADVISOR_PAGE_SIZE", "1000")),
+        cache_ttl=float(os.getenv("ADVISOR_CACHE_TTL", "3600")),
+        max_concurrency=int(os.getenv("ADVISOR_MAX_CONCURRENCY", "4")),
+        credential=await credential_service.get()
+    )
 
-mcp = FastMCP(name="FinOpsHubMCP")
+async def create_vm_metrics_client():
+    from plugins.metrics import VmMetricsClient
 
-query_library_plugin = QueryLibraryPlugin(embeddings_client=embeddings_client)
-query_executor_plugin = KustoQueryExecutor(os.getenv("FINOPS_HUB_CLUSTER", None), "Hub")
-advisor_plugin = AzureAdvisorClient()
+    return VmMetricsClient(
+        endpoint=os.getenv("ARM_ENDPOINT", "https://management.azure.com"),
+        credential=await credential_service.get()
+    )
 
-@mcp.tool()
+# A single credential and token cache is shared by all plugins
+credential_service = LazyPlugin("credential service", create_credential_service)
+embeddings_client = LazyPlugin("embeddings client", create_embeddings_client)
+query_library_plugin = LazyPlugin(f"{query_library_backend} query library", create_query_library)
+query_executor_plugin = LazyPlugin("Kusto query executor", create_query_executor)
+query_scheduler = LazyPlugin("query scheduler", create_query_scheduler)
+result_store = LazyPlugin("result store", create_result_store)
+advisor_plugin = LazyPlugin("Advisor client", create_advisor_client)
+vm_metrics_client = LazyPlugin("VM metrics client", create_vm_metrics_client)
+
+# Plugins are closed in this order: the query library uses the embeddings client, and all use the credential service
+plugins = [query_library_plugin, embeddings_client, query_scheduler, query_executor_plugin, result_store, vm_metrics_client, advisor_plugin,
+           credential_service]
+
+# Identical tool calls made while one is in flight share its result, unless COALESCE_TOOL_CALLS is false
+coalesce_tool_calls = os.getenv("COALESCE_TOOL_CALLS", "true").lower() in ("1", "true", "yes")
+flights = {
+    name: SingleFlight(name)
+    for name in ("get_query_suggestions", "execute_finops_query", "retrieve_advisor_recommendations",
+                 "retrieve_scope_advisor_recommendations")
+}
+
+async def coalesce(tool: str, key: tuple, function):
+    if not coalesce_tool_calls:
+        return await function()
+    return await flights[tool].do(key, function)
+
+# Tools are grouped by tag; FINOPS_MCP_TOOLS lists the tools or groups to enable (all by default)
+TOOL_GROUPS = {"queries", "metrics", "advisor"}
+startup = {"framework_import_seconds": round(framework_imported - started, 3)}
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    startup["enabled_tools"] = sorted(tool.name for tool in await server.list_tools())
+    unknown = set(startup.pop("selected_tools", [])) - set(startup["enabled_tools"])
+    if unknown:
+        logging.warning(f"Unknown tools in FINOPS_MCP_TOOLS: {', '.join(sorted(unknown))}")
+    startup["ready_seconds"] = round(time.perf_counter() - started, 3)
+    logging.info(f"FinOps server ready in {startup['ready_seconds']}s (imports and registration {startup['import_seconds']}s, "
+                 f"of which fastmcp {startup['framework_import_seconds']}s), "
+                 f"tools: {', '.join(startup['enabled_tools']) or 'none'}")
+    try:
+        yield
+    finally:
+        for plugin in plugins:
+            await plugin.aclose()
+
+class ToolTelemetry(Middleware):
+    """
+    Records a span for every tool call, with the size of the serialized result.
+    """
+
+    async def on_call_tool(self, context, call_next):
+        with telemetry.span(f"tool.{context.message.name}") as span:
+            result = await call_next(context)
+            span.set(bytes=sum(len(getattr(c, "text", None) or "") for c in getattr(result, "content", None) or []))
+            return result
+
+# Spans are also exported through OpenTelemetry when TELEMETRY_OPENTELEMETRY is set
+if os.getenv("TELEMETRY_OPENTELEMETRY", "false").lower() in ("1", "true", "yes"):
+    telemetry.enable_opentelemetry()
+
+mcp = FastMCP(name="FinOpsHubMCP", lifespan=lifespan)
+mcp.add_middleware(ToolTelemetry())
+
+@mcp.tool(tags={"queries"})
 async def get_query_suggestions(
     purpose: str, 
     keywords: List[str]) -> QuerySuggestionResponse:
@@ -37,13 +212,22 @@ async def get_query_suggestions(
     """
 
     # Call the QueryLibraryPlugin to get query suggestions
-    result = await query_library_plugin.get_query_suggestions(purpose, keywords)
+    async def suggest():
+        library = await query_library_plugin.get()
+        return await library.get_query_suggestions(purpose, keywords)
+
+    result = await coalesce("get_query_suggestions", (purpose.strip(), tuple(keywords)), suggest)
     return result
 
-@mcp.tool()
-def execute_finops_query(
-    query: str) -> pd.DataFrame:
+@mcp.tool(tags={"queries"})
+async def execute_finops_query(
+    query: str,
+    ctx: Context = None):
     """Executes a FinOps Kusto Query.
+    Queries should filter on time (e.g. | where ChargePeriodStart >= ago(30d)) and limit their rows
+    with take/top or summarize; other queries are capped.
+    Large results are returned as a handle with the schema, row count and first page;
+    use fetch_query_results with the handle and next_cursor to retrieve more rows.
     
     Args:
         query: KQL query to execute
@@ -52,34 +236,149 @@ def execute_finops_query(
         if not query:
             raise ValueError("Query cannot be empty")
 
-        # Execute the query using the KustoQueryExecutor
-        return query_executor_plugin.execute_query(query)
+        executor = await query_executor_plugin.get()
+        store = await result_store.get()
+        scheduler = await query_scheduler.get()
+
+        # Check the query for a time filter and row limit, applying the admission policy
+        plan = scheduler.plan(query)
+
+        # Execute the query using the KustoQueryExecutor once the scheduler admits it
+        # Stream the result, large results are written to disk while they arrive
+        async def execute():
+            async with scheduler.slot(client_identity(ctx), plan.priority):
+                return await store.store_stream(
+                    executor.stream_query_async(plan.query, batch_size=store.page_size)
+                )
+
+        from plugins.resultcache import normalize_kql
+        result = await coalesce("execute_finops_query", (executor.database, normalize_kql(plan.query)), execute)
+        if plan.capped and isinstance(result, dict) and result.get("row_count") == plan.row_limit:
+            result = {**result, "truncated_at_row_cap": plan.row_limit}
+        return result
     except Exception as e:
         logging.error(f"Error executing query: {e}")
         raise ValueError(f"Failed to execute query: {e}")
-    
-@mcp.tool()
-def vm_cpu_utilization(
+
+def client_identity(ctx: Context | None) -> str | None:
+    """
+    Identifies the calling client for per-client limits: the client ID sent with
+    the request, or else the MCP session.
+    """
+    if ctx is None:
+        return None
+    try:
+        return ctx.client_id or ctx.session_id
+    except RuntimeError:
+        return None
+
+@mcp.tool(tags={"queries"})
+async def fetch_query_results(
+    handle: str,
+    cursor: str = None,
+    page_size: int = None) -> dict:
+    """Fetches further rows of a large FinOps query result.
+
+    Args:
+        handle: result handle returned by execute_finops_query
+        cursor: next_cursor returned with the previous page
+        page_size: number of rows to return, at most RESULT_MAX_PAGE_SIZE
+    """
+    try:
+        store = await result_store.get()
+        return await asyncio.to_thread(store.fetch, handle, cursor, page_size)
+    except Exception as e:
+        logging.error(f"Error fetching results for {handle}: {e}")
+        raise ValueError(f"Failed to fetch results: {e}")
+
+@mcp.resource("finops://cache/queries")
+async def query_cache_stats() -> dict:
+    """Statistics of the Kusto query result cache."""
+    if kusto_cache_ttl <= 0:
+        return {"enabled": False}
+    if not query_executor_plugin.created:
+        return {"enabled": True, "entries": 0}
+    return (await query_executor_plugin.get()).result_cache.stats()
+
+@mcp.tool(tags={"metrics"})
+async def vm_cpu_utilization(
     subscription_id: str,
     resource_group: str,
-    vm_name: str
-) -> pd.DataFrame:
+    vm_name: str,
+    timespan: str = "P30D",
+    interval: str = "PT1H",
+    aggregation: str = "Maximum",
+    summary: bool = False,
+    downsample: str = None
+) -> dict:
     """Fetches VM CPU utilization metrics.
     Args:
         subscription_id: Azure subscription ID
         resource_group: Azure resource group name
         vm_name: Name of the virtual machine
+        timespan: ISO 8601 duration of the period to retrieve, e.g. P30D for 30 days
+        interval: ISO 8601 time grain of the data points, e.g. PT1H for 1 hour
+        aggregation: Aggregation of the data points: Maximum, Average or Minimum
+        summary: Return percentiles, share of time below utilization thresholds and daily peaks
+            instead of all data points (recommended for rightsizing)
+        downsample: With summary, also return the series reduced to interval maxima, e.g. 6h or 1D
     """
     try:
-        vm_metrics_client = VmMetricsClient()
-        metrics = vm_metrics_client.get_vm_metrics(subscription_id, resource_group, vm_name)
+        client = await vm_metrics_client.get()
+        metrics = await client.get_vm_metrics(
+            subscription_id, resource_group, vm_name,
+            timespan=timespan, interval=interval, aggregation=aggregation
+        )
+        if summary and "error" not in metrics:
+            from plugins.metricsummary import summarize_metrics
+            rows = client.tidy(vm_name, metrics, aggregation)
+            return summarize_metrics(client.COLUMNS, rows, downsample=downsample).get(vm_name, {"points": 0})
         return metrics
     
     except Exception as e:
         logging.error(f"Error retrieving data for {vm_name}: {e}")
         raise ValueError(f"Error retrieving data for {vm_name}: {e}")
 
-@mcp.tool()
+@mcp.tool(tags={"metrics"})
+async def vm_cpu_utilization_batch(
+    vm_resource_ids: List[str],
+    timespan: str = "P30D",
+    interval: str = "PT1H",
+    aggregation: str = "Maximum",
+    summary: bool = False,
+    downsample: str = None
+) -> dict:
+    """Fetches CPU utilization metrics for many VMs at once, e.g. for rightsizing reviews.
+    Returns one table row per VM and data point; VMs that failed are listed in errors,
+    VMs without any values in the timespan (e.g. deallocated) in no_data.
+    Args:
+        vm_resource_ids: ARM resource IDs of the virtual machines (/subscriptions/.../virtualMachines/<name>)
+        timespan: ISO 8601 duration of the period to retrieve, e.g. P30D for 30 days
+        interval: ISO 8601 time grain of the data points, e.g. PT1H for 1 hour
+        aggregation: Aggregation of the data points: Maximum, Average or Minimum
+        summary: Return a summary per VM (percentiles, share of time below utilization thresholds,
+            daily peaks) instead of all data points (recommended for more than a few VMs)
+        downsample: With summary, also return each series reduced to interval maxima, e.g. 6h or 1D
+    """
+    try:
+        client = await vm_metrics_client.get()
+        metrics = await client.get_vm_metrics_batch(
+            vm_resource_ids, timespan=timespan, interval=interval, aggregation=aggregation
+        )
+        if summary:
+            from plugins.metricsummary import summarize_metrics
+            return {
+                "summaries": summarize_metrics(metrics["columns"], metrics["rows"], downsample=downsample),
+                "errors": metrics["errors"],
+                "no_data": metrics["no_data"],
+            }
+        return metrics
+
+    except Exception as e:
+        logging.error(f"Error retrieving data for {len(vm_resource_ids)} VMs: {e}")
+        raise ValueError(f"Error retrieving data for {len(vm_resource_ids)} VMs: {e}")
+
+@mcp.tool(tags={"advisor"})
 async def retrieve_advisor_recommendations(
         subscription_id: str,
         resource_group: str = None,
@@ -92,13 +391,108 @@ async def retrieve_advisor_recommendations(
         resource_name: Name of the resource or None for all resources
     """
     try:
-        recommendations = advisor_plugin.get_recommendations(subscription_id, resource_group, resource_name)
+        advisor = await advisor_plugin.get()
+        recommendations = await coalesce(
+            "retrieve_advisor_recommendations",
+            tuple((value or "").casefold() for value in (subscription_id, resource_group, resource_name)),
+            lambda: advisor.get_recommendations_async(subscription_id, resource_group, resource_name)
+        )
         return recommendations
 
     except Exception as e:
         logging.error(f"Error retrieving recommendations: {e}")
         return {"error": str(e)}
 
+@mcp.tool(tags={"advisor"})
+async def retrieve_scope_advisor_recommendations(
+        subscription_ids: List[str] = None,
+        management_group: str = None,
+        resource_group: str = None,
+        resource_name: str = None) -> dict:
+    """Retrieves Azure Advisor rightsizing recommendations across many subscriptions or
+    a whole management group in one call, e.g. for organization-wide cost reviews.
+    Returns a table with one row per recommendation.
+
+    Args:
+        subscription_ids: Azure subscription IDs, or with a management group, the subscriptions to include
+        management_group: Management group ID or None
+        resource_group: Azure resource group name or None for all resource groups
+        resource_name: Name of the resource or None for all resources
+    """
+    try:
+        advisor = await advisor_plugin.get()
+        key = (
+            tuple(sorted({s.casefold() for s in subscription_ids or []})),
+            *((value or "").casefold() for value in (management_group, resource_group, resource_name))
+        )
+        return await coalesce(
+            "retrieve_scope_advisor_recommendations", key,
+            lambda: advisor.get_scope_recommendations_async(
+                subscription_ids, management_group, resource_group, resource_name
+            )
+        )
+
+    except Exception as e:
+        logging.error(f"Error retrieving recommendations: {e}")
+        return {"error": str(e)}
+
+@mcp.resource("finops://scheduler/queries")
+async def query_scheduler_stats() -> dict:
+    """Running and waiting Kusto queries, admission counters and queue wait and run times per priority class."""
+    if not query_scheduler.created:
+        return {"running": 0, "admitted": 0}
+    return (await query_scheduler.get()).stats()
+
+@mcp.resource("finops://server/coalescing")
+def coalescing_stats() -> dict:
+    """Calls made, calls that joined an identical call in flight, errors and cancellations per tool."""
+    return {"enabled": coalesce_tool_calls, **{name: flight.stats() for name, flight in flights.items()}}
+
+@mcp.resource("finops://credentials/tokens")
+async def token_stats() -> dict:
+    """Token cache statistics per scope: cache hits, acquisitions, background refreshes and acquisition latency."""
+    if not credential_service.created:
+        return {}
+    return (await credential_service.get()).stats()
+
+@mcp.resource("finops://telemetry/latency")
+def latency_stats() -> dict:
+    """Latency percentiles, error counts and processed sizes (rows, bytes, tokens) of every tool and backend call."""
+    return telemetry.snapshot()
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def prometheus_metrics(request: Request) -> PlainTextResponse:
+    """Latency histograms and counters in the Prometheus text format, served with the HTTP transport."""
+    return PlainTextResponse(telemetry.prometheus(), media_type="text/plain; version=0.0.4")
+
+@mcp.resource("finops://server/startup")
+def startup_report() -> dict:
+    """Startup time of the server, enabled tools and initialization time of the plugins created so far."""
+    return {
+        **startup,
+        "plugins": {plugin.name: plugin.init_seconds for plugin in plugins},
+    }
+
+def configure_tools(selection: str):
+    """
+    Enables only the tools and tool groups listed in the comma separated selection,
+    or all tools if it is empty or "all".
+    """
+    selected = {s.strip() for s in selection.split(",") if s.strip()}
+    if not selected or "all" in selected:
+        return
+
+    groups = selected & TOOL_GROUPS
+    names = selected - TOOL_GROUPS
+    startup["selected_tools"] = sorted(names)
+    mcp.disable(components={"tool"})
+    if groups:
+        mcp.enable(tags=groups, components={"tool"})
+    if names:
+        mcp.enable(names=names, components={"tool"})
+
+configure_tools(os.getenv("FINOPS_MCP_TOOLS", ""))
+startup["import_seconds"] = round(time.perf_counter() - started, 3)
 
 if __name__ == "__main__":
     print("Starting FinOps Server…")
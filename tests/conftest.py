@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the plugins are imported as in server.py, with server/ on the path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server"))
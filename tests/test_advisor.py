@@ -0,0 +1,41 @@
+import asyncio
+from plugins.advisor import AzureAdvisorClient
+
+
+def _client(rows_by_group: dict) -> AzureAdvisorClient:
+    client = AzureAdvisorClient()
+    client.queries = 0
+
+    async def query_all(query, subscriptions=None, management_groups=None):
+        client.queries += 1
+        if management_groups:
+            return list(rows_by_group[management_groups[0]])
+        return [r for group in rows_by_group.values() for r in group if r["subscriptionId"] in subscriptions]
+
+    client._query_all = query_all
+    return client
+
+
+def test_invalidating_a_subscription_drops_management_groups_containing_it():
+    rows = {
+        "finance": [{"subscriptionId": "SUB-A", "problem": "idle vm"}],
+        "sales": [{"subscriptionId": "sub-b", "problem": "unattached disk"}],
+    }
+    client = _client(rows)
+
+    async def run():
+        await client._get_management_group_recommendations("finance")
+        await client._get_management_group_recommendations("sales")
+        await client._get_subscription_recommendations(["sub-a"])
+        client.invalidate("Sub-A")
+        assert set(client._cache) == {"managementGroups/sales"}
+
+        rows["finance"] = []
+        finance = await client._get_management_group_recommendations("finance")
+        sales = await client._get_management_group_recommendations("sales")
+        return finance, sales
+
+    finance, sales = asyncio.run(run())
+    assert finance == []
+    assert sales == rows["sales"]
+    assert client.queries == 4
@@ -0,0 +1,57 @@
+import asyncio
+import time
+from azure.core.credentials import AccessTokenInfo
+from plugins.credentials import CredentialService, MANAGEMENT_SCOPE
+from plugins.kusto import KustoQueryExecutor
+from plugins.metrics import VmMetricsClient
+
+
+class FakeCredential:
+    def __init__(self):
+        self.acquisitions = 0
+        self.closed = False
+
+    async def get_token_info(self, *scopes, options=None):
+        if self.closed:
+            raise RuntimeError("credential is closed")
+        self.acquisitions += 1
+        return AccessTokenInfo(f"token-{self.acquisitions}", int(time.time()) + 3600)
+
+    async def close(self):
+        self.closed = True
+
+
+def test_closing_the_kusto_executor_leaves_the_shared_credential_open():
+    async def run():
+        credential = FakeCredential()
+        service = CredentialService(credential)
+        executor = KustoQueryExecutor("https://cluster.kusto.windows.net", "Hub", credential=service)
+        executor._get_async_client()
+
+        await executor.aclose()
+        executor.close()
+
+        assert not credential.closed
+        assert (await service.get_token(MANAGEMENT_SCOPE)).token == "token-1"
+        await service.close()
+        assert credential.closed
+
+    asyncio.run(run())
+
+
+def test_vm_metrics_client_uses_the_service_token_cache():
+    async def run():
+        credential = FakeCredential()
+        service = CredentialService(credential)
+        client = VmMetricsClient(credential=service)
+
+        tokens = [await client._get_token() for _ in range(3)]
+        await client.aclose()
+
+        assert tokens == ["token-1"] * 3
+        assert credential.acquisitions == 1
+        assert service.stats()[MANAGEMENT_SCOPE]["hits"] == 2
+        assert not credential.closed
+        await service.close()
+
+    asyncio.run(run())
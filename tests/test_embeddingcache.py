@@ -0,0 +1,71 @@
+import asyncio
+import threading
+from plugins.embeddingcache import EmbeddingCache
+
+
+class RecordingConnection:
+    """Records the threads the SQLite connection is used on."""
+
+    def __init__(self, db):
+        self.db = db
+        self.threads = set()
+
+    def __getattr__(self, name):
+        self.threads.add(threading.get_ident())
+        return getattr(self.db, name)
+
+
+def test_disk_tier_is_used_off_the_event_loop_and_survives_reopening(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+
+    async def write():
+        cache = EmbeddingCache(max_entries=1, path=path)
+        cache.db = RecordingConnection(cache.db)
+        await cache.put_many({"a": [1.0, 2.0], "b": [3.0, 4.0]})
+        assert await cache.get_many(["a", "b", "c"]) == [[1.0, 2.0], [3.0, 4.0], None]
+        stats = cache.stats()
+        cache.db = cache.db.db
+        cache.close()
+        return stats
+
+    stats = asyncio.run(write())
+    assert (stats["hits"], stats["disk_hits"], stats["misses"], stats["disk_entries"]) == (1, 1, 1, 2)
+
+    async def read():
+        reopened = EmbeddingCache(path=path)
+        vectors = await reopened.get_many(["b", "a"])
+        reopened.close()
+        return vectors
+
+    assert asyncio.run(read()) == [[3.0, 4.0], [1.0, 2.0]]
+
+
+def test_sqlite_is_not_called_on_the_event_loop_thread(tmp_path):
+    async def run():
+        cache = EmbeddingCache(max_entries=1, path=str(tmp_path / "embeddings.sqlite"))
+        recorder = cache.db = RecordingConnection(cache.db)
+        await cache.put_many({"a": [1.0], "b": [2.0]})
+        await cache.get_many(["a"])
+        cache.db = recorder.db
+        cache.close()
+        return recorder.threads
+
+    threads = asyncio.run(run())
+    assert threads and threading.get_ident() not in threads
+
+
+def test_least_recently_used_disk_entries_are_evicted(tmp_path):
+    async def run():
+        cache = EmbeddingCache(max_entries=1, path=str(tmp_path / "embeddings.sqlite"), max_disk_entries=2)
+        await cache.put_many({"a": [1.0]})
+        await cache.put_many({"b": [2.0]})
+        await cache.get_many(["a"])
+        await cache.put_many({"c": [3.0]})
+        cache.memory.clear()
+        vectors = await cache.get_many(["a", "b", "c"])
+        cache.close()
+        return vectors, cache.disk_entries
+
+    vectors, entries = asyncio.run(run())
+    assert vectors == [[1.0], None, [3.0]]
+    assert entries == 2
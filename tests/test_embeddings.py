@@ -0,0 +1,73 @@
+import asyncio
+from plugins.embeddingcache import EmbeddingCache
+from plugins.embeddings import EmbeddingsClient
+
+
+def _client(**kwargs) -> tuple[EmbeddingsClient, list]:
+    client = EmbeddingsClient("https://example.openai.azure.com", "embeddings", api_key="key", **kwargs)
+    requests = []
+
+    async def request(texts):
+        requests.append(list(texts))
+        await asyncio.sleep(0)
+        return [[float(len(t)), 1.0] for t in texts]
+
+    client._request = request
+    return client, requests
+
+
+def test_concurrent_texts_are_sent_in_one_request_without_duplicates():
+    client, requests = _client(batch_size=16, batch_linger_ms=20)
+
+    async def run():
+        return await asyncio.gather(
+            client.get_embedding("cost"),
+            client.get_embedding(["savings", "cost"]),
+            client.get_embedding("reservations"),
+        )
+
+    results = asyncio.run(run())
+    assert requests == [["cost", "savings", "reservations"]]
+    assert results == [[[4.0, 1.0]], [[7.0, 1.0], [4.0, 1.0]], [[12.0, 1.0]]]
+
+
+def test_full_batches_are_sent_without_waiting_for_the_linger():
+    client, requests = _client(batch_size=2, batch_linger_ms=60000)
+
+    async def run():
+        return await asyncio.wait_for(client.get_embedding(["a", "bb", "ccc", "dddd"]), 5)
+
+    vectors = asyncio.run(run())
+    assert requests == [["a", "bb"], ["ccc", "dddd"]]
+    assert [v[0] for v in vectors] == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_request_errors_reach_every_caller_of_the_batch():
+    client, _ = _client(batch_size=8, batch_linger_ms=5)
+
+    async def failing(texts):
+        raise RuntimeError("throttled")
+
+    client._request = failing
+
+    async def run():
+        return await asyncio.gather(client.get_embedding("a"), client.get_embedding("b"), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_cached_texts_are_not_requested_again(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "embeddings.db"))
+    client, requests = _client(cache=cache)
+
+    async def run():
+        first = await client.get_embedding(["cost", "cost", "savings"])
+        second = await client.get_embedding(["savings", "budget"])
+        await client.aclose()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert requests == [["cost", "savings"], ["budget"]]
+    assert first[0] == first[1] == [4.0, 1.0]
+    assert second == [[7.0, 1.0], [6.0, 1.0]]
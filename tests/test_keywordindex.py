@@ -0,0 +1,27 @@
+import pytest
+from plugins.keywordindex import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_identifiers_are_split_into_their_parts():
+    assert tokenize("EffectiveCost by x_id") == ["effectivecost", "effective", "cost", "by", "x_id", "x", "id"]
+
+
+def test_reciprocal_rank_fusion_favours_documents_ranked_well_by_both():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [2, 3, 4]], k=60)
+    assert [position for position, _ in fused] == [2, 3, 1, 4]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[2][1] == pytest.approx(1 / 61)
+
+
+def test_bm25_ranks_documents_with_rarer_terms_first_and_skips_non_matches():
+    index = BM25Index([
+        "monthly cost by service",
+        "reservation savings by service",
+        "EffectiveCost trend",
+        "unrelated text",
+    ])
+    results = index.search("effective cost by service", limit=10)
+    assert [position for position, _ in results] == [0, 2, 1]
+    assert all(score > 0 for _, score in results)
+    assert index.search("effective cost by service", limit=1) == results[:1]
+    assert index.search("cost", limit=0) == []
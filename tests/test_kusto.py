@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from azure.kusto.data.exceptions import KustoStreamingQueryError
+from plugins.kusto import KustoQueryExecutor
+from plugins.resultcache import QueryResultCache
+
+COLUMNS = [SimpleNamespace(column_name="Cost", column_type="real")]
+
+
+class FakeResponse:
+    def __init__(self, tables):
+        self.tables = tables
+
+    async def _primary(self):
+        for table in self.tables:
+            yield table
+
+    def iter_primary_results(self):
+        return self._primary()
+
+
+def _table(rows: int, stall_after: int = None):
+    async def raw_rows():
+        for i in range(rows):
+            if i == stall_after:
+                await asyncio.sleep(60)
+            yield [float(i)]
+    return SimpleNamespace(columns=COLUMNS, raw_rows=raw_rows())
+
+
+def _executor(response: FakeResponse, **kwargs) -> KustoQueryExecutor:
+    executor = KustoQueryExecutor("https://cluster.kusto.windows.net", "Hub", max_concurrency=1, **kwargs)
+
+    async def execute_streaming_query(database, query, timeout, properties):
+        return response
+    executor._async_client = SimpleNamespace(execute_streaming_query=execute_streaming_query)
+    executor.watermark_interval = float("inf")
+    return executor
+
+
+async def _collect(executor: KustoQueryExecutor, **kwargs) -> list:
+    return [chunk async for chunk in executor.stream_query_async("Costs", **kwargs)]
+
+
+def test_rows_are_streamed_in_chunks():
+    executor = _executor(FakeResponse([_table(5)]))
+    chunks = asyncio.run(_collect(executor, batch_size=2))
+
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    assert list(chunks[-1]["Cost"]) == [4.0]
+
+
+def test_empty_result_yields_one_empty_chunk():
+    executor = _executor(FakeResponse([_table(0)]))
+
+    assert [len(c) for c in asyncio.run(_collect(executor))] == [0]
+
+
+def test_stalled_stream_times_out_and_releases_its_slot():
+    executor = _executor(FakeResponse([_table(10, stall_after=3)]))
+
+    async def run():
+        task = asyncio.create_task(_collect(executor, batch_size=2, timeout=0.2))
+        done, _ = await asyncio.wait({task}, timeout=5)
+        assert task in done
+        with pytest.raises(TimeoutError):
+            task.result()
+        return executor._semaphore.locked()
+
+    assert asyncio.run(run()) is False
+
+
+def test_missing_primary_result_raises_an_explicit_error():
+    executor = _executor(FakeResponse([]))
+
+    with pytest.raises(KustoStreamingQueryError):
+        asyncio.run(_collect(executor))
+
+
+def test_last_chunk_counts_against_the_cache_budget():
+    one_chunk = int(KustoQueryExecutor._frame_from_rows(COLUMNS, [[0.0]] * 4).memory_usage(deep=True).sum())
+    cache = QueryResultCache(max_bytes=one_chunk + one_chunk // 2)
+    executor = _executor(FakeResponse([_table(6)]), result_cache=cache)
+
+    async def run():
+        await _collect(executor, batch_size=4)
+        return cache.stats()["entries"]
+
+    assert asyncio.run(run()) == 0
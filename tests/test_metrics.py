@@ -0,0 +1,29 @@
+import asyncio
+from types import SimpleNamespace
+from plugins.metrics import VmMetricsClient
+
+
+def _response(*values) -> dict:
+    data = [{"timeStamp": f"2024-01-01T0{i}:00:00Z", **({"maximum": v} if v is not None else {})}
+            for i, v in enumerate(values)]
+    return {"value": [{"name": {"value": "Percentage CPU"}, "timeseries": [{"data": data}] if data else []}]}
+
+
+def test_vms_without_values_are_reported_separately_from_errors():
+    responses = {
+        "/vm/running": _response(12.5, 40.0),
+        "/vm/deallocated": _response(None, None),
+        "/vm/new": _response(),
+        "/vm/missing": {"error": {"message": "ResourceNotFound"}},
+    }
+    client = VmMetricsClient(credential=SimpleNamespace())
+
+    async def get_metrics(resource_id, *args):
+        return responses[resource_id]
+
+    client._get_metrics = get_metrics
+    result = asyncio.run(client.get_vm_metrics_batch(list(responses)))
+
+    assert result["no_data"] == ["/vm/deallocated", "/vm/new"]
+    assert result["errors"] == {"/vm/missing": "ResourceNotFound"}
+    assert [row[3] for row in result["rows"] if row[0] == "/vm/running"] == [12.5, 40.0]
@@ -0,0 +1,71 @@
+import json
+import os
+import numpy as np
+from plugins.querylibrary import QueryLibrary, vectors_digest, vectors_path
+
+
+def _library(count: int, dimensions: int, seed: int) -> QueryLibrary:
+    rng = np.random.default_rng(seed)
+    return QueryLibrary.from_entries(
+        {"title": f"Query {seed}-{i}", "description": "", "query": f"Costs | take {i}", "vector": rng.normal(size=dimensions)}
+        for i in range(count)
+    )
+
+
+def test_save_replaces_library_loaded_with_mmap(tmp_path):
+    path = str(tmp_path / "library.json")
+    _library(500, 64, seed=1).save(path)
+    loaded = QueryLibrary.load(path)
+    before = np.array(loaded.vectors)
+
+    # a smaller library, truncating the mapped file in place would fault the reader
+    _library(10, 64, seed=2).save(path)
+
+    assert np.array_equal(np.asarray(loaded.vectors), before)
+    assert loaded.scores(loaded.vector(0))[0] > 0.99
+
+    reloaded = QueryLibrary.load(path)
+    assert len(reloaded) == 10
+    assert reloaded.entries[0]["title"] == "Query 2-0"
+    assert reloaded.vectors.shape == (10, 64)
+
+
+def test_save_leaves_only_the_current_vector_file(tmp_path):
+    path = str(tmp_path / "library.json")
+    _library(3, 8, seed=3).save(path)
+    library = _library(3, 8, seed=4)
+    library.save(path)
+
+    digest = vectors_digest(library.vectors)
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(["library.json", f"library.{digest}.npy"])
+    assert vectors_path(path, digest) == str(tmp_path / f"library.{digest}.npy")
+
+
+def test_old_metadata_is_never_paired_with_new_vectors(tmp_path):
+    path = str(tmp_path / "library.json")
+    _library(5, 8, seed=5).save(path)
+    with open(path, 'rb') as f:
+        old_metadata = f.read()
+
+    # a reader between the two renames: new vectors written, metadata not yet replaced
+    new = _library(5, 8, seed=6)
+    np.save(vectors_path(path, vectors_digest(new.vectors)), new.vectors)
+    loaded = QueryLibrary.load(path)
+
+    assert loaded.entries[0]["title"] == "Query 5-0"
+    assert np.allclose(loaded.vector(0), _library(5, 8, seed=5).vector(0))
+    with open(path, 'rb') as f:
+        assert f.read() == old_metadata
+
+
+def test_libraries_without_digest_are_still_loaded(tmp_path):
+    path = str(tmp_path / "library.json")
+    library = _library(4, 8, seed=7)
+    library.save(path)
+    with open(path, encoding='utf-8') as f:
+        metadata = json.load(f)
+    os.rename(vectors_path(path, metadata.pop("vectors_digest")), vectors_path(path))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f)
+
+    assert np.array_equal(QueryLibrary.load(path).vectors, library.vectors)
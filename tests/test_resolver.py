@@ -0,0 +1,37 @@
+import pytest
+from plugins.resolver import QueryResolver
+
+
+def _dashboard(base: dict, used: dict, tiles: dict = None) -> dict:
+    # base: variable -> text, used: variable or tile -> variables it uses
+    queries = [{"id": f"q-{v}", "text": t, "usedVariables": used.get(v, [])} for v, t in base.items()]
+    queries += [{"id": tile, "text": t, "usedVariables": used.get(tile, [])} for tile, t in (tiles or {}).items()]
+    return {
+        "queries": queries,
+        "baseQueries": [{"variableName": v, "queryId": f"q-{v}"} for v in base],
+    }
+
+
+def test_queries_are_prefixed_with_their_dependencies_in_order():
+    resolver = QueryResolver.from_dashboard(_dashboard(
+        base={"Costs": "Raw | where x", "Monthly": "Costs | summarize by month", "Prices": "PriceSheet"},
+        used={"Monthly": ["Costs", "_startTime"], "tile": ["Monthly"]},
+        tiles={"tile": "Monthly | render columnchart"},
+    ))
+
+    assert resolver.resolve("tile") == (
+        "let Costs = Raw | where x;\n"
+        "let Monthly = Costs | summarize by month;\n"
+        "Monthly | render columnchart"
+    )
+    assert resolver.resolve("unknown") == ""
+
+
+def test_cyclic_base_queries_are_rejected():
+    dashboard = _dashboard(
+        base={"A": "B | take 1", "B": "C", "C": "A", "D": "Raw"},
+        used={"A": ["B"], "B": ["C"], "C": ["A"]},
+    )
+
+    with pytest.raises(ValueError, match="cyclic dependencies: A, B, C"):
+        QueryResolver.from_dashboard(dashboard)
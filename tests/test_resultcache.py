@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import pandas as pd
+from plugins.resultcache import QueryResultCache
+
+
+def _frame(rows: int) -> pd.DataFrame:
+    return pd.DataFrame({"ServiceName": [f"service-{i}" for i in range(rows)], "Cost": [float(i) for i in range(rows)]})
+
+
+def test_spilled_results_are_written_and_read_off_the_event_loop(tmp_path, monkeypatch):
+    threads = set()
+    to_parquet, read_parquet = pd.DataFrame.to_parquet, pd.read_parquet
+
+    def recording_to_parquet(df, *args, **kwargs):
+        threads.add(threading.get_ident())
+        return to_parquet(df, *args, **kwargs)
+
+    def recording_read_parquet(*args, **kwargs):
+        threads.add(threading.get_ident())
+        return read_parquet(*args, **kwargs)
+
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", recording_to_parquet)
+    monkeypatch.setattr(pd, "read_parquet", recording_read_parquet)
+
+    async def run():
+        cache = QueryResultCache(max_bytes=int(_frame(100).memory_usage(deep=True).sum()) + 1, spill_dir=str(tmp_path))
+        await cache.put("a", _frame(100))
+        await cache.put("b", _frame(100))
+        assert cache.stats()["spilled_entries"] == 1
+        df = await cache.get("a")
+        return df, cache.stats()
+
+    df, stats = asyncio.run(run())
+    assert df.equals(_frame(100))
+    assert stats["spill_hits"] == 1
+    # the write and the read may run on the same worker thread
+    assert threads and threading.get_ident() not in threads
+
+
+def test_results_of_queries_started_before_an_invalidation_are_not_stored():
+    async def run():
+        cache = QueryResultCache()
+        cache.update_watermark("2024-01-01")
+        generation = cache.generation
+        cache.update_watermark("2024-01-02")
+        await cache.put("a", _frame(3), generation)
+        await cache.put("b", _frame(3), cache.generation)
+        return await cache.get("a"), await cache.get("b")
+
+    stale, fresh = asyncio.run(run())
+    assert stale is None
+    assert fresh is not None
+
+
+def test_cache_hits_do_not_wait_for_the_watermark_query():
+    from plugins.kusto import KustoQueryExecutor
+
+    async def run():
+        cache = QueryResultCache()
+        executor = KustoQueryExecutor("https://cluster.kusto.windows.net", "Hub", result_cache=cache)
+        watermark_started = asyncio.Event()
+
+        async def slow_execute(management, command, database=None, timeout=None):
+            watermark_started.set()
+            await asyncio.sleep(60)
+
+        executor._execute_async = slow_execute
+        await cache.put(QueryResultCache.key("Hub", "Costs | take 3"), _frame(3))
+
+        df = await asyncio.wait_for(executor.execute_query_async("Costs | take 3"), 1)
+        await asyncio.wait_for(watermark_started.wait(), 1)
+        await executor.aclose()
+        executor.close()
+        return df
+
+    assert len(asyncio.run(run())) == 3
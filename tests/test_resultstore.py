@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+import threading
+from types import SimpleNamespace
+import pytest
+from plugins.kusto import KustoQueryExecutor
+from plugins.resultstore import ResultStore
+
+COLUMNS = [
+    SimpleNamespace(column_name="ResourceId", column_type="string"),
+    SimpleNamespace(column_name="Tags", column_type="dynamic"),
+    SimpleNamespace(column_name="Cost", column_type="real"),
+    SimpleNamespace(column_name="Quantity", column_type="long"),
+    SimpleNamespace(column_name="ChargePeriodStart", column_type="datetime"),
+]
+
+
+def _stream(batches):
+    async def chunks():
+        for rows in batches:
+            yield KustoQueryExecutor._frame_from_rows(COLUMNS, rows)
+    return chunks()
+
+
+def _store(tmp_path) -> ResultStore:
+    return ResultStore(str(tmp_path), threshold=2, page_size=2)
+
+
+def _all_rows(store: ResultStore, handle: str) -> list:
+    return store.fetch(handle, page_size=100)["rows"]
+
+
+def test_dynamic_keys_appearing_in_later_chunks_are_kept(tmp_path):
+    store = _store(tmp_path)
+    batches = [
+        [["a", {"env": "prod"}, 1.0, 1, "2024-01-01T00:00:00Z"], ["b", {"env": "dev"}, 2.0, 2, "2024-01-02T00:00:00Z"]],
+        [["c", {"env": "prod", "owner": "finops"}, 3.0, 3, "2024-01-03T00:00:00Z"], ["d", [1, 2], 4.0, 4, None]],
+    ]
+    result = asyncio.run(store.store_stream(_stream(batches)))
+
+    rows = _all_rows(store, result["handle"])
+    assert [json.loads(r["Tags"]) for r in rows] == [{"env": "prod"}, {"env": "dev"}, {"env": "prod", "owner": "finops"}, [1, 2]]
+    assert {c["name"]: c["type"] for c in result["columns"]}["Tags"] == "string"
+
+
+def test_columns_null_in_the_first_chunks_keep_their_declared_type(tmp_path):
+    store = _store(tmp_path)
+    batches = [
+        [["a", None, None, None, None], ["b", None, None, None, None], ["c", None, None, None, None]],
+        [["d", {"env": "prod"}, 1.5, 7, "2024-01-01T00:00:00Z"]],
+    ]
+    result = asyncio.run(store.store_stream(_stream(batches)))
+
+    types = {c["name"]: c["type"] for c in result["columns"]}
+    assert types == {
+        "ResourceId": "string",
+        "Tags": "string",
+        "Cost": "double",
+        "Quantity": "int64",
+        "ChargePeriodStart": "timestamp[ns, tz=UTC]",
+    }
+    last = _all_rows(store, result["handle"])[-1]
+    assert (last["Cost"], last["Quantity"], json.loads(last["Tags"])) == (1.5, 7, {"env": "prod"})
+    assert last["ChargePeriodStart"].startswith("2024-01-01T00:00:00")
+
+
+def test_close_removes_only_the_store_own_files(tmp_path):
+    (tmp_path / "notes.txt").write_text("keep")
+    first, second = _store(tmp_path), _store(tmp_path)
+    handle = second.store(KustoQueryExecutor._frame_from_rows(COLUMNS, [["a", None, 1.0, 1, None]] * 3))["handle"]
+
+    first.close()
+
+    assert (tmp_path / "notes.txt").read_text() == "keep"
+    assert len(second.fetch(handle)["rows"]) == 2
+    second.close()
+    assert [p.name for p in tmp_path.iterdir()] == ["notes.txt"]
+
+
+def test_page_size_is_clamped(tmp_path):
+    store = ResultStore(str(tmp_path), threshold=2, page_size=2, max_page_size=5)
+    handle = store.store(KustoQueryExecutor._frame_from_rows(COLUMNS, [["a", None, 1.0, 1, None]] * 20))["handle"]
+
+    page = store.fetch(handle, page_size=1000)
+    assert len(page["rows"]) == 5
+    assert page["next_cursor"] == "5"
+    assert len(store.fetch(handle, page_size=-3)["rows"]) == 1
+
+
+def test_handle_discarded_while_a_page_is_read_keeps_its_file_until_the_read_ends(tmp_path):
+    store = _store(tmp_path)
+    handle = store.store(KustoQueryExecutor._frame_from_rows(COLUMNS, [["a", None, 1.0, 1, None]] * 5))["handle"]
+    path = store.handles[handle]["path"]
+    reading, discarded = threading.Event(), threading.Event()
+    read_rows = store._read_rows
+
+    def slow_read_rows(*args):
+        reading.set()
+        discarded.wait(5)
+        return read_rows(*args)
+
+    store._read_rows = slow_read_rows
+
+    async def run():
+        fetch = asyncio.create_task(asyncio.to_thread(store.fetch, handle))
+        await asyncio.to_thread(reading.wait, 5)
+        store.discard(handle)
+        file_kept = os.path.exists(path)
+        discarded.set()
+        return file_kept, await fetch
+
+    file_kept, page = asyncio.run(run())
+    assert file_kept
+    assert len(page["rows"]) == 2
+    assert not os.path.exists(path)
+
+
+def test_chunk_stream_is_closed_when_storing_fails(tmp_path):
+    store = _store(tmp_path)
+    closed = []
+
+    async def chunks():
+        try:
+            yield KustoQueryExecutor._frame_from_rows(COLUMNS, [["a", None, 1.0, 1, None]] * 3)
+            frame = KustoQueryExecutor._frame_from_rows(COLUMNS, [["b", None, 1.0, 1, None]])
+            frame["Cost"] = frame["Cost"].astype(object)
+            frame.loc[0, "Cost"] = "not a number"
+            yield frame
+            yield KustoQueryExecutor._frame_from_rows(COLUMNS, [["c", None, 1.0, 1, None]])
+        finally:
+            closed.append(True)
+
+    async def run():
+        with pytest.raises(Exception):
+            await store.store_stream(chunks())
+        return list(closed)
+
+    assert asyncio.run(run()) == [True]
+    assert os.listdir(store.directory) == []
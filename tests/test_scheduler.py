@@ -0,0 +1,116 @@
+import asyncio
+from plugins.scheduler import EXPORT, INTERACTIVE, QueryScheduler, analyze_kql, cap_rows
+
+
+def test_cap_is_placed_before_trailing_render():
+    query = "Costs\n| where ChargePeriodStart >= ago(30d)\n| project ChargePeriodStart, EffectiveCost\n| render timechart"
+    plan = QueryScheduler(row_cap=500).plan(query)
+
+    assert plan.capped
+    assert plan.query.endswith("| take 500\n| render timechart")
+
+
+def test_cap_before_render_keeps_trailing_comment_out():
+    query = "Costs | project x // all rows\n| render columnchart with (title='| render')"
+
+    assert cap_rows(query, 10) == "Costs | project x // all rows\n| take 10\n| render columnchart with (title='| render')"
+
+
+def test_aggregated_query_is_not_capped():
+    for query in (
+        "Costs | where ChargePeriodStart >= ago(30d) | summarize sum(EffectiveCost) by ServiceName",
+        "Costs | summarize sum(EffectiveCost) by bin(ChargePeriodStart, 1d)\n| render timechart",
+        "Costs | count",
+    ):
+        plan = QueryScheduler().plan(query)
+        assert plan.aggregated
+        assert not plan.capped
+        assert plan.query == query
+
+
+def test_take_in_subquery_is_not_the_outer_limit():
+    query = "Costs\n| join kind=inner (Prices | take 5) on SkuId\n| union (Usage | limit 10)"
+    analysis = analyze_kql(query)
+
+    assert analysis["row_limit"] is None
+    assert not analysis["aggregated"]
+    plan = QueryScheduler(row_cap=1000).plan(query)
+    assert plan.capped
+    assert plan.query.endswith("\n| take 1000")
+
+
+def test_summarize_in_subquery_does_not_aggregate_outer_query():
+    query = "Costs | join (Prices | summarize max(Price) by SkuId) on SkuId"
+
+    assert not analyze_kql(query)["aggregated"]
+
+
+def test_top_level_take_after_subquery_is_used():
+    query = "let prices = Prices | take 3;\nCosts | join (prices) on SkuId | take 20"
+
+    assert analyze_kql(query)["row_limit"] == 20
+    assert not QueryScheduler().plan(query).capped
+
+
+async def _run_in_order(scheduler: QueryScheduler, queries: list, age_exports: float = 0.0) -> list:
+    """
+    Holds the only slot while the queries (client, priority, name) queue up,
+    then returns the order in which they were started.
+    """
+    started = []
+    release = asyncio.Event()
+
+    async def query(client_id, priority, name):
+        async with scheduler.slot(client_id, priority):
+            started.append(name)
+            await release.wait()
+
+    async with scheduler.slot("holder"):
+        tasks = [asyncio.create_task(query(*q)) for q in queries]
+        await asyncio.sleep(0)
+        for waiter in scheduler._waiting:
+            if waiter.priority == EXPORT:
+                waiter.enqueued -= age_exports
+    release.set()
+    await asyncio.gather(*tasks)
+    return started
+
+
+def test_interactive_queries_start_before_waiting_exports():
+    queries = [("a", EXPORT, "export"), ("b", INTERACTIVE, "first"), ("c", INTERACTIVE, "second")]
+    started = asyncio.run(_run_in_order(QueryScheduler(max_concurrency=1), queries))
+
+    assert started == ["first", "second", "export"]
+
+
+def test_exports_waiting_past_aging_are_not_starved():
+    queries = [("a", EXPORT, "export"), ("b", INTERACTIVE, "interactive")]
+    started = asyncio.run(_run_in_order(QueryScheduler(max_concurrency=1, aging_seconds=30), queries, age_exports=60))
+
+    assert started == ["export", "interactive"]
+
+
+def test_per_client_limit_lets_other_clients_through():
+    async def run():
+        scheduler = QueryScheduler(max_concurrency=2, per_client_concurrency=1)
+        started = []
+        release = asyncio.Event()
+
+        async def query(client_id, name):
+            async with scheduler.slot(client_id):
+                started.append(name)
+                await release.wait()
+
+        tasks = [asyncio.create_task(query(c, n)) for c, n in (("a", "a1"), ("a", "a2"), ("b", "b1"))]
+        await asyncio.sleep(0.01)
+        running = list(started)
+        stats = scheduler.stats()
+        release.set()
+        await asyncio.gather(*tasks)
+        return running, stats, started
+
+    running, stats, started = asyncio.run(run())
+    assert running == ["a1", "b1"]
+    assert stats["running_per_client"] == {"a": 1, "b": 1}
+    assert stats["waiting"][INTERACTIVE] == 1
+    assert started == ["a1", "b1", "a2"]
@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from plugins.singleflight import SingleFlight
+
+
+def test_concurrent_calls_with_the_same_key_share_one_call():
+    calls = []
+
+    async def run():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def call():
+            calls.append(1)
+            await release.wait()
+            return "result"
+
+        waiters = [asyncio.create_task(flight.do(("q", 1), call)) for _ in range(3)]
+        other = asyncio.create_task(flight.do(("q", 2), call))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*waiters, other), flight.stats()
+
+    results, stats = asyncio.run(run())
+    assert results == ["result"] * 4
+    assert len(calls) == 2
+    assert stats["calls"] == 2 and stats["coalesced"] == 2 and stats["in_flight"] == 0
+
+
+def test_call_is_cancelled_only_when_its_last_waiter_is():
+    async def run():
+        flight = SingleFlight("test")
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def call():
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        first = asyncio.create_task(flight.do("q", call))
+        second = asyncio.create_task(flight.do("q", call))
+        await started.wait()
+
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled.is_set() and flight.in_flight == 1
+
+        second.cancel()
+        await asyncio.wait_for(cancelled.wait(), 5)
+        for task in (first, second):
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        return flight.stats()
+
+    stats = asyncio.run(run())
+    assert stats["cancelled"] == 1 and stats["in_flight"] == 0
+
+
+def test_errors_are_raised_to_every_caller_of_the_flight():
+    async def run():
+        flight = SingleFlight("test")
+
+        async def call():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("backend failed")
+
+        results = await asyncio.gather(*[flight.do("q", call) for _ in range(3)], return_exceptions=True)
+        return results, flight.stats()
+
+    results, stats = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert stats["errors"] == 1 and stats["calls"] == 1
@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+from weaviate.exceptions import WeaviateQueryError
+from plugins.weaviate import QueryLibraryPlugin
+
+
+class FakeClient:
+    def __init__(self):
+        self.exists_calls = 0
+        self.alias_calls = 0
+        self.collection_exists = True
+        self.fail_query = False
+        self.collections = SimpleNamespace(exists=self._exists, get=lambda name: SimpleNamespace(
+            query=SimpleNamespace(near_vector=self._near_vector)))
+        self.alias = SimpleNamespace(get=self._alias)
+
+    async def _exists(self, name):
+        self.exists_calls += 1
+        return self.collection_exists
+
+    async def _alias(self, alias_name):
+        self.alias_calls += 1
+        return None
+
+    async def _near_vector(self, **kwargs):
+        if self.fail_query:
+            raise WeaviateQueryError("could not find class", "gRPC")
+        return SimpleNamespace(objects=[])
+
+
+def _plugin(client: FakeClient) -> QueryLibraryPlugin:
+    plugin = QueryLibraryPlugin(embeddings_client=None)
+
+    async def get_client():
+        return client
+    plugin._get_client = get_client
+    return plugin
+
+
+def test_collection_is_resolved_once():
+    client = FakeClient()
+    plugin = _plugin(client)
+
+    async def run():
+        return [await plugin._search([0.0]) for _ in range(5)]
+
+    assert all(r is not None for r in asyncio.run(run()))
+    assert (client.exists_calls, client.alias_calls) == (1, 0)
+
+
+def test_collection_is_resolved_again_when_a_query_fails():
+    client = FakeClient()
+    plugin = _plugin(client)
+
+    async def run():
+        await plugin._search([0.0])
+        client.collection_exists = False
+        client.fail_query = True
+        missing = await plugin._search([0.0])
+        client.collection_exists = True
+        client.fail_query = False
+        found = await plugin._search([0.0])
+        return missing, found
+
+    missing, found = asyncio.run(run())
+    assert missing is None
+    assert found is not None
+    assert client.exists_calls == 3